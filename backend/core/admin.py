@@ -1,12 +1,12 @@
 from django.contrib import admin
-from .models import Account, Transaction, PlaidItem # Add PlaidItem to the import
+from .models import Account, Transaction, PlaidItem, MerchantCategoryCache
 
 # Register the new PlaidItem model
 @admin.register(PlaidItem)
 class PlaidItemAdmin(admin.ModelAdmin):
     """Admin options for the PlaidItem model."""
     # Customize which fields are displayed in the admin list view
-    list_display = ('user', 'institution_name', 'item_id', 'created_at')
+    list_display = ('user', 'institution_name', 'item_id', 'last_synced_at', 'next_sync_at', 'sync_failures', 'created_at')
     # Add filters for easier navigation
     list_filter = ('user', 'institution_name')
     # Add a search bar
@@ -24,4 +24,10 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ('date', 'account', 'name', 'amount', 'category')
     list_filter = ('account__plaid_item__user', 'account', 'date')
     search_fields = ('name', 'account__plaid_item__user__username', 'account__name')
-    date_hierarchy = 'date'
\ No newline at end of file
+    date_hierarchy = 'date'
+
+@admin.register(MerchantCategoryCache)
+class MerchantCategoryCacheAdmin(admin.ModelAdmin):
+    list_display = ('normalized_name', 'category', 'model_version', 'hits', 'last_used_at')
+    list_filter = ('model_version', 'category')
+    search_fields = ('normalized_name',)
\ No newline at end of file
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from .authentication import forget_principal
+        from .metrics import install_query_wrapper
+        # Every database connection reports its queries to the request metrics.
+        connection_created.connect(install_query_wrapper)
+        # A changed or deleted user must not stay authenticated from the principal cache.
+        post_save.connect(forget_principal, sender=get_user_model())
+        post_delete.connect(forget_principal, sender=get_user_model())
@@ -0,0 +1,126 @@
+# backend/core/async_plaid.py
+"""
+An asyncio Plaid client for the async views (core/async_views.py).
+
+plaid-python only speaks blocking urllib3, so this posts the same JSON to the
+same endpoints with httpx.AsyncClient instead. While a call is waiting on
+Plaid the event loop keeps serving other requests, and one ASGI worker can
+have hundreds of calls outstanding (PLAID_ASYNC_MAX_CONNECTIONS).
+
+It shares the sync client's settings: host, timeouts, retries with jittered
+backoff on 429/5xx and failed connects, the rate limiter and the Plaid
+metrics. Responses are plain dicts, errors are plaid's ApiException with the
+usual status and JSON body, so callers handle both clients the same way.
+
+Without httpx, or with PLAID_ENV=fake, calls go to get_plaid_client() on a
+thread instead - still non-blocking for the event loop, just not as cheap.
+"""
+import asyncio
+import json
+import random
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from plaid.exceptions import ApiException
+
+from . import metrics, rate_limits
+from .plaid_client import RETRY_STATUSES, get_plaid_client, plaid_host
+
+try:
+    import httpx
+except ImportError:  # optional: falls back to the sync client on a thread
+    httpx = None
+
+# The plaid_api.PlaidApi methods this client offers, and their paths.
+ENDPOINTS = {
+    'accounts_get': '/accounts/get',
+    'categories_get': '/categories/get',
+    'item_public_token_exchange': '/item/public_token/exchange',
+    'link_token_create': '/link/token/create',
+    'transactions_sync': '/transactions/sync',
+    'webhook_verification_key_get': '/webhook_verification_key/get',
+}
+PLAID_VERSION = '2020-09-14'
+
+# One httpx client per event loop; a client can't be used from another loop.
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def http_client():
+    loop = asyncio.get_running_loop()
+    if loop not in _http_clients:
+        _http_clients[loop] = httpx.AsyncClient(
+            base_url=plaid_host(),
+            timeout=httpx.Timeout(settings.PLAID_READ_TIMEOUT_SECONDS, connect=settings.PLAID_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.PLAID_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PLAID_ASYNC_MAX_CONNECTIONS,
+            ),
+            headers={
+                'PLAID-CLIENT-ID': settings.PLAID_CLIENT_ID or '',
+                'PLAID-SECRET': settings.PLAID_SANDBOX_SECRET or '',
+                'Plaid-Version': PLAID_VERSION,
+            },
+        )
+    return _http_clients[loop]
+
+
+def retry_delay(attempt, response=None):
+    """Jittered exponential backoff like the sync client's, or the server's Retry-After."""
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), settings.PLAID_RETRY_BACKOFF_MAX_SECONDS)
+    base = settings.PLAID_RETRY_BACKOFF_SECONDS
+    return min(base * 2 ** attempt, settings.PLAID_RETRY_BACKOFF_MAX_SECONDS) + random.uniform(0, base)
+
+
+class AsyncPlaidClient:
+    """
+    ``await client.accounts_get({'access_token': ...})`` and so on, for the
+    endpoints in ENDPOINTS. Requests are dicts, as with the sync client.
+    """
+    def __getattr__(self, name):
+        if name not in ENDPOINTS:
+            raise AttributeError(name)
+
+        async def call(request):
+            return await self.call(name, request)
+        return call
+
+    async def call(self, name, request):
+        if httpx is None or settings.PLAID_ENV == 'fake':
+            # The sync client waits for the rate limiter itself.
+            response = await sync_to_async(getattr(get_plaid_client(), name), thread_sensitive=False)(request)
+            return response.to_dict()
+
+        await rate_limits.aacquire(request.get('access_token'))
+        with metrics.observe_plaid_call(ENDPOINTS[name]):
+            return await self.post(name, request)
+
+    async def post(self, name, request):
+        for attempt in range(settings.PLAID_MAX_RETRIES + 1):
+            retries_left = attempt < settings.PLAID_MAX_RETRIES
+            try:
+                response = await http_client().post(ENDPOINTS[name], json=request)
+            except httpx.ConnectError:
+                # Nothing reached Plaid, so this is always safe to retry.
+                if not retries_left:
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and retries_left:
+                await asyncio.sleep(retry_delay(attempt, response))
+                continue
+            break
+
+        if not response.is_success:
+            error = ApiException(status=response.status_code, reason=response.reason_phrase)
+            error.body = response.text
+            error.headers = response.headers
+            raise error
+        return json.loads(response.content)
+
+
+def get_async_plaid_client():
+    return AsyncPlaidClient()
@@ -0,0 +1,142 @@
+# backend/core/async_views.py
+"""
+Async versions of the views that wait on Plaid, served instead of the sync
+ones when SERVER_MODE=asgi (see core/urls.py and entrypoint.sh).
+
+Under a sync Gunicorn worker every Plaid round trip holds the whole worker.
+Here the view awaits Plaid through core/async_plaid.py and the database
+through Django's async ORM, so one ASGI worker keeps serving other requests
+while hundreds of Plaid calls are outstanding. DRF views are sync only, so
+these are plain Django views that authenticate the JWT themselves and answer
+exactly like their DRF counterparts.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from plaid.exceptions import ApiException
+from rest_framework.exceptions import APIException
+
+from .async_plaid import get_async_plaid_client
+from .authentication import CachedJWTAuthentication
+from .metrics import plaid_institution
+from .models import Account, PlaidItem
+from .rate_limits import RateLimited
+from .response_cache import bump_data_version
+from .views import accounts_from_plaid, link_token_options, rate_limited_response
+
+logger = logging.getLogger(__name__)
+
+
+@sync_to_async
+def release_connection():
+    """
+    Closes this request's database connection (or hands it back to the pool)
+    before a long wait on Plaid.
+    Every in-flight request has its own thread, and so its own connection;
+    holding them all through the Plaid round trip would run Postgres out of
+    connections long before the event loop runs out of requests.
+    """
+    if not connection.in_atomic_block:
+        connection.close()
+
+
+class AsyncAPIView(View):
+    """
+    The async counterpart of an APIView with CachedJWTAuthentication and
+    IsAuthenticated: sets ``request.user`` and ``request.data`` (the parsed
+    JSON body, which must be an object) before calling the handler.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF: token-authenticated, so CSRF protection doesn't apply.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+        except APIException as e:
+            return JsonResponse(e.detail if isinstance(e.detail, dict) else {'detail': e.detail}, status=e.status_code)
+        if authenticated is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        request.user = authenticated[0]
+        await release_connection()
+        try:
+            request.data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'detail': 'JSON parse error.'}, status=400)
+        if not isinstance(request.data, dict):
+            return JsonResponse({'detail': 'Body must be a JSON object.'}, status=400)
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncCreateLinkTokenView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            response = await get_async_plaid_client().link_token_create({
+                'user': {'client_user_id': str(request.user.id)},
+                'client_name': settings.APP_NAME,
+                'products': settings.PLAID_PRODUCTS,
+                'country_codes': settings.PLAID_COUNTRY_CODES,
+                'language': 'en',
+                **link_token_options(),
+            })
+            return JsonResponse(response)
+        except RateLimited as e:
+            return rate_limited_response(e)
+        except ApiException as e:
+            error_response = json.loads(e.body)
+            return JsonResponse({'error': error_response}, status=e.status)
+        except Exception as e:
+            return JsonResponse({'error': f'A generic server error occurred: {str(e)}'}, status=500)
+
+
+class AsyncSetAccessTokenView(AsyncAPIView):
+    async def post(self, request):
+        public_token = request.data.get('public_token')
+        institution_metadata = request.data.get('institution', {})
+        institution_id = institution_metadata.get('institution_id')
+        institution_name = institution_metadata.get('name', 'Unknown Institution')
+        if not public_token or not institution_id:
+            return JsonResponse({'error': 'Public token or institution ID not provided.'}, status=400)
+        if await PlaidItem.objects.filter(user=request.user, institution_id=institution_id).aexists():
+            return JsonResponse({'error': f'You have already linked an account from {institution_name}.'}, status=409)
+        await release_connection()
+        try:
+            plaid_client = get_async_plaid_client()
+            with plaid_institution(institution_id):
+                exchange_response = await plaid_client.item_public_token_exchange({'public_token': public_token})
+            plaid_item = await PlaidItem.objects.acreate(
+                user=request.user,
+                access_token=exchange_response['access_token'],
+                item_id=exchange_response['item_id'],
+                institution_name=institution_name,
+                institution_id=institution_id
+            )
+            # New items have no next_sync_at, so the sync worker picks them up on its next poll.
+            await sync_to_async(bump_data_version)([request.user.pk])
+
+            # A slow institution is cut off at PLAID_ITEM_TIMEOUT_SECONDS, as in the sync view.
+            try:
+                with plaid_institution(institution_id):
+                    fetched = await asyncio.wait_for(
+                        plaid_client.accounts_get({'access_token': plaid_item.access_token}), settings.PLAID_ITEM_TIMEOUT_SECONDS
+                    )
+            except (ApiException, asyncio.TimeoutError, RateLimited) as e:
+                logger.warning(f"Could not fetch accounts for {plaid_item}: {e!r}", extra={'item_id': plaid_item.pk})
+                return JsonResponse({'error': 'Could not fetch accounts, but item was linked.'}, status=207)
+            await Account.objects.abulk_create(accounts_from_plaid(plaid_item, fetched['accounts']))
+            return JsonResponse({'message': f"Access token for {institution_name} saved and accounts created successfully."}, status=201)
+        except RateLimited as e:
+            return rate_limited_response(e)
+        except ApiException as e:
+            error_response = json.loads(e.body)
+            return JsonResponse({'error': error_response}, status=e.status)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=500)
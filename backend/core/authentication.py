@@ -0,0 +1,125 @@
+# backend/core/authentication.py
+"""
+JWT authentication without a database query per request.
+
+simplejwt's JWTAuthentication loads the User row for every authenticated
+request. The token is signed, so the user id in it can be trusted as is;
+what it doesn't carry is the rest of ``request.user`` and whether the user
+is still allowed in. CachedJWTAuthentication keeps that "principal" in two
+caches: a few seconds in this process (AUTH_PRINCIPAL_LOCAL_SECONDS), then
+AUTH_PRINCIPAL_CACHE_SECONDS in the shared Django cache. Only a miss in both
+reads the database.
+
+Revocation: tokens carry a hash of the user's password hash (simplejwt's
+CHECK_REVOKE_TOKEN), so changing the password invalidates every token issued
+before. Saving or deleting a User drops its principal from the shared cache,
+so a password change or deactivation takes effect everywhere within
+AUTH_PRINCIPAL_LOCAL_SECONDS. Changes that bypass the model's save() (a
+queryset update()) only show up once the principal expires.
+
+``request.user`` is a User built from the principal, which holds every
+field except the password hash (PRINCIPAL_FIELDS), so password hashes never
+sit in the shared cache. Reading ``request.user.password`` or calling
+check_password() on it queries the database. As with any instance from
+``.only()``, saving it writes just the loaded fields.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# The User fields request.user has without touching the database: all but the password.
+PRINCIPAL_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser',
+    'last_login', 'date_joined',
+)
+# Bounds the in-process cache; it is simply emptied when it grows past this.
+LOCAL_MAX_ENTRIES = 10000
+
+_local = {}
+_lock = threading.Lock()
+
+
+def principal_key(user_id):
+    return f'auth-principal:{user_id}'
+
+
+def load_principal(user_id):
+    """The principal of ``user_id`` from the database, or None if there is no such user."""
+    User = get_user_model()
+    row = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*PRINCIPAL_FIELDS, 'password').first()
+    if row is None:
+        return None
+    return {
+        'fields': {field: row[field] for field in PRINCIPAL_FIELDS},
+        'revoke_hash': get_md5_hash_password(row['password']),
+    }
+
+
+def get_principal(user_id):
+    """The cached principal of ``user_id``, loading it on a miss. None if the user doesn't exist."""
+    now = time.monotonic()
+    local = _local.get(user_id)
+    if local is not None and local[0] > now:
+        return local[1]
+    principal = cache.get(principal_key(user_id))
+    if principal is None:
+        principal = load_principal(user_id)
+        if principal is None:
+            return None
+        cache.set(principal_key(user_id), principal, settings.AUTH_PRINCIPAL_CACHE_SECONDS)
+    with _lock:
+        if len(_local) >= LOCAL_MAX_ENTRIES:
+            _local.clear()
+        _local[user_id] = (now + settings.AUTH_PRINCIPAL_LOCAL_SECONDS, principal)
+    return principal
+
+
+def forget_principal(sender, instance, **kwargs):
+    """post_save / post_delete handler for User: the next request reloads the principal."""
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+
+    def forget():
+        cache.delete(principal_key(user_id))
+        with _lock:
+            _local.pop(user_id, None)
+    forget()
+    # Again after commit, in case a request cached the old row in between.
+    transaction.on_commit(forget)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that gets the user from the principal cache instead of
+    the database. The user has every PRINCIPAL_FIELDS field loaded; only the
+    password is deferred.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        principal = get_principal(user_id)
+        if principal is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        # from_db() takes the loaded fields in model order.
+        names = [f.attname for f in self.user_model._meta.concrete_fields if f.attname in principal['fields']]
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, names, [principal['fields'][name] for name in names])
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != principal['revoke_hash']:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
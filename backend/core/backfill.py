@@ -0,0 +1,157 @@
+# backend/core/backfill.py
+"""
+Resumable bulk backfill of transaction history.
+
+The regular sync (core/sync.py) gathers everything /transactions/sync has for
+an item before writing any of it, which for a newly linked item means up to
+TRANSACTIONS_HISTORY_DAYS of history in memory and in one database
+transaction. A backfill pages through /transactions/get instead, newest
+first, BACKFILL_PAGE_SIZE transactions at a time, and writes each page with
+ingest_transactions as soon as it arrives. After every page the item's
+TransactionBackfill records the next offset, in the same database
+transaction as the rows, so an interrupted backfill resumes from the last
+page it wrote.
+
+Many items are backfilled side by side: each round fetches the next page of
+up to ``concurrency`` items through core/fetching.py (which also enforces
+the per-user cap), then writes the pages one after another on the calling
+thread. A page is fetched and written under the item's sync_lock, so it
+never interleaves with a regular sync of the same item.
+
+Offsets assume the list doesn't change between pages. The window's end date
+is fixed when the backfill starts, so new transactions don't shift it; if
+Plaid reports fewer transactions than before, some moved up past the offset,
+and the offset steps back by as many (writing a page twice is harmless).
+"""
+import logging
+import time
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .fetching import fetch_concurrently
+from .ingestion import ingest_transactions, prepare_partitions
+from .models import TransactionBackfill
+from .plaid_client import get_plaid_client
+from .rate_limits import sync_lock
+from .response_cache import bump_data_version
+from .sync import backoff_delay, plaid_error_code, rate_limit_delay
+
+logger = logging.getLogger(__name__)
+
+# Plaid returns this until it has pulled the item's history after linking.
+PRODUCT_NOT_READY = 'PRODUCT_NOT_READY'
+
+
+def get_backfill(item, days=None, restart=False):
+    """The item's TransactionBackfill, started over the last ``days`` days if there is none (or ``restart``)."""
+    days = settings.TRANSACTIONS_HISTORY_DAYS if days is None else days
+    window = {'start_date': date.today() - timedelta(days=days), 'end_date': date.today()}
+    if restart:
+        backfill, _ = TransactionBackfill.objects.update_or_create(
+            plaid_item=item,
+            defaults={**window, 'offset': 0, 'total': None, 'stored': 0, 'completed_at': None, 'last_error': None},
+        )
+        return backfill
+    backfill, _ = TransactionBackfill.objects.get_or_create(plaid_item=item, defaults=window)
+    return backfill
+
+
+def fetch_page(item, backfill, plaid_client, page_size):
+    """One /transactions/get page at the backfill's offset."""
+    return plaid_client.transactions_get({
+        'access_token': item.access_token,
+        'start_date': backfill.start_date,
+        'end_date': backfill.end_date,
+        'options': {'count': page_size, 'offset': backfill.offset},
+    })
+
+
+def apply_page(item, backfill, page):
+    """Writes a fetched page and moves the checkpoint past it. Returns the IngestResult."""
+    total = page['total_transactions']
+    transactions = page['transactions']
+    shrunk = backfill.total is not None and total < backfill.total
+    prepare_partitions(transactions)
+    with transaction.atomic():
+        result = ingest_transactions(item, transactions)
+        if shrunk:
+            # Transactions went away since the last page, so the rest moved up by
+            # as many and this page skipped that many. Fetch from there again.
+            backfill.offset = max(backfill.offset - (backfill.total - total), 0)
+        else:
+            backfill.offset += len(transactions)
+        backfill.total = total
+        backfill.stored += result.stored
+        backfill.last_error = None
+        if not shrunk and (not transactions or backfill.offset >= total):
+            backfill.completed_at = timezone.now()
+        backfill.save()
+        bump_data_version([item.user_id])
+    return result
+
+
+def run_backfills(backfills, plaid_client=None, concurrency=None, page_size=None, report=None):
+    """
+    Backfills every item in ``backfills`` (TransactionBackfills with their
+    plaid_item) until each is complete or fails, ``concurrency`` items at a
+    time (default PLAID_MAX_CONCURRENCY). Rate limits and PRODUCT_NOT_READY
+    postpone an item; any other error stops it, with the error saved on its
+    backfill. ``report(backfill, result, error)`` is called after every page.
+    Returns ``(completed, failed)``.
+    """
+    plaid_client = plaid_client or get_plaid_client()
+    concurrency = concurrency or settings.PLAID_MAX_CONCURRENCY
+    page_size = page_size or settings.BACKFILL_PAGE_SIZE
+    queue = [backfill for backfill in backfills if backfill.completed_at is None]
+    retry_at = {}
+    completed, failed = [], []
+    while queue:
+        now = time.monotonic()
+        ready = [backfill for backfill in queue if retry_at.get(backfill.pk, 0) <= now][:concurrency]
+        if not ready:
+            time.sleep(max(min(retry_at[backfill.pk] for backfill in queue) - now, 0.05))
+            continue
+        with ExitStack() as locks:
+            # An item being synced right now waits for the next round.
+            locked = [backfill for backfill in ready if locks.enter_context(sync_lock(backfill.plaid_item))]
+            for backfill in ready:
+                if backfill not in locked:
+                    retry_at[backfill.pk] = now + 1
+            by_item = {backfill.plaid_item_id: backfill for backfill in locked}
+            fetched = fetch_concurrently(
+                [backfill.plaid_item for backfill in locked],
+                lambda item: fetch_page(item, by_item[item.pk], plaid_client, page_size),
+            )
+            for backfill, fetch_result in zip(locked, fetched):
+                item = backfill.plaid_item
+                try:
+                    if not fetch_result.ok:
+                        raise fetch_result.error
+                    result = apply_page(item, backfill, fetch_result.value)
+                except Exception as e:
+                    delay = rate_limit_delay(e)
+                    if delay is None and plaid_error_code(e) == PRODUCT_NOT_READY:
+                        delay = backoff_delay(1)
+                    message = plaid_error_code(e) or str(e)
+                    TransactionBackfill.objects.filter(pk=backfill.pk).update(last_error=message)
+                    if delay is not None:
+                        retry_at[backfill.pk] = time.monotonic() + delay.total_seconds()
+                        logger.info(f"Backfill of {item} postponed: {message}", extra={'item_id': item.pk})
+                    else:
+                        logger.warning(f"Backfill of {item} failed: {message}", extra={'item_id': item.pk})
+                        queue.remove(backfill)
+                        failed.append(backfill)
+                    if report:
+                        report(backfill, None, e)
+                    continue
+                if backfill.completed_at is not None:
+                    queue.remove(backfill)
+                    completed.append(backfill)
+                if report:
+                    report(backfill, result, None)
+    return completed, failed
+
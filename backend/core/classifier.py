@@ -0,0 +1,244 @@
+# backend/core/classifier.py
+"""
+Process-wide access to the transaction classifier.
+
+The model is loaded lazily on first use and kept for the life of the process
+(one copy per Gunicorn or sync worker). Before each use the file's mtime is
+compared with the loaded copy's - at most every CLASSIFIER_RELOAD_CHECK_SECONDS
+- so retraining with `manage.py train_classifier` is picked up without a
+restart.
+
+Merchant names are normalized before they reach the model (and before it is
+trained), and predictions are memoized per normalized name in
+MerchantCategoryCache, so a merchant seen before costs a lookup instead of a
+TF-IDF + SVM pass.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MerchantCategoryCache, Transaction
+from .response_cache import bump_data_version
+from .rollups import RollupDeltas
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(settings.BASE_DIR, 'core', 'ml_models', 'transaction_classifier.joblib')
+
+# Sets each row's category to a one-item list, to match Plaid's format.
+WRITE_CATEGORIES = """
+    UPDATE core_transaction SET category = jsonb_build_array(new.category)
+    FROM unnest(%(ids)s::bigint[], %(categories)s::text[]) AS new(id, category)
+    WHERE core_transaction.id = new.id AND core_transaction.id = ANY(%(ids)s)
+      AND core_transaction.date BETWEEN %(first)s AND %(last)s
+"""
+
+# Counts a use of each entry, in id order and skipping rows another writer has locked.
+TOUCH_CACHE_ENTRIES = """
+    UPDATE core_merchantcategorycache SET hits = hits + 1, last_used_at = %s
+    WHERE id IN (
+        SELECT id FROM core_merchantcategorycache
+        WHERE model_version = %s AND normalized_name = ANY(%s)
+        ORDER BY id FOR UPDATE SKIP LOCKED
+    )
+"""
+
+_lock = threading.Lock()
+_model = None
+_model_mtime = None
+_model_version = None
+_checked_at = 0.0
+
+# Per-process memo cache counters, see cache_stats().
+_stats = {'hits': 0, 'misses': 0}
+# Memo cache entries this process added since it last ran evict_cache().
+_added_since_eviction = 0
+
+US_STATES = (
+    'AL AK AZ AR CA CO CT DE FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ '
+    'NM NY NC ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY DC'
+).split()
+
+_DATE_RE = re.compile(r'\b\d{1,4}[/-]\d{1,2}(?:[/-]\d{2,4})?\b')
+_CARD_RE = re.compile(r'\b(?:CARD|ACCT|X{2,}|\*{2,})\s*[X*]*\d+\b')
+_STORE_RE = re.compile(r'(?:#|NO\.?\s|STORE\s)\s*\d+')
+_NON_ALPHA_RE = re.compile(r"[^A-Z&' ]+")
+_STATE_RE = re.compile(r'\s(?:' + '|'.join(US_STATES) + r')$')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_merchant_name(name):
+    """
+    Reduces a raw transaction name to the merchant it came from.
+
+    "STARBUCKS #1234 SEATTLE WA 03/14" and "Starbucks 5678 WA" both become
+    "STARBUCKS SEATTLE" / "STARBUCKS": dates, card suffixes, store numbers and
+    other digits, punctuation and a trailing state code are dropped.
+    """
+    name = (name or '').upper()
+    for pattern in (_DATE_RE, _CARD_RE, _STORE_RE, _NON_ALPHA_RE):
+        name = pattern.sub(' ', name)
+    name = _SPACES_RE.sub(' ', name).strip()
+    # A trailing state code is location, not merchant ("SHELL OIL TX").
+    # Keep it if it is all there is.
+    stripped = _STATE_RE.sub('', name)
+    return stripped or name
+
+
+def file_version(path):
+    """A short content hash of the model file, used to key cached predictions."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def get_model():
+    """Returns the current classifier, or None if no model has been trained yet."""
+    global _model, _model_mtime, _model_version, _checked_at
+    now = time.monotonic()
+    if _model is not None and now - _checked_at < settings.CLASSIFIER_RELOAD_CHECK_SECONDS:
+        return _model
+    with _lock:
+        _checked_at = now
+        try:
+            mtime = os.stat(MODEL_PATH).st_mtime
+        except FileNotFoundError:
+            _model, _model_mtime, _model_version = None, None, None
+            return None
+        if _model is None or mtime != _model_mtime:
+            import joblib
+            logger.info(f"Loading transaction classifier from {MODEL_PATH}")
+            _model = joblib.load(MODEL_PATH)
+            _model_mtime = mtime
+            _model_version = file_version(MODEL_PATH)
+        return _model
+
+
+def get_model_version():
+    """The version of the model get_model() returns (None without a model)."""
+    get_model()
+    return _model_version
+
+
+def predict_categories(names, model=None, version=None):
+    """
+    Predicts one category per name. Returns None without a model.
+
+    Names are normalized first; each distinct merchant is looked up in the
+    memo cache and only the misses are sent to the model, in one vectorized
+    call. Pass ``model`` and ``version`` to use a model loaded elsewhere
+    (e.g. memory-mapped in a categorize_transactions worker).
+    """
+    if model is None:
+        model, version = get_model(), get_model_version()
+    if model is None or not names:
+        return None
+
+    normalized = [normalize_merchant_name(name) for name in names]
+    unique_names = set(normalized)
+    known = dict(
+        MerchantCategoryCache.objects.filter(model_version=version, normalized_name__in=unique_names)
+        .values_list('normalized_name', 'category')
+    )
+    hit_names = set(known)
+    missing = sorted(unique_names - hit_names)
+    if missing:
+        known.update(zip(missing, model.predict(missing)))
+    # Callers write transactions in a database transaction; updating the memo
+    # cache inside it would hold row locks on popular merchants until it commits.
+    transaction.on_commit(lambda: remember_predictions(version, {n: known[n] for n in missing}, hit_names))
+
+    hits = sum(1 for n in normalized if n in hit_names)
+    _stats['hits'] += hits
+    _stats['misses'] += len(normalized) - hits
+    return [known[n] for n in normalized]
+
+
+def remember_predictions(version, predicted, hit_names):
+    """
+    Stores new predictions in the memo cache and touches the entries that were
+    used, for LRU eviction. Best effort: entries another writer holds are
+    skipped rather than waited for, and failures are only logged.
+    """
+    try:
+        if predicted:
+            MerchantCategoryCache.objects.bulk_create(
+                [MerchantCategoryCache(normalized_name=n, model_version=version, category=c)
+                 for n, c in sorted(predicted.items())],
+                ignore_conflicts=True,
+            )
+            note_cache_additions(len(predicted))
+        if hit_names:
+            with connection.cursor() as cursor:
+                cursor.execute(TOUCH_CACHE_ENTRIES, [timezone.now(), version, sorted(hit_names)])
+    except Exception:
+        logger.exception("Could not update the merchant category cache")
+
+
+def note_cache_additions(count):
+    """
+    Runs evict_cache() once this process has added CLASSIFIER_CACHE_EVICT_EVERY
+    entries since the last time, rather than after every batch of misses, so
+    the cache can overshoot its size by about that many entries per process.
+    """
+    global _added_since_eviction
+    with _lock:
+        _added_since_eviction += count
+        if _added_since_eviction < settings.CLASSIFIER_CACHE_EVICT_EVERY:
+            return
+        _added_since_eviction = 0
+    evict_cache()
+
+
+def evict_cache():
+    """Drops the least recently used entries beyond CLASSIFIER_CACHE_MAX_ENTRIES."""
+    stale = MerchantCategoryCache.objects.order_by('-last_used_at').values('pk')[settings.CLASSIFIER_CACHE_MAX_ENTRIES:]
+    if MerchantCategoryCache.objects.filter(pk__in=stale[:1]).exists():
+        MerchantCategoryCache.objects.filter(pk__in=stale).delete()
+
+
+def cache_stats():
+    """Memo cache hits and misses in this process (per transaction, not per merchant)."""
+    lookups = _stats['hits'] + _stats['misses']
+    return dict(_stats, hit_rate=_stats['hits'] / lookups if lookups else 0.0)
+
+
+def write_categories(pks, categories):
+    """
+    Saves predicted categories with a single UPDATE that joins the new
+    categories in as arrays - much cheaper than bulk_update's per-row CASE
+    expression. The spending rollups move the rows' amounts to their new
+    categories in the same database transaction.
+    """
+    new_category = dict(zip(pks, categories))
+    with transaction.atomic():
+        rollups = RollupDeltas()
+        user_ids = set()
+        dates = set()
+        for pk, user_id, account_id, old_category, transaction_date, amount in (
+            Transaction.objects.filter(pk__in=list(pks)).order_by('pk').select_for_update(of=('self',))
+            .values_list('pk', 'account__plaid_item__user_id', 'account_id', 'category', 'date', 'amount')
+        ):
+            user_ids.add(user_id)
+            dates.add(transaction_date)
+            rollups.subtract(account_id, old_category, transaction_date, amount)
+            rollups.add(account_id, [new_category[pk]], transaction_date, amount)
+        if not dates:
+            return
+        # The rows are locked, so the date range matches them all; it only spares
+        # a partitioned table (core/partitions.py) from searching every month.
+        with connection.cursor() as cursor:
+            cursor.execute(WRITE_CATEGORIES, {
+                'ids': list(new_category), 'categories': list(new_category.values()), 'first': min(dates), 'last': max(dates),
+            })
+        rollups.apply()
+        bump_data_version(user_ids)
@@ -0,0 +1,228 @@
+# backend/core/fake_plaid.py
+"""
+An in-memory stand-in for ``plaid_api.PlaidApi``.
+
+It answers the handful of endpoints this app uses with deterministic data, so
+the sync engine, the views and the management commands can be run and tested
+locally (``PLAID_ENV=fake``) without Plaid credentials or network access.
+"""
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from plaid.exceptions import ApiException
+
+from . import rate_limits
+
+MERCHANTS = [
+    ('STARBUCKS COFFEE', 'Food and Drink'),
+    ('MCDONALDS', 'Food and Drink'),
+    ('DOORDASH', 'Food and Drink'),
+    ('UBER TRIP', 'Travel'),
+    ('UNITED AIRLINES', 'Travel'),
+    ('SHELL OIL', 'Travel'),
+    ('AMAZON MKTPLACE', 'Shops'),
+    ('TARGET', 'Shops'),
+    ('WALMART', 'Shops'),
+    ('NETFLIX.COM', 'Service'),
+    ('SPOTIFY USA', 'Service'),
+    ('COMCAST CABLE', 'Service'),
+    ('CVS PHARMACY', 'Healthcare'),
+    ('PAYROLL DEPOSIT', 'Transfer'),
+]
+
+
+def synthetic_transactions(account_ids, count, rng=None, days=90, id_prefix='txn'):
+    """
+    Generates ``count`` Plaid-shaped transaction dicts spread over the last ``days`` days.
+
+    Used by the fake client and by the benchmarks to produce realistic-looking
+    data: noisy merchant names, amounts in cents and a Plaid-style category.
+    """
+    rng = rng or random.Random(0)
+    today = date.today()
+    for index in range(count):
+        name, category = rng.choice(MERCHANTS)
+        yield {
+            'transaction_id': f'{id_prefix}-{index}',
+            'account_id': rng.choice(account_ids),
+            'name': f'{name} {rng.randint(100, 9999)}',
+            'amount': round(rng.uniform(1, 250), 2),
+            'iso_currency_code': 'USD',
+            'date': today - timedelta(days=rng.randint(0, days - 1)),
+            'pending': False,
+            'category': [category],
+        }
+
+
+class FakeResponse(dict):
+    """A dict that also offers ``to_dict()``, like Plaid's generated models."""
+    def to_dict(self):
+        return dict(self)
+
+
+def make_api_exception(status, error_code, error_message=''):
+    """Builds an ``ApiException`` carrying a Plaid-style JSON error body."""
+    exc = ApiException(status=status, reason=error_code)
+    exc.body = json.dumps({
+        'error_type': 'API_ERROR',
+        'error_code': error_code,
+        'error_message': error_message or error_code,
+    })
+    return exc
+
+
+class FakePlaidClient:
+    """
+    Deterministic fake of the Plaid API client.
+
+    Every access token owns a small ledger of accounts and transactions that is
+    generated from the token itself, so separate client instances (one per
+    call to get_plaid_client) see the same data. Ledgers live on the class
+    and can be edited with ``add_transaction`` / ``modify_transaction`` /
+    ``remove_transaction``, which also feed /transactions/sync. Call
+    ``FakePlaidClient.reset()`` between tests.
+    """
+    _ledgers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, transactions_per_item=60, days=90, latency=0.0, failures=None):
+        self.transactions_per_item = transactions_per_item
+        self.days = days
+        # Seconds to sleep per call, to simulate a slow institution.
+        self.latency = latency
+        # Maps access_token -> exception to raise for calls on that item.
+        self.failures = failures or {}
+        self.calls = []
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._ledgers = {}
+
+    # --- Ledger helpers ---
+
+    def ledger(self, access_token):
+        with self._lock:
+            if access_token not in self._ledgers:
+                self._ledgers[access_token] = self._generate_ledger(access_token)
+            return self._ledgers[access_token]
+
+    def _generate_ledger(self, access_token):
+        rng = random.Random(access_token)
+        accounts = [
+            {
+                'account_id': f'{access_token}-acc-{index}',
+                'name': name,
+                'mask': f'{rng.randint(0, 9999):04d}',
+                'type': 'depository',
+                'subtype': subtype,
+                'balances': {
+                    'current': round(rng.uniform(100, 10000), 2),
+                    'available': round(rng.uniform(100, 10000), 2),
+                    'iso_currency_code': 'USD',
+                },
+            }
+            for index, (name, subtype) in enumerate([('Plaid Checking', 'checking'), ('Plaid Saving', 'savings')])
+        ]
+        transactions = {
+            t['transaction_id']: t
+            for t in synthetic_transactions(
+                [account['account_id'] for account in accounts], self.transactions_per_item,
+                rng=rng, days=self.days, id_prefix=f'{access_token}-txn',
+            )
+        }
+        # /transactions/sync replays this change log; a cursor is an index into it.
+        events = [('added', dict(t)) for t in sorted(transactions.values(), key=lambda t: t['date'])]
+        return {'accounts': accounts, 'transactions': transactions, 'events': events}
+
+    def add_transaction(self, access_token, plaid_transaction):
+        ledger = self.ledger(access_token)
+        with self._lock:
+            ledger['transactions'][plaid_transaction['transaction_id']] = plaid_transaction
+            ledger['events'].append(('added', dict(plaid_transaction)))
+
+    def modify_transaction(self, access_token, transaction_id, **changes):
+        ledger = self.ledger(access_token)
+        with self._lock:
+            ledger['transactions'][transaction_id].update(changes)
+            ledger['events'].append(('modified', dict(ledger['transactions'][transaction_id])))
+
+    def remove_transaction(self, access_token, transaction_id):
+        ledger = self.ledger(access_token)
+        with self._lock:
+            del ledger['transactions'][transaction_id]
+            ledger['events'].append(('removed', {'transaction_id': transaction_id}))
+
+    def _call(self, endpoint, access_token=None):
+        # Goes through the same rate limiter as the real client.
+        rate_limits.acquire(access_token)
+        self.calls.append((endpoint, access_token))
+        if self.latency:
+            time.sleep(self.latency)
+        if access_token in self.failures:
+            raise self.failures[access_token]
+
+    # --- Plaid endpoints ---
+
+    def link_token_create(self, request):
+        self._call('link_token_create')
+        return FakeResponse({
+            'link_token': f'link-fake-{random.getrandbits(32):08x}',
+            'expiration': (date.today() + timedelta(days=1)).isoformat(),
+            'request_id': 'fake',
+        })
+
+    def item_public_token_exchange(self, request):
+        self._call('item_public_token_exchange')
+        public_token = request['public_token']
+        return FakeResponse({
+            'access_token': f'access-fake-{public_token}',
+            'item_id': f'item-fake-{public_token}',
+            'request_id': 'fake',
+        })
+
+    def accounts_get(self, request):
+        access_token = request['access_token']
+        self._call('accounts_get', access_token)
+        return FakeResponse({'accounts': self.ledger(access_token)['accounts'], 'request_id': 'fake'})
+
+    def transactions_get(self, request):
+        access_token = request['access_token']
+        self._call('transactions_get', access_token)
+        ledger = self.ledger(access_token)
+        matching = sorted(
+            (t for t in ledger['transactions'].values() if request['start_date'] <= t['date'] <= request['end_date']),
+            key=lambda t: (t['date'], t['transaction_id']),
+            reverse=True,
+        )
+        # Plaid pages with options.count (default 100, at most 500) and options.offset.
+        options = request.get('options') or {}
+        offset = options.get('offset', 0)
+        return FakeResponse({
+            'accounts': ledger['accounts'],
+            'transactions': matching[offset:offset + min(options.get('count', 100), 500)],
+            'total_transactions': len(matching),
+            'request_id': 'fake',
+        })
+
+    def transactions_sync(self, request):
+        access_token = request['access_token']
+        self._call('transactions_sync', access_token)
+        ledger = self.ledger(access_token)
+        try:
+            start = int(request.get('cursor') or 0)
+        except ValueError:
+            raise make_api_exception(400, 'INVALID_FIELD', 'cursor is not valid')
+        page = ledger['events'][start:start + request.get('count', 100)]
+        end = start + len(page)
+        return FakeResponse({
+            'added': [t for kind, t in page if kind == 'added'],
+            'modified': [t for kind, t in page if kind == 'modified'],
+            'removed': [t for kind, t in page if kind == 'removed'],
+            'next_cursor': str(end),
+            'has_more': end < len(ledger['events']),
+            'request_id': 'fake',
+        })
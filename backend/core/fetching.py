@@ -0,0 +1,148 @@
+# backend/core/fetching.py
+"""
+Bounded, concurrent Plaid fetches.
+
+Institutions are slow in very different ways, so calls for different items
+run side by side on a shared thread pool instead of one after another. Two
+caps keep this polite: PLAID_MAX_CONCURRENCY calls per process (the pool
+size) and PLAID_MAX_CONCURRENCY_PER_USER calls per user; a call is only
+queued on the pool once its user has a free slot. Each call gets
+PLAID_ITEM_TIMEOUT_SECONDS once it has started; a call that overruns is
+reported as failed and the caller moves on without it.
+
+Only the network part should go through here - keep database work on the
+calling thread.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from . import metrics
+
+
+class FetchTimeout(Exception):
+    """Raised (as a result, never on the worker thread) when a fetch overruns its timeout."""
+
+
+class FetchResult:
+    """The outcome of fetching one item: either ``value`` or ``error`` is set."""
+    def __init__(self, item, value=None, error=None, elapsed=0.0):
+        self.item = item
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+_executor = None
+_executor_pid = None
+_user_slots = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide pool. Recreated after a fork, since threads don't survive one."""
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=settings.PLAID_MAX_CONCURRENCY, thread_name_prefix='plaid-fetch')
+            _executor_pid = os.getpid()
+            _user_slots.clear()
+        return _executor
+
+
+def user_slot(user_id):
+    with _lock:
+        if user_id not in _user_slots:
+            _user_slots[user_id] = threading.BoundedSemaphore(settings.PLAID_MAX_CONCURRENCY_PER_USER)
+        return _user_slots[user_id]
+
+
+def fetch_concurrently(items, fetch, timeout=None):
+    """
+    Calls ``fetch(item)`` for every PlaidItem in ``items`` concurrently.
+
+    Returns one FetchResult per item, in the same order. Exceptions and
+    timeouts are captured per item, so one failing bank never fails the rest.
+    """
+    timeout = settings.PLAID_ITEM_TIMEOUT_SECONDS if timeout is None else timeout
+    executor = get_executor()
+    started_at = {}
+
+    def run(index, item, slot):
+        try:
+            with metrics.plaid_institution(item.institution_id):
+                started_at[index] = time.monotonic()
+                return fetch(item)
+        finally:
+            slot.release()
+
+    # Calls still waiting for a slot give up eventually too, so a pool full of
+    # hung calls can't stall the caller forever.
+    queue_deadline = time.monotonic() + timeout * max(len(items), 1)
+    results = [None] * len(items)
+    waiting = list(enumerate(items))
+    futures, slots = {}, {}
+    pending = set()
+    while waiting or pending:
+        # A call is only handed to the pool once its user has a free slot, so a
+        # user with many items never parks pool threads that others could use.
+        for entry in list(waiting):
+            index, item = entry
+            slot = user_slot(item.user_id)
+            if not slot.acquire(blocking=False):
+                continue
+            waiting.remove(entry)
+            # Each call runs in a copy of the caller's context, so its Plaid time counts towards the caller's request metrics.
+            future = executor.submit(contextvars.copy_context().run, run, index, item, slot)
+            futures[future], slots[future] = index, slot
+            pending.add(future)
+
+        # Wake up when something finishes, when the earliest running call hits
+        # its deadline, or (with calls waiting for a slot) to look for a free one.
+        now = time.monotonic()
+        deadlines = [started_at[futures[f]] + timeout for f in pending if futures[f] in started_at]
+        wait_for = min(deadlines) - now if deadlines else 0.05
+        if waiting:
+            wait_for = min(wait_for, 0.05)
+        if pending:
+            done, pending = wait(pending, timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+        else:
+            done = set()
+            time.sleep(max(wait_for, 0))
+        now = time.monotonic()
+        for future in done:
+            index = futures[future]
+            elapsed = now - started_at.get(index, now)
+            try:
+                results[index] = FetchResult(items[index], value=future.result(), elapsed=elapsed)
+            except Exception as e:
+                results[index] = FetchResult(items[index], error=e, elapsed=elapsed)
+        for future in list(pending):
+            index = futures[future]
+            if index in started_at:
+                timed_out = now - started_at[index] >= timeout
+            else:
+                timed_out = now >= queue_deadline
+            if timed_out:
+                if future.cancel():
+                    # It never ran, so run() won't give the slot back.
+                    slots[future].release()
+                # A running thread can't be killed; it finishes in the background and its result is dropped.
+                pending.discard(future)
+                results[index] = FetchResult(
+                    items[index], error=FetchTimeout(f"Timed out after {timeout}s"),
+                    elapsed=now - started_at.get(index, now),
+                )
+        if waiting and now >= queue_deadline:
+            for index, item in waiting:
+                results[index] = FetchResult(item, error=FetchTimeout(f"Timed out after {timeout}s waiting for a slot"))
+            waiting = []
+    return results
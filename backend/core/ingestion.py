@@ -0,0 +1,241 @@
+# backend/core/ingestion.py
+"""
+Bulk ingestion of Plaid transactions.
+
+A page of transactions is written with a handful of queries no matter how
+many rows it holds: one to map Plaid account ids to our accounts, one per
+``batch_size`` rows to see what is already stored, and one batched
+``INSERT ... ON CONFLICT (plaid_transaction_id) DO UPDATE`` for the rows that
+are new or actually changed. Rows that are identical to what we have are not
+written at all. The spending rollups are adjusted for what changed in the same
+database transaction.
+
+When core_transaction is partitioned by month (core/partitions.py), rows are
+upserted on ``(plaid_transaction_id, date)``, the unique key the partitioned
+table has. Creating a partition locks the whole table until its transaction
+commits, so callers run prepare_partitions() before opening the transaction
+that ingests a page. Rows for a month that archive_transactions moved out are
+not written (they are counted as skipped): the month's partition is gone and
+its rollups already hold the archived totals.
+"""
+import logging
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .classifier import predict_categories
+from .models import Account, Transaction
+from .partitions import archived_months, ensure_partitions, is_partitioned
+from .response_cache import bump_data_version
+from .rollups import RollupDeltas, month_start
+
+logger = logging.getLogger(__name__)
+
+# Fields refreshed from Plaid on every sync. `category` is deliberately left
+# out: it is filled in by our own classifier and must survive re-syncs.
+UPSERT_FIELDS = ['account', 'name', 'amount', 'iso_currency_code', 'date', 'pending']
+CENTS = Decimal('0.01')
+
+
+class IngestResult:
+    """Row counts for one ingestion run."""
+    def __init__(self, inserted=0, updated=0, unchanged=0, skipped=0, removed=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.unchanged = unchanged
+        # Transactions whose account is not linked to the item.
+        self.skipped = skipped
+        self.removed = removed
+
+    @property
+    def stored(self):
+        return self.inserted + self.updated
+
+    def __add__(self, other):
+        return IngestResult(
+            self.inserted + other.inserted,
+            self.updated + other.updated,
+            self.unchanged + other.unchanged,
+            self.skipped + other.skipped,
+            self.removed + other.removed,
+        )
+
+    def __str__(self):
+        return (f"{self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged, "
+                f"{self.skipped} skipped, {self.removed} removed")
+
+
+def _row_key(account_id, name, amount, iso_currency_code, date_value, pending):
+    """The comparable state of a row, used to skip writes that would change nothing."""
+    return (account_id, name, Decimal(amount).quantize(CENTS), iso_currency_code, date_value, bool(pending))
+
+
+def plaid_date(plaid_transaction):
+    """The transaction's date; Plaid's models give a date, raw JSON an ISO string."""
+    value = plaid_transaction['date']
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def prepare_partitions(plaid_transactions):
+    """
+    Creates the partitions ``plaid_transactions`` need, if the table is
+    partitioned. Call it before opening the transaction that ingests them.
+    Archived months are left alone; ingest_transactions skips their rows.
+    """
+    if not is_partitioned():
+        return
+    archived = archived_months()
+    ensure_partitions({day for day in map(plaid_date, plaid_transactions) if month_start(day) not in archived})
+
+
+def build_transaction(plaid_transaction, account_id):
+    """Turns a Plaid transaction dict into an unsaved Transaction."""
+    transaction_date = plaid_date(plaid_transaction)
+    return Transaction(
+        account_id=account_id,
+        plaid_transaction_id=plaid_transaction['transaction_id'],
+        name=plaid_transaction['name'],
+        # Plaid sends floats; go through str() so 12.3 becomes Decimal('12.30') rather than 12.2999...
+        amount=Decimal(str(plaid_transaction['amount'])).quantize(CENTS),
+        iso_currency_code=plaid_transaction['iso_currency_code'],
+        date=transaction_date,
+        pending=plaid_transaction['pending'],
+    )
+
+
+def ingest_transactions(item, plaid_transactions, batch_size=1000):
+    """
+    Upserts a page of Plaid transactions for ``item``. Returns an IngestResult.
+
+    Everything is written inside one database transaction, so a page is
+    either stored completely or not at all. On a partitioned table, call
+    prepare_partitions() first, outside any transaction.
+    """
+    result = IngestResult()
+    account_map = dict(Account.objects.filter(plaid_item=item).values_list('plaid_account_id', 'id'))
+
+    rows = {}
+    missing_accounts = set()
+    for plaid_transaction in plaid_transactions:
+        account_id = account_map.get(plaid_transaction['account_id'])
+        if account_id is None:
+            missing_accounts.add(plaid_transaction['account_id'])
+            result.skipped += 1
+            continue
+        # Later versions of the same transaction win.
+        rows[plaid_transaction['transaction_id']] = build_transaction(plaid_transaction, account_id)
+    for plaid_account_id in missing_accounts:
+        logger.warning(f"Skipping transactions because account {plaid_account_id} not found.", extra={'item_id': item.pk})
+
+    partitioned = is_partitioned()
+    if partitioned:
+        archived = archived_months()
+        refused = [row for row in rows.values() if month_start(row.date) in archived]
+        if refused:
+            months = sorted({f'{row.date:%Y-%m}' for row in refused})
+            logger.warning(
+                f"Skipping {len(refused)} transactions in archived months {', '.join(months)}; "
+                f"restore them with `archive_transactions --restore` to update them.",
+                extra={'item_id': item.pk},
+            )
+            result.skipped += len(refused)
+            rows = {key: row for key, row in rows.items() if month_start(row.date) not in archived}
+
+    with transaction.atomic():
+        changed = []
+        existing_ids = set()
+        moved_ids = []
+        rollups = RollupDeltas()
+        row_list = list(rows.values())
+        for start in range(0, len(row_list), batch_size):
+            batch = row_list[start:start + batch_size]
+            # Locked, so nothing else can change these rows (and their rollups)
+            # between reading the old values here and writing the new ones.
+            existing = {
+                values[0]: (_row_key(*values[1:-1]), values[-1])
+                for values in Transaction.objects.filter(
+                    plaid_transaction_id__in=[row.plaid_transaction_id for row in batch]
+                ).order_by('pk').select_for_update().values_list(
+                    'plaid_transaction_id', 'account_id', 'name', 'amount', 'iso_currency_code', 'date', 'pending', 'category'
+                )
+            }
+            existing_ids.update(existing)
+            for row in batch:
+                stored_key, stored_category = existing.get(row.plaid_transaction_id, (None, None))
+                if stored_key is None:
+                    result.inserted += 1
+                elif stored_key != _row_key(row.account_id, row.name, row.amount, row.iso_currency_code, row.date, row.pending):
+                    result.updated += 1
+                else:
+                    result.unchanged += 1
+                    continue
+                changed.append(row)
+                if stored_key is not None:
+                    # The upsert keeps the stored category, so only the amount, day or account moves.
+                    rollups.subtract(stored_key[0], stored_category, stored_key[4], stored_key[2])
+                    rollups.add(row.account_id, stored_category, row.date, row.amount)
+                    if partitioned and stored_key[4] != row.date:
+                        # The upsert on (plaid_transaction_id, date) won't find the old row:
+                        # delete it and insert the new one with the category it had.
+                        moved_ids.append(row.plaid_transaction_id)
+                        row.category = stored_category
+
+        # New rows are categorized here, in one vectorized call, so they never
+        # show up on the dashboard as uncategorized. Updates keep their category.
+        new_rows = [row for row in changed if row.plaid_transaction_id not in existing_ids]
+        if new_rows and settings.CLASSIFY_ON_INGEST:
+            categorize_rows(new_rows)
+        for row in new_rows:
+            rollups.add(row.account_id, row.category, row.date, row.amount)
+
+        if changed:
+            if moved_ids:
+                Transaction.objects.filter(plaid_transaction_id__in=moved_ids).delete()
+            Transaction.objects.bulk_create(
+                changed,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['plaid_transaction_id', 'date'] if partitioned else ['plaid_transaction_id'],
+                update_fields=UPSERT_FIELDS,
+            )
+            rollups.apply()
+            bump_data_version([item.user_id])
+    return result
+
+
+def categorize_rows(rows):
+    """
+    Fills in ``category`` on unsaved Transactions using the cached classifier.
+
+    Categorization is best effort: without a model, or if prediction fails,
+    rows are stored uncategorized and `categorize_transactions` catches up later.
+    """
+    try:
+        categories = predict_categories([row.name for row in rows])
+    except Exception as e:
+        logger.exception(f"Could not categorize {len(rows)} new transactions: {e}")
+        return
+    if categories is None:
+        return
+    for row, category in zip(rows, categories):
+        # To match Plaid's format, we save it as a list with one item
+        row.category = [category]
+
+
+def remove_transactions(item, transaction_ids):
+    """Deletes the item's transactions that Plaid reported as removed. Returns how many were deleted."""
+    if not transaction_ids:
+        return 0
+    removed = Transaction.objects.filter(account__plaid_item=item, plaid_transaction_id__in=list(transaction_ids))
+    with transaction.atomic():
+        rollups = RollupDeltas()
+        old_values = removed.order_by('pk').select_for_update(of=('self',)).values_list('account_id', 'category', 'date', 'amount')
+        for account_id, category, transaction_date, amount in old_values:
+            rollups.subtract(account_id, category, transaction_date, amount)
+        deleted, _ = removed.delete()
+        rollups.apply()
+        if deleted:
+            bump_data_version([item.user_id])
+    return deleted
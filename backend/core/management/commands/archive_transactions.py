@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.models import TransactionArchive
+from core.partitions import TABLE, add_months, archive_partition, restore_archives, table_state
+from core.rollups import month_start
+from datetime import date
+
+
+def parse_month(value):
+    try:
+        return date.fromisoformat(f'{value}-01')
+    except ValueError:
+        raise CommandError(f"Not a month: {value!r}. Use YYYY-MM.")
+
+
+class Command(BaseCommand):
+    help = ('Moves the monthly transaction partitions older than --older-than months into gzipped CSV files in '
+            '--dir and drops them, so queries and vacuum never touch them. Their spending rollups are kept, so '
+            'summaries still include them. --restore YYYY-MM loads archived months back. Needs a partitioned '
+            'table (partition_transactions).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.TRANSACTION_ARCHIVE_AFTER_MONTHS,
+                            help='Archive the months that ended at least this many months ago.')
+        parser.add_argument('--dir', default=settings.TRANSACTION_ARCHIVE_DIR, help='Where to write the archives.')
+        parser.add_argument('--restore', nargs='+', metavar='YYYY-MM', help='Load these archived months back instead.')
+        parser.add_argument('--list', action='store_true', help='List the archived months.')
+
+    def handle(self, *args, **options):
+        partitioned, months = table_state(refresh=True)
+        if not partitioned:
+            raise CommandError(f"{TABLE} is not partitioned; run partition_transactions first.")
+
+        if options['list']:
+            for archive in TransactionArchive.objects.order_by('start_date', 'archived_at'):
+                self.stdout.write(f"{archive.start_date:%Y-%m}  {archive.rows:>9,} rows  {archive.path}")
+            return
+
+        if options['restore']:
+            for month in map(parse_month, options['restore']):
+                archives = TransactionArchive.objects.filter(start_date=month)
+                if not archives.exists():
+                    raise CommandError(f"{month:%Y-%m} is not archived.")
+                restored, skipped = restore_archives(archives)
+                message = f"Restored {restored} transactions for {month:%Y-%m}."
+                if skipped:
+                    message += f" Skipped {skipped} of deleted accounts or already present."
+                self.stdout.write(self.style.SUCCESS(message))
+            return
+
+        cutoff = add_months(month_start(date.today()), -options['older_than'])
+        old_months = sorted(month for month in months if month < cutoff)
+        if not old_months:
+            self.stdout.write(f"No partitions before {cutoff:%Y-%m}.")
+            return
+        for month in old_months:
+            archive = archive_partition(month, options['dir'])
+            if archive is not None:
+                self.stdout.write(f"Archived {month:%Y-%m}: {archive.rows} transactions to {archive.path}.")
+        self.stdout.write(self.style.SUCCESS(f"Archived {len(old_months)} months."))
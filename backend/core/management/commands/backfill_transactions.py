@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.backfill import get_backfill, run_backfills
+from core.models import PlaidItem
+import time
+
+
+class Command(BaseCommand):
+    help = ('Pages through up to --days of transaction history for every linked item with /transactions/get and '
+            'stores it page by page, several items at a time. Progress is saved after every page, so running it '
+            'again resumes where it stopped; items whose backfill finished are skipped unless --restart is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--item', action='append', help='Only backfill this item (by Plaid item_id). Repeatable.')
+        parser.add_argument('--days', type=int, default=settings.TRANSACTIONS_HISTORY_DAYS,
+                            help='How many days of history to fetch, for backfills that start now.')
+        parser.add_argument('--concurrency', type=int, default=settings.PLAID_MAX_CONCURRENCY,
+                            help='Items fetched at once (PLAID_MAX_CONCURRENCY_PER_USER still applies).')
+        parser.add_argument('--page-size', type=int, default=settings.BACKFILL_PAGE_SIZE,
+                            help='Transactions per /transactions/get call (at most 500).')
+        parser.add_argument('--restart', action='store_true', help='Start over, including finished backfills.')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['page_size'] <= 500:
+            raise CommandError("--page-size must be between 1 and 500.")
+        items = PlaidItem.objects.order_by('pk')
+        if options['item']:
+            items = items.filter(item_id__in=options['item'])
+            unknown = set(options['item']) - {item.item_id for item in items}
+            if unknown:
+                raise CommandError(f"No PlaidItem with item_id {', '.join(sorted(unknown))}.")
+        backfills = [get_backfill(item, options['days'], options['restart']) for item in items]
+        pending = [backfill for backfill in backfills if backfill.completed_at is None]
+        if not pending:
+            self.stdout.write("Nothing to backfill.")
+            return
+        self.stdout.write(f"Backfilling {len(pending)} items, {options['concurrency']} at a time...")
+
+        def report(backfill, result, error):
+            item = backfill.plaid_item
+            if error is not None:
+                self.stderr.write(self.style.ERROR(f"{item}: {error}"))
+            elif backfill.completed_at is not None:
+                self.stdout.write(f"{item}: done, {backfill.stored} transactions stored.")
+            else:
+                self.stdout.write(f"{item}: {backfill.offset}/{backfill.total} ({result}).")
+
+        started = time.perf_counter()
+        completed, failed = run_backfills(
+            pending, concurrency=options['concurrency'], page_size=options['page_size'], report=report,
+        )
+        stored = sum(backfill.stored for backfill in completed)
+        message = f"Backfilled {len(completed)} items ({stored} transactions) in {time.perf_counter() - started:.1f}s."
+        if failed:
+            raise CommandError(f"{message} {len(failed)} failed; run again to resume them.")
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models.functions import Lower
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from core.authentication import CachedJWTAuthentication, principal_key
+from core.fake_plaid import FakePlaidClient
+from core.management.commands.run_benchmarks import Dataset
+import time
+
+ENDPOINTS = ['/api/core/protected-data/', '/api/core/transactions/', '/api/core/summary/']
+
+
+class Command(BaseCommand):
+    help = ('Compares queries and latency per authenticated request with simplejwt\'s JWTAuthentication (a User '
+            'lookup per request) and CachedJWTAuthentication (cached principals), and shows the query plan of '
+            'the registration email check. After the first request the endpoints answer from the response cache, so '
+            'what is left is mostly authentication. Nothing is kept in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and authentication class.')
+
+    def handle(self, *args, **options):
+        strategies = [('JWTAuthentication', JWTAuthentication), ('CachedJWTAuthentication', CachedJWTAuthentication)]
+        original = APIView.authentication_classes
+        with transaction.atomic():
+            dataset = Dataset(users=1, items=1, transactions=200)
+            user = dataset.users[0]
+            client = Client(HTTP_AUTHORIZATION=f'Bearer {dataset.tokens[0]}')
+            self.stdout.write(f"{'endpoint':<28}  {'authentication':<24}  {'queries/request':>15}  {'mean':>8}")
+            try:
+                for path in ENDPOINTS:
+                    for label, authentication_class in strategies:
+                        # Views that don't set authentication_classes inherit APIView's.
+                        APIView.authentication_classes = [authentication_class]
+                        cache.delete(principal_key(user.pk))
+                        queries, elapsed = self.run(client, path, options['requests'])
+                        self.stdout.write(
+                            f"{path:<28}  {label:<24}  {queries / options['requests']:>15.2f}  "
+                            f"{elapsed / options['requests'] * 1000:>6.2f}ms"
+                        )
+            finally:
+                APIView.authentication_classes = original
+
+            email_check = User.objects.alias(email_lower=Lower('email')).filter(email_lower=user.email)
+            self.stdout.write("\nRegistration email check (UserSerializer.validate_email):")
+            self.stdout.write(email_check.explain())
+            transaction.set_rollback(True)
+        FakePlaidClient.reset()
+        self.stdout.write(self.style.SUCCESS("Benchmark complete."))
+
+    def run(self, client, path, requests):
+        """Sends ``requests`` GETs to ``path``; returns (queries, seconds) for all of them."""
+        if client.get(path).status_code != 200:
+            raise CommandError(f"GET {path} failed.")
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get(path)
+            elapsed = time.perf_counter() - started
+        return len(captured), elapsed
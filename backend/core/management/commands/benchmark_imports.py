@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.management.commands.run_benchmarks import percentile
+import json
+import os
+import subprocess
+import sys
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'core', 'management', 'commands', 'import_baseline.json')
+
+# What each target imports, run in a fresh interpreter with -X importtime.
+TARGETS = {
+    # A web worker up to its first request: the WSGI app and the URLconf with every view.
+    'worker': (
+        "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fininsight_ai_backend.settings'); "
+        "import fininsight_ai_backend.wsgi; from django.urls import get_resolver; get_resolver().url_patterns"
+    ),
+    # Every manage.py command pays this before doing its own work (entrypoint.sh runs two).
+    'manage': (
+        "import os, sys; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fininsight_ai_backend.settings'); "
+        "sys.argv = ['manage.py', 'check']; from django.core.management import execute_from_command_line; "
+        "execute_from_command_line(sys.argv)"
+    ),
+}
+# Loaded on first use only; importing any of them at startup is a regression.
+LAZY_MODULES = tuple(f'{package}.' for package in ('plaid.api', 'plaid.model', 'sklearn', 'pandas', 'joblib', 'scipy'))
+
+
+def parse_importtime(output):
+    """``(total seconds, {module: self seconds})`` from -X importtime's stderr."""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(self_us) / 1e6
+    return sum(modules.values()), modules
+
+
+class Command(BaseCommand):
+    help = ('Measures how long starting a web worker and a manage.py command spends importing modules, with '
+            'python -X importtime in fresh interpreters, and lists the packages that cost the most. '
+            '--save-baseline records the results; --check fails if a target got slower than the baseline allows, '
+            'imports many more modules, or imports one of the modules that are meant to load lazily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Interpreters started per target.')
+        parser.add_argument('--top', type=int, default=10, help='Packages to list per target.')
+        parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file.')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline file.')
+        parser.add_argument('--check', action='store_true', help='Fail if a target regressed against the baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='How much slower than the baseline p50 a target may get, as a fraction (0.5 = 50%%).')
+
+    def handle(self, *args, **options):
+        results, regressions = {}, []
+        for name, code in TARGETS.items():
+            # One run first, so .pyc files are written and disk caches are warm.
+            self.import_times(code)
+            runs = sorted((self.import_times(code) for _ in range(options['runs'])), key=lambda run: run[0])
+            total, modules = percentile(runs, 0.5)
+            results[name] = {
+                'runs': options['runs'],
+                'p50_ms': round(total * 1000, 1),
+                'max_ms': round(runs[-1][0] * 1000, 1),
+                'modules': len(modules),
+            }
+            self.stdout.write(
+                f"{name}: {results[name]['p50_ms']:,.0f}ms p50 ({results[name]['max_ms']:,.0f}ms max) "
+                f"importing {len(modules):,} modules"
+            )
+            packages = {}
+            for module, seconds in modules.items():
+                package = module.split('.')[0]
+                packages[package] = packages.get(package, 0) + seconds
+            for package, seconds in sorted(packages.items(), key=lambda entry: -entry[1])[:options['top']]:
+                self.stdout.write(f"  {package:<28} {seconds * 1000:>8,.1f}ms")
+            eager = sorted(module for module in modules if f'{module}.'.startswith(LAZY_MODULES))
+            if eager:
+                regressions.append(f"{name}: imports {', '.join(eager[:5])}{' ...' if len(eager) > 5 else ''} at startup")
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({'targets': results}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"Baseline written to {options['baseline']}.")
+        if options['check']:
+            regressions += self.compare(results, self.load_baseline(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+        elif regressions:
+            self.stderr.write(self.style.WARNING("\n".join(regressions)))
+
+    def import_times(self, code):
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            raise CommandError(f"The import run failed:\n{process.stderr[-2000:]}")
+        return parse_importtime(process.stderr)
+
+    def load_baseline(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read the baseline {path}: {e}")
+
+    def compare(self, results, baseline, tolerance):
+        """Targets whose p50 grew by more than ``tolerance`` or that import over 10% more modules."""
+        regressions = []
+        for name, result in results.items():
+            expected = baseline['targets'].get(name)
+            if expected is None:
+                continue
+            if result['p50_ms'] > expected['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p50 {result['p50_ms']:.0f}ms, baseline {expected['p50_ms']:.0f}ms")
+            if result['modules'] > expected['modules'] * 1.1:
+                regressions.append(f"{name}: {result['modules']} modules imported, baseline {expected['modules']}")
+        return regressions
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import transaction
+from core.fake_plaid import synthetic_transactions
+from core.ingestion import ingest_transactions, prepare_partitions
+from core.models import PlaidItem, Account, Transaction
+import random
+import time
+
+
+def legacy_ingest(item, plaid_transactions):
+    """The original TransactionsView loop: one account lookup and one update_or_create per row."""
+    for plaid_transaction in plaid_transactions:
+        try:
+            account = Account.objects.get(plaid_account_id=plaid_transaction['account_id'])
+            Transaction.objects.update_or_create(
+                plaid_transaction_id=plaid_transaction['transaction_id'],
+                defaults={
+                    'account': account,
+                    'name': plaid_transaction['name'],
+                    'amount': plaid_transaction['amount'],
+                    'iso_currency_code': plaid_transaction['iso_currency_code'],
+                    'date': plaid_transaction['date'],
+                    'pending': plaid_transaction['pending'],
+                }
+            )
+        except Account.DoesNotExist:
+            pass
+
+
+def bulk_ingest(item, plaid_transactions, page_size=500):
+    """The sync pipeline: pages of SYNC_PAGE_SIZE rows through ingest_transactions."""
+    for start in range(0, len(plaid_transactions), page_size):
+        page = plaid_transactions[start:start + page_size]
+        prepare_partitions(page)
+        ingest_transactions(item, page)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks transaction ingestion (per-row update_or_create vs. bulk upsert) on synthetic data. Nothing is kept in the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Dataset sizes to ingest.')
+        parser.add_argument('--page-size', type=int, default=500, help='Rows per page for the bulk pipeline.')
+        parser.add_argument('--skip-legacy', action='store_true', help='Only run the bulk pipeline (the per-row loop is slow on big datasets).')
+
+    def handle(self, *args, **options):
+        strategies = [('bulk', lambda item, rows: bulk_ingest(item, rows, options['page_size']))]
+        if not options['skip_legacy']:
+            strategies.insert(0, ('per-row', legacy_ingest))
+
+        self.stdout.write(f"{'rows':>8}  {'strategy':<8}  {'initial load':>16}  {'re-sync':>16}")
+        for row_count in options['rows']:
+            for label, ingest in strategies:
+                initial, resync = self.run_once(ingest, row_count)
+                self.stdout.write(
+                    f"{row_count:>8}  {label:<8}  {row_count / initial:>10,.0f} rows/s  {row_count / resync:>10,.0f} rows/s"
+                )
+        self.stdout.write(self.style.SUCCESS("Benchmark complete."))
+
+    def run_once(self, ingest, row_count):
+        """Times a first load and an unchanged re-sync of ``row_count`` rows, then rolls everything back."""
+        with transaction.atomic():
+            user = User.objects.create_user(username=f'benchmark_{random.getrandbits(32):08x}')
+            item = PlaidItem.objects.create(user=user, access_token=f'bench-{user.username}', item_id=f'bench-{user.username}')
+            account_ids = [f'{item.item_id}-acc-{index}' for index in range(3)]
+            for account_id in account_ids:
+                Account.objects.create(plaid_item=item, plaid_account_id=account_id, name=account_id)
+            rows = list(synthetic_transactions(account_ids, row_count, days=730, id_prefix=f'{item.item_id}-txn'))
+
+            started = time.perf_counter()
+            ingest(item, rows)
+            initial = time.perf_counter() - started
+
+            started = time.perf_counter()
+            ingest(item, rows)
+            resync = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+        return initial, resync
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from plaid import ApiException
+from core.plaid_client import build_plaid_client, plaid_client_stats
+import itertools
+import json
+import threading
+import time
+
+CATEGORIES = {
+    'categories': [{'category_id': '13005000', 'group': 'place', 'hierarchy': ['Food and Drink', 'Restaurants']}],
+    'request_id': 'stub',
+}
+
+
+def start_stub_server(latency, fail_every, responses=None, fail_status=429):
+    """
+    A keep-alive HTTP server on a free local port that answers POSTs to the
+    paths in ``responses`` with that JSON body and anything else like
+    /categories/get, after ``latency`` seconds, and with a ``fail_status`` error
+    for every ``fail_every``-th request (0 for never). Returns the server; stop it with shutdown().
+    """
+    responses = responses or {}
+    counter = itertools.count(1)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(latency)
+            if fail_every and next(counter) % fail_every == 0:
+                status, body = fail_status, (
+                    {'error_type': 'RATE_LIMIT_EXCEEDED', 'error_code': 'RATE_LIMIT', 'request_id': 'stub'} if fail_status == 429
+                    else {'error_type': 'API_ERROR', 'error_code': 'INTERNAL_SERVER_ERROR', 'request_id': 'stub'}
+                )
+            else:
+                status, body = 200, responses.get(self.path, CATEGORIES)
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks a new Plaid client per call vs. the pooled client against a local stub server, '
+            'and reports connection reuse and retries. Makes no calls to Plaid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=500, help='API calls per strategy.')
+        parser.add_argument('--threads', type=int, default=8, help='Calls in flight at once.')
+        parser.add_argument('--latency', type=float, default=0.005, help='Seconds the stub server takes per response.')
+        parser.add_argument('--fail-every', type=int, default=0,
+                            help='Answer every Nth request with a 429 to exercise the retries (0 for never).')
+
+    def handle(self, *args, **options):
+        server = start_stub_server(options['latency'], options['fail_every'])
+        host = f'http://127.0.0.1:{server.server_address[1]}'
+        # The stub has no rate limit to protect, and queuing would hide the difference being measured.
+        no_rate_limit = override_settings(PLAID_RATE_LIMIT_PER_MINUTE=0, PLAID_ITEM_RATE_LIMIT_PER_MINUTE=0)
+        no_rate_limit.enable()
+        try:
+            shared = build_plaid_client(host)
+            strategies = [
+                ('per call', lambda: build_plaid_client(host)),
+                ('pooled', lambda: shared),
+            ]
+            self.stdout.write(f"{'strategy':<10}  {'throughput':>14}  {'connections':>11}  {'reused':>7}  {'retries':>7}  {'failed':>6}")
+            total_retries = 0
+            for label, get_client in strategies:
+                clients = []
+                retries_before = sum(plaid_client_stats(shared)['retries'].values())
+
+                def call(_):
+                    client = get_client()
+                    clients.append(client)
+                    try:
+                        client.categories_get({})
+                        return True
+                    except ApiException:
+                        return False
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                    results = list(executor.map(call, range(options['calls'])))
+                elapsed = time.perf_counter() - started
+                retries = sum(plaid_client_stats(shared)['retries'].values()) - retries_before
+                total_retries += retries
+
+                connections = reused = 0
+                for client in {id(client): client for client in clients}.values():
+                    stats = plaid_client_stats(client)
+                    connections += stats['connections']
+                    reused += stats['reused']
+                self.stdout.write(
+                    f"{label:<10}  {options['calls'] / elapsed:>8,.0f} req/s  {connections:>11,}  {reused:>7,}  {retries:>7,}  {results.count(False):>6,}"
+                )
+        finally:
+            no_rate_limit.disable()
+            server.shutdown()
+            server.server_close()
+
+        if options['fail_every'] and not total_retries:
+            raise CommandError("The stub server sent 429s but nothing was retried.")
+        self.stdout.write(self.style.SUCCESS("Benchmark complete."))
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from core.fake_plaid import synthetic_transactions
+from core.ingestion import ingest_transactions, prepare_partitions
+from core.models import PlaidItem, Account, Transaction
+from core.serializers import FastTransactionSerializer, TransactionSerializer
+from core import serializers
+import gc
+import random
+import time
+import tracemalloc
+
+
+def drf_render(queryset):
+    """The original path: model instances through TransactionSerializer and JSONRenderer."""
+    return JSONRenderer().render(TransactionSerializer(list(queryset), many=True).data)
+
+
+def fast_render(queryset):
+    """values_list() tuples through FastTransactionSerializer."""
+    fast = FastTransactionSerializer()
+    return fast.render(list(fast.values(queryset)))
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks rendering transactions with TransactionSerializer vs. FastTransactionSerializer '
+            '(rows/s and peak memory allocated) and checks the output is byte-identical. Nothing is kept in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help='Response sizes to render.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best one is reported.')
+
+    def handle(self, *args, **options):
+        strategies = [('drf', drf_render), ('fast', fast_render)]
+        if serializers.orjson is not None:
+            def fast_stdlib(queryset):
+                orjson, serializers.orjson = serializers.orjson, None
+                try:
+                    return fast_render(queryset)
+                finally:
+                    serializers.orjson = orjson
+            strategies.append(('fast/json', fast_stdlib))
+
+        with transaction.atomic():
+            queryset = self.seed(max(options['rows']))
+            self.stdout.write(f"{'rows':>8}  {'strategy':<10}  {'throughput':>16}  {'peak alloc':>12}")
+            for row_count in options['rows']:
+                page = queryset.order_by('-date', '-id')[:row_count]
+                expected = drf_render(page)
+                for label, render in strategies:
+                    if render(page.all()) != expected:
+                        raise CommandError(f"{label} output differs from TransactionSerializer for {row_count} rows.")
+                    elapsed = min(self.time(render, page) for _ in range(options['repeat']))
+                    peak = self.peak_memory(render, page)
+                    self.stdout.write(
+                        f"{row_count:>8}  {label:<10}  {row_count / elapsed:>10,.0f} rows/s  {peak / 1024:>9,.0f} KB"
+                    )
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("Benchmark complete. All outputs are byte-identical."))
+
+    def time(self, render, queryset):
+        gc.collect()
+        started = time.perf_counter()
+        # .all() clones the queryset, so every run queries the database instead of reusing a result cache.
+        render(queryset.all())
+        return time.perf_counter() - started
+
+    def peak_memory(self, render, queryset):
+        """Peak bytes allocated by Python while rendering (tracemalloc)."""
+        tracemalloc.start()
+        try:
+            render(queryset.all())
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def seed(self, row_count):
+        user = User.objects.create_user(username=f'benchmark_{random.getrandbits(32):08x}')
+        item = PlaidItem.objects.create(user=user, access_token=f'bench-{user.username}', item_id=f'bench-{user.username}')
+        account_ids = [f'{item.item_id}-acc-{index}' for index in range(3)]
+        for account_id in account_ids:
+            Account.objects.create(plaid_item=item, plaid_account_id=account_id, name=account_id)
+        plaid_transactions = list(synthetic_transactions(account_ids, row_count, days=730, id_prefix=f'{item.item_id}-txn'))
+        prepare_partitions(plaid_transactions)
+        ingest_transactions(item, plaid_transactions)
+        return Transaction.objects.filter(account__plaid_item=item)
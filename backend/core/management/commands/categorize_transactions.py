@@ -1,48 +1,174 @@
-from django.core.management.base import BaseCommand
-from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from core.classifier import (
+    MODEL_PATH, cache_stats, file_version, get_model, get_model_version, predict_categories, write_categories,
+)
 from core.models import Transaction
-import joblib
-import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+import multiprocessing
+import time
+
+# The model loaded by each worker process in --workers mode (see init_worker).
+_worker_model = None
+_worker_model_version = None
+
+
+def init_worker():
+    """
+    Runs once in every worker process.
+
+    The model is memory-mapped (the file is written uncompressed by
+    train_classifier), so its numpy arrays - the IDF weights and the SVM
+    coefficients - are shared through the page cache instead of being copied
+    into each worker.
+    """
+    global _worker_model, _worker_model_version
+    import joblib
+    _worker_model = joblib.load(MODEL_PATH, mmap_mode='r')
+    _worker_model_version = file_version(MODEL_PATH)
+
+
+def categorize_shard(shard, start_pk, end_pk, batch_size):
+    """
+    Categorizes the uncategorized transactions with start_pk <= pk <= end_pk.
+
+    Every batch is committed on its own, so if a shard dies the work it did
+    is kept and re-running the command only picks up what is left.
+    """
+    uncategorized = Transaction.objects.filter(category__isnull=True, pk__gte=start_pk, pk__lte=end_pk).order_by('pk')
+    processed = 0
+    last_pk = start_pk - 1
+    started = time.perf_counter()
+    while True:
+        batch = list(uncategorized.filter(pk__gt=last_pk).values_list('pk', 'name')[:batch_size])
+        if not batch:
+            break
+        pks, names = zip(*batch)
+        write_categories(pks, predict_categories(names, model=_worker_model, version=_worker_model_version))
+        processed += len(batch)
+        last_pk = pks[-1]
+    connections.close_all()
+    return shard, processed, time.perf_counter() - started, cache_stats()
+
 
 class Command(BaseCommand):
     help = 'Categorizes uncategorized transactions using the trained model.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Transactions to predict and write per batch.')
+        parser.add_argument('--limit', type=int, help='Stop after categorizing this many transactions (single process only).')
+        parser.add_argument('--workers', type=int, default=1, help='Split the work by primary-key range across this many processes.')
+
     def handle(self, *args, **options):
         self.stdout.write("Starting transaction categorization...")
 
-        # Define the path to the saved model
-        model_path = os.path.join(settings.BASE_DIR, 'core', 'ml_models', 'transaction_classifier.joblib')
-
-        # 1. Load the trained model
+        # 1. Load the trained model once, up front: without one every batch would fail.
         try:
-            model = joblib.load(model_path)
-            self.stdout.write("Successfully loaded the classifier model.")
-        except FileNotFoundError:
-            self.stderr.write(self.style.ERROR("Model file not found. Please train the classifier first by running 'python manage.py train_classifier'."))
-            return
+            model = get_model()
+        except Exception as e:
+            raise CommandError(f"Could not load the classifier model from {MODEL_PATH}: {e}") from e
+        if model is None:
+            raise CommandError("Model file not found. Please train the classifier first by running 'python manage.py train_classifier'.")
+        self.stdout.write("Successfully loaded the classifier model.")
+
+        if options['workers'] > 1:
+            self.handle_parallel(options['workers'], options['batch_size'])
+        else:
+            self.handle_single(options['batch_size'], options['limit'], model, get_model_version())
+
+    def handle_single(self, batch_size, limit, model, version):
 
         # 2. Find all transactions that are not yet categorized
         # We check for category being null or an empty list if you use JSONField
-        uncategorized_transactions = Transaction.objects.filter(category__isnull=True)
-        
-        if not uncategorized_transactions.exists():
+        uncategorized_transactions = Transaction.objects.filter(category__isnull=True).order_by('pk')
+        total = uncategorized_transactions.count()
+        if limit is not None:
+            total = min(total, limit)
+            uncategorized_transactions = uncategorized_transactions[:limit]
+
+        if not total:
             self.stdout.write(self.style.SUCCESS("No uncategorized transactions found."))
             return
-            
-        self.stdout.write(f"Found {uncategorized_transactions.count()} uncategorized transactions. Predicting categories...")
 
-        # 3. Loop through transactions, predict, and update
+        self.stdout.write(f"Found {total} uncategorized transactions. Predicting categories in batches of {batch_size}...")
+
+        # 3. Stream (pk, name) pairs from a server-side cursor, predict a whole batch
+        # (merchants already in the memo cache skip the model) and write it back
+        # with a single UPDATE (write_categories). Only one batch is ever held in memory.
+        rows = uncategorized_transactions.values_list('pk', 'name').iterator(chunk_size=batch_size)
         updated_count = 0
-        for transaction in uncategorized_transactions:
-            # The model expects a list of strings for prediction
-            predicted_category_array = model.predict([transaction.name])
-            
-            # The result is an array, so we take the first element
-            predicted_category = predicted_category_array[0]
-            
-            # To match Plaid's format, we save it as a list with one item
-            transaction.category = [predicted_category]
-            transaction.save()
-            updated_count += 1
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully categorized and updated {updated_count} transactions."))
\ No newline at end of file
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            pks, names = zip(*batch)
+            write_categories(pks, predict_categories(names, model=model, version=version))
+            updated_count += len(batch)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {updated_count}/{total} categorized ({updated_count / elapsed:,.0f} rows/s)")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully categorized and updated {updated_count} transactions in {elapsed:.1f}s "
+            f"({updated_count / elapsed:,.0f} rows/s)."
+        ))
+        self.write_cache_stats(cache_stats())
+
+    def write_cache_stats(self, stats):
+        self.stdout.write(
+            f"Merchant cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)."
+        )
+
+    def handle_parallel(self, workers, batch_size):
+        bounds = Transaction.objects.filter(category__isnull=True).aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            self.stdout.write(self.style.SUCCESS("No uncategorized transactions found."))
+            return
+
+        # Equal-width primary-key ranges. Rows are inserted in roughly
+        # chronological order, so this spreads the work evenly enough.
+        width = (bounds['high'] - bounds['low']) // workers + 1
+        shards = [
+            (shard, bounds['low'] + shard * width, min(bounds['low'] + (shard + 1) * width - 1, bounds['high']))
+            for shard in range(workers)
+        ]
+        self.stdout.write(f"Categorizing pk {bounds['low']}..{bounds['high']} in {workers} shards...")
+
+        # Don't let the workers inherit this process's database connection.
+        connections.close_all()
+        started = time.perf_counter()
+        total = 0
+        stats = {'hits': 0, 'misses': 0}
+        failed = []
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('fork'), initializer=init_worker
+        ) as executor:
+            futures = {executor.submit(categorize_shard, *shard, batch_size): shard for shard in shards}
+            for future in as_completed(futures):
+                shard, start_pk, end_pk = futures[future]
+                try:
+                    _, processed, elapsed, shard_stats = future.result()
+                except Exception as e:
+                    failed.append(shard)
+                    self.stderr.write(self.style.ERROR(f"  shard {shard} (pk {start_pk}..{end_pk}) failed: {e}"))
+                    continue
+                total += processed
+                stats['hits'] += shard_stats['hits']
+                stats['misses'] += shard_stats['misses']
+                rate = processed / elapsed if elapsed else 0
+                self.stdout.write(f"  shard {shard} (pk {start_pk}..{end_pk}): {processed} categorized in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully categorized and updated {total} transactions in {elapsed:.1f}s "
+            f"({total / elapsed:,.0f} rows/s across {workers} workers)."
+        ))
+        lookups = stats['hits'] + stats['misses']
+        self.write_cache_stats(dict(stats, hit_rate=stats['hits'] / lookups if lookups else 0.0))
+        if failed:
+            self.stderr.write(self.style.ERROR(
+                f"{len(failed)} shards failed. Their finished batches are saved; run the command again to finish the rest."
+            ))
@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.http import QueryDict
+from core.models import PlaidItem, Account, Transaction
+from core.transaction_queries import filter_transactions
+from datetime import date, timedelta
+import json
+
+CATEGORIES = ['Food and Drink', 'Travel', 'Shops', 'Service', 'Transfer']
+# About 0.5% of rows. The GIN index is for selective lookups like this one; for
+# a category on a sixth of the table, a seq scan is the better plan.
+RARE_CATEGORY = 'Healthcare'
+
+
+def plan_nodes(node):
+    """Yields every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def check_plan(queryset, index_name):
+    """
+    EXPLAINs ``queryset``. Returns ``(ok, indexes used, plan)``; ok means it
+    uses ``index_name`` and doesn't seq-scan core_transaction.
+    """
+    plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+    nodes = list(plan_nodes(plan))
+    seq_scans = [n for n in nodes if n['Node Type'] == 'Seq Scan' and n.get('Relation Name') == 'core_transaction']
+    used = {n.get('Index Name') for n in nodes if 'Index' in n['Node Type']} - {None}
+    return not seq_scans and index_name in used, used, plan
+
+
+def queries(user):
+    """The queries the app runs most, with the index each one is expected to use."""
+    today = date.today()
+    user_transactions = Transaction.objects.filter(
+        account__plaid_item__user=user, date__gte=today - timedelta(days=30), date__lte=today
+    )
+    return [
+        ('transactions page', user_transactions.order_by('-date', '-id')[:501], 'core_txn_account_date_id_idx'),
+        ('transactions page, category filter',
+         filter_transactions(user_transactions, QueryDict('category=Travel')).order_by('-date', '-id')[:501],
+         'core_txn_account_date_id_idx'),
+        ('all transactions in a category',
+         filter_transactions(Transaction.objects.all(), QueryDict(f'category={RARE_CATEGORY}')).only('id')[:1000],
+         'core_txn_category_gin'),
+        ('uncategorized batch', Transaction.objects.filter(category__isnull=True).order_by('id')[:1000],
+         'core_txn_uncategorized_idx'),
+    ]
+
+
+def seed(user_count, row_count):
+    """Creates users, items and accounts with the ORM and the transactions with one INSERT ... SELECT."""
+    users = User.objects.bulk_create([User(username=f'query_plan_{i}', password='!') for i in range(user_count)])
+    items = PlaidItem.objects.bulk_create([
+        PlaidItem(user=u, access_token=f'query-plan-{u.username}', item_id=f'query-plan-{u.username}') for u in users
+    ])
+    Account.objects.bulk_create([
+        Account(plaid_item=item, plaid_account_id=f'{item.item_id}-{n}', name='Checking') for item in items for n in range(2)
+    ])
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO core_transaction
+                (account_id, plaid_transaction_id, name, amount, iso_currency_code, date, category, pending, created_at)
+            SELECT
+                accounts.ids[1 + (g %% accounts.n)],
+                'query-plan-' || g,
+                'MERCHANT ' || (g %% 500),
+                (g %% 25000) / 100.0,
+                'USD',
+                current_date - (g %% 730),
+                -- About 2%% of rows are still waiting for categorize_transactions.
+                CASE WHEN g %% 50 = 0 THEN NULL
+                     WHEN g %% 199 = 0 THEN jsonb_build_array(%s::text)
+                     ELSE jsonb_build_array((%s::text[])[1 + g %% %s]) END,
+                false,
+                now()
+            FROM generate_series(1, %s) AS g,
+                 (SELECT array_agg(id) AS ids, count(*) AS n FROM core_account WHERE plaid_account_id LIKE 'query-plan-%%') AS accounts
+        """, [RARE_CATEGORY, CATEGORIES, len(CATEGORIES), row_count])
+        cursor.execute("ANALYZE core_transaction")
+        cursor.execute("ANALYZE core_account")
+        cursor.execute("ANALYZE core_plaiditem")
+    return users[0]
+
+
+class Command(BaseCommand):
+    help = ('Seeds a large synthetic dataset, runs EXPLAIN on the hot Transaction queries and fails '
+            'if any of them stops using its index. Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help='Transactions to seed.')
+        parser.add_argument('--users', type=int, default=1000, help='Users to spread them across (2 accounts each).')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan of every query.')
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['rows']:,} transactions across {options['users']:,} users...")
+            user = seed(options['users'], options['rows'])
+            for label, queryset, index_name in queries(user):
+                ok, used, plan = check_plan(queryset, index_name)
+                self.stdout.write(f"{'OK  ' if ok else 'FAIL'} {label}: indexes used {sorted(used) or 'none'}")
+                if options['verbose_plans'] or not ok:
+                    self.stdout.write(json.dumps(plan, indent=2))
+                if not ok:
+                    failures.append(label)
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries are not using their index: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use index scans."))
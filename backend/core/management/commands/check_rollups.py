@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.rollups import find_inconsistencies, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = ('Checks the spending rollups against the raw transactions (and the month rollups against the day '
+            'rollups). Exits with an error if any disagree; --fix recomputes the ones that do.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Report at most this many mismatches.')
+        parser.add_argument('--fix', action='store_true', help='Recompute the mismatched buckets.')
+
+    def handle(self, *args, **options):
+        mismatches = find_inconsistencies(limit=options['limit'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Spending rollups match the transactions."))
+            return
+
+        for period, account_id, period_start, category, expected, actual in mismatches:
+            self.stdout.write(
+                f"  {period} {period_start} account {account_id} {category!r}: "
+                f"expected (total, spend, count) {expected}, stored {actual}"
+            )
+        if options['fix']:
+            # Refreshing any day of a month recomputes that month too.
+            refresh_rollups((account_id, period_start) for _, account_id, period_start, *_ in mismatches)
+            remaining = find_inconsistencies(limit=options['limit'])
+            if not remaining:
+                self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatches)} mismatched rollups."))
+                return
+            mismatches = remaining
+        raise CommandError(f"{len(mismatches)} spending rollups do not match the transactions.")
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core.fake_plaid import FakePlaidClient
+from core.management.commands.load_test_servers import free_port, run_load, server_command, wait_until_up
+from core.management.commands.run_benchmarks import Dataset
+import asyncio
+import os
+import statistics
+import subprocess
+import threading
+
+try:
+    import httpx
+except ImportError:  # only needed to generate the load
+    httpx = None
+
+CLIENT_CONNECTIONS = (
+    "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND backend_type = 'client backend'"
+)
+
+
+class Command(BaseCommand):
+    help = ('Load-tests GET /api/core/transactions/ under Gunicorn (WSGI) and Uvicorn (ASGI) with each '
+            'DB_CONNECTION_MODE, and compares requests/s, latency and the most Postgres connections open at once. '
+            'The response cache is off, so every request reads the database. Needs gunicorn, uvicorn and httpx; '
+            'the generated user is deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run.')
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions in the generated dataset.')
+        parser.add_argument('--wsgi-workers', type=int, default=4, help='Gunicorn sync workers.')
+        parser.add_argument('--asgi-workers', type=int, default=1, help='Uvicorn workers.')
+
+    def handle(self, *args, **options):
+        if httpx is None:
+            raise CommandError("The load generator needs httpx (pip install httpx).")
+
+        # Committed, since the servers read it from their own connections.
+        dataset = Dataset(users=1, items=1, transactions=options['transactions'])
+        env = {**os.environ, 'RESPONSE_CACHE_SECONDS': '0'}
+        runs = [
+            ('wsgi', 'none', options['wsgi_workers']),
+            ('wsgi', 'persistent', options['wsgi_workers']),
+            ('asgi', 'none', options['asgi_workers']),
+            ('asgi', 'pool', options['asgi_workers']),
+        ]
+        self.stdout.write(
+            f"{'server':<6}  {'connections':<11}  {'throughput':>14}  {'p50':>8}  {'p95':>8}  {'errors':>6}  "
+            f"{'peak Postgres connections':>25}"
+        )
+        try:
+            for mode, connection_mode, workers in runs:
+                port = free_port()
+                process = subprocess.Popen(
+                    server_command(mode, port, workers), cwd=settings.BASE_DIR,
+                    env={**env, 'SERVER_MODE': mode, 'DB_CONNECTION_MODE': connection_mode},
+                )
+                try:
+                    url = f'http://127.0.0.1:{port}/api/core/'
+                    asyncio.run(wait_until_up(url))
+                    # One warm-up round so imports and first connections aren't counted.
+                    asyncio.run(run_load(url + 'transactions/', dataset.tokens[0], 100, options['concurrency'], 'GET'))
+                    elapsed, latencies, errors, peak = self.run(url + 'transactions/', dataset.tokens[0], options)
+                    latencies.sort()
+                    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+                    self.stdout.write(
+                        f"{mode:<6}  {connection_mode:<11}  {options['requests'] / elapsed:>8,.0f} req/s  "
+                        f"{statistics.median(latencies or [0]) * 1000:>6,.1f}ms  {p95 * 1000:>6,.1f}ms  "
+                        f"{errors:>6,}  {peak:>25,}"
+                    )
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+        finally:
+            for user in dataset.users:
+                user.delete()
+            FakePlaidClient.reset()
+        self.stdout.write(self.style.SUCCESS("Load test complete."))
+
+    def run(self, url, token, options):
+        """One load run; also returns the most client connections Postgres had open during it (ours included)."""
+        peak = [0]
+        sampling = threading.Event()
+
+        def sample():
+            try:
+                with connection.cursor() as cursor:
+                    while not sampling.wait(0.02):
+                        cursor.execute(CLIENT_CONNECTIONS)
+                        peak[0] = max(peak[0], cursor.fetchone()[0])
+            finally:
+                connection.close()
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        try:
+            elapsed, latencies, errors = asyncio.run(
+                run_load(url, token, options['requests'], options['concurrency'], 'GET')
+            )
+        finally:
+            sampling.set()
+            sampler.join()
+        return elapsed, latencies, errors, peak[0]
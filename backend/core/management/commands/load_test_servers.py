@@ -0,0 +1,184 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+from core.management.commands.benchmark_plaid_client import start_stub_server
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import httpx
+except ImportError:  # only needed to generate the load
+    httpx = None
+
+LINK_TOKEN = {'link_token': 'link-sandbox-stub', 'expiration': '2030-01-01T00:00:00Z', 'request_id': 'stub'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss(pid):
+    """Resident memory in bytes of ``pid`` and all its descendants, from /proc."""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name is in parentheses and may contain spaces.
+                    parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent and child not in tree]
+        tree.update(children)
+        frontier.extend(children)
+    total = 0
+    for member in tree:
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+
+def server_command(mode, port, workers):
+    """The command line for Gunicorn (``mode`` 'wsgi') or Uvicorn ('asgi') on 127.0.0.1:``port``."""
+    if mode == 'wsgi':
+        command = ['gunicorn', 'fininsight_ai_backend.wsgi:application', '--workers', str(workers),
+                   '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    else:
+        command = ['uvicorn', 'fininsight_ai_backend.asgi:application', '--workers', str(workers),
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    return [sys.executable, '-m'] + command
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise CommandError(f"Server at {url} did not start within {timeout}s.")
+
+
+async def run_load(url, token, total, concurrency, method='POST'):
+    """Sends ``total`` requests with ``concurrency`` in flight. Returns (elapsed, latencies, errors)."""
+    latencies, errors = [], 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120, headers={'Authorization': f'Bearer {token}'}) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, json={} if method == 'POST' else None)
+                    ok = response.status_code == 200
+                except httpx.TransportError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+
+class Command(BaseCommand):
+    help = ('Load-tests POST /api/core/create-link-token/ under Gunicorn (WSGI, sync views) and Uvicorn (ASGI, '
+            'async views) against a local stub Plaid server, and compares requests/s, latency and memory per '
+            'concurrent request. Needs gunicorn, uvicorn and httpx; makes no calls to Plaid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[50, 200], help='Requests in flight at once.')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per run.')
+        parser.add_argument('--latency', type=float, default=0.2, help='Seconds the stub Plaid server takes per call.')
+        parser.add_argument('--wsgi-workers', type=int, default=4, help='Gunicorn sync workers.')
+        parser.add_argument('--asgi-workers', type=int, default=1, help='Uvicorn workers.')
+
+    def handle(self, *args, **options):
+        if httpx is None:
+            raise CommandError("The load generator needs httpx (pip install httpx).")
+
+        stub = start_stub_server(options['latency'], 0, responses={'/link/token/create': LINK_TOKEN})
+        user = User.objects.create_user(username=f'loadtest_{random.getrandbits(32):08x}')
+        token = str(RefreshToken.for_user(user).access_token)
+        env = {
+            **os.environ,
+            'PLAID_HOST': f'http://127.0.0.1:{stub.server_address[1]}',
+            'PLAID_ENV': 'sandbox',
+            'PLAID_CLIENT_ID': settings.PLAID_CLIENT_ID or 'load-test',
+            'PLAID_SANDBOX_SECRET': settings.PLAID_SANDBOX_SECRET or 'load-test',
+            # Measure the servers, not our own rate limiter.
+            'PLAID_RATE_LIMIT_PER_MINUTE': '0',
+            'PLAID_POOL_MAXSIZE': str(max(options['concurrency'])),
+        }
+        servers = [('wsgi', options['wsgi_workers']), ('asgi', options['asgi_workers'])]
+        self.stdout.write(
+            f"{'server':<6}  {'concurrency':>11}  {'throughput':>14}  {'p50':>8}  {'p95':>8}  {'errors':>6}  "
+            f"{'idle RSS':>9}  {'per request':>11}"
+        )
+        try:
+            for mode, workers in servers:
+                port = free_port()
+                process = subprocess.Popen(
+                    server_command(mode, port, workers), cwd=settings.BASE_DIR, env={**env, 'SERVER_MODE': mode},
+                )
+                try:
+                    url = f'http://127.0.0.1:{port}/api/core/'
+                    asyncio.run(wait_until_up(url))
+                    # One warm-up round so imports and connections aren't counted.
+                    asyncio.run(run_load(url + 'create-link-token/', token, 20, 20))
+                    idle = process_tree_rss(process.pid)
+                    for concurrency in options['concurrency']:
+                        peak = [idle]
+                        sampling = threading.Event()
+
+                        def sample():
+                            while not sampling.wait(0.05):
+                                peak[0] = max(peak[0], process_tree_rss(process.pid))
+
+                        sampler = threading.Thread(target=sample)
+                        sampler.start()
+                        try:
+                            elapsed, latencies, errors = asyncio.run(
+                                run_load(url + 'create-link-token/', token, options['requests'], concurrency)
+                            )
+                        finally:
+                            sampling.set()
+                            sampler.join()
+                        latencies.sort()
+                        p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+                        self.stdout.write(
+                            f"{mode:<6}  {concurrency:>11,}  {options['requests'] / elapsed:>8,.0f} req/s  "
+                            f"{statistics.median(latencies or [0]) * 1000:>6,.0f}ms  {p95 * 1000:>6,.0f}ms  {errors:>6,}  "
+                            f"{idle / 2 ** 20:>6,.0f} MB  {(peak[0] - idle) / concurrency / 1024:>8,.0f} KB"
+                        )
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+        finally:
+            stub.shutdown()
+            user.delete()
+        self.stdout.write(self.style.SUCCESS("Load test complete."))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.partitions import TABLE, ensure_future_partitions, rebuild_table, table_state
+from core.models import TransactionArchive
+import time
+
+
+class Command(BaseCommand):
+    help = ('Converts the transactions table into one partitioned by month on date, copying every row, and creates '
+            'partitions TRANSACTION_PARTITION_MONTHS_AHEAD months ahead. On a partitioned table it only creates '
+            'missing future partitions (the sync worker does this too). --undo converts it back to a plain table. '
+            'The table is locked for the duration of a conversion: stop the web and worker processes first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--undo', action='store_true', help='Convert back to a single, unpartitioned table.')
+
+    def handle(self, *args, **options):
+        partitioned, months = table_state(refresh=True)
+        if options['undo']:
+            if not partitioned:
+                raise CommandError(f"{TABLE} is not partitioned.")
+            if TransactionArchive.objects.exists():
+                raise CommandError("Some months are archived; restore them with archive_transactions --restore first.")
+            self.convert(partitioned=False)
+        elif partitioned:
+            ensure_future_partitions()
+            _, months = table_state(refresh=True)
+            self.stdout.write(self.style.SUCCESS(
+                f"{TABLE} is partitioned: {len(months)} monthly partitions, up to {max(months):%Y-%m}."
+            ))
+        else:
+            self.convert(partitioned=True)
+
+    def convert(self, partitioned):
+        self.stdout.write(f"Rebuilding {TABLE} as a {'partitioned' if partitioned else 'plain'} table...")
+        started = time.perf_counter()
+        rows = rebuild_table(partitioned, settings.TRANSACTION_PARTITION_MONTHS_AHEAD)
+        self.stdout.write(self.style.SUCCESS(f"Copied {rows} transactions in {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from core.rollups import rebuild_rollups
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the spending rollups from the raw transactions, for everyone or for the given users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', help='Only rebuild this username (repeatable).')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['user']:
+            user_ids = list(User.objects.filter(username__in=options['user']).values_list('pk', flat=True))
+            self.stdout.write(f"Rebuilding spending rollups for {len(user_ids)} users...")
+        else:
+            self.stdout.write("Rebuilding all spending rollups...")
+        started = time.perf_counter()
+        written = rebuild_rollups(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup rows in {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.webhooks import handle_webhook
+import json
+import os
+import urllib.error
+import urllib.request
+
+
+class Command(BaseCommand):
+    help = ('Replays recorded Plaid webhook payloads (a JSON object or a list of them per file), either straight '
+            'into the webhook handler or by POSTing them to a running server with --url.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help='Payload files. Defaults to the bundled sample_webhooks.json.')
+        parser.add_argument('--item', help='Send every payload for this Plaid item_id instead of the recorded one.')
+        parser.add_argument('--url', help='POST to this webhook URL, e.g. http://localhost:8000/api/core/plaid-webhook/ '
+                                          '(the server needs PLAID_WEBHOOK_VERIFY=false, since replays are not signed).')
+
+    def handle(self, *args, **options):
+        files = options['files'] or [os.path.join(settings.BASE_DIR, 'core', 'management', 'commands', 'sample_webhooks.json')]
+        payloads = []
+        for path in files:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {path}: {e}")
+            payloads.extend(data if isinstance(data, list) else [data])
+
+        for payload in payloads:
+            if options['item']:
+                payload['item_id'] = options['item']
+            label = f"{payload.get('webhook_type')} {payload.get('webhook_code')}"
+            if options['url']:
+                self.stdout.write(f"{label}: {self.post(options['url'], payload)}")
+            else:
+                self.stdout.write(f"{label}: {handle_webhook(payload)}")
+        self.stdout.write(self.style.SUCCESS(f"Replayed {len(payloads)} webhooks."))
+
+    def post(self, url, payload):
+        request = urllib.request.Request(
+            url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return f"HTTP {response.status} {response.read().decode()}"
+        except urllib.error.HTTPError as e:
+            return f"HTTP {e.code} {e.read().decode()}"
+        except urllib.error.URLError as e:
+            raise CommandError(f"Could not reach {url}: {e.reason}")
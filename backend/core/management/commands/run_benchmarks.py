@@ -0,0 +1,268 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from core.classifier import get_model, predict_categories, write_categories
+from core.fake_plaid import FakePlaidClient
+from core.models import Account, PlaidItem, Transaction
+from core.sync import sync_item
+from core.views import MyTokenObtainPairView, accounts_from_plaid
+from datetime import date, timedelta
+from itertools import count, cycle
+import json
+import os
+import random
+import time
+
+BASELINE_PATH = os.path.join(settings.BASE_DIR, 'core', 'management', 'commands', 'benchmark_baseline.json')
+PASSWORD = 'benchmark-Passw0rd'
+
+
+def percentile(samples, fraction):
+    """The ``fraction`` percentile of sorted ``samples`` (nearest rank)."""
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+class Dataset:
+    """
+    ``users`` users with ``items`` fake Plaid items each, every item synced
+    through FakePlaidClient with ``transactions`` transactions over the last
+    year. Everything lives in the caller's transaction.
+    """
+    def __init__(self, users, items, transactions):
+        self.prefix = f'bench{random.getrandbits(32):08x}'
+        self.plaid_client = FakePlaidClient(transactions_per_item=transactions, days=365)
+        self.transactions_per_item = transactions
+        self.users, self.tokens = [], []
+        self.serial = count()
+        for _ in range(users):
+            user = User.objects.create_user(username=self.next_name(), email=f'{self.next_name()}@example.com', password=PASSWORD)
+            for _ in range(items):
+                sync_item(self.link_item(user), self.plaid_client)
+            self.users.append(user)
+            self.tokens.append(str(RefreshToken.for_user(user).access_token))
+
+    def next_name(self):
+        return f'{self.prefix}_{next(self.serial)}'
+
+    def link_item(self, user):
+        """A new item with its accounts, as SetAccessTokenView would leave it."""
+        name = self.next_name()
+        item = PlaidItem.objects.create(user=user, access_token=f'access-{name}', item_id=f'item-{name}', institution_name=name)
+        accounts = self.plaid_client.accounts_get({'access_token': item.access_token})['accounts']
+        Account.objects.bulk_create(accounts_from_plaid(item, accounts))
+        return item
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks registration, login, the transactions and summary endpoints, ingestion through the fake '
+            'Plaid client and categorization on a generated dataset, reporting p50/p95/p99 latency, throughput '
+            'and queries per operation. --save-baseline records the results; --check fails if a scenario got '
+            'slower than the baseline allows or runs more queries. Nothing is kept in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Users in the generated dataset.')
+        parser.add_argument('--items', type=int, default=2, help='Plaid items per user.')
+        parser.add_argument('--transactions', type=int, default=500, help='Transactions per item.')
+        parser.add_argument('--scenarios', nargs='+', help='Only run these scenarios.')
+        parser.add_argument('--iterations', type=int, help='Timed runs per scenario (default: per scenario).')
+        parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file.')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline file.')
+        parser.add_argument('--check', action='store_true', help='Fail if a scenario regressed against the baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='How much slower than the baseline p95 a scenario may get, as a fraction (0.5 = 50%%).')
+
+    def handle(self, *args, **options):
+        # (name, default iterations, setup). setup(dataset, iterations) returns the operation to time.
+        scenarios = [
+            ('register', 10, self.register),
+            ('login', 10, self.login),
+            ('transactions', 50, self.transactions),
+            ('transactions-cached', 200, self.transactions_cached),
+            ('summary', 50, self.summary),
+            ('ingestion', 10, self.ingestion),
+            ('categorization', 20, self.categorization),
+        ]
+        names = [name for name, _, _ in scenarios]
+        unknown = set(options['scenarios'] or []) - set(names)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Choose from: {', '.join(names)}.")
+        dataset_size = {key: options[key] for key in ('users', 'items', 'transactions')}
+        baseline = None
+        if options['check']:
+            baseline = self.load_baseline(options['baseline'], dataset_size)
+
+        results = {}
+        # Measure our code, not the Plaid rate limiter.
+        no_rate_limit = override_settings(PLAID_RATE_LIMIT_PER_MINUTE=0, PLAID_ITEM_RATE_LIMIT_PER_MINUTE=0)
+        no_rate_limit.enable()
+        try:
+            with transaction.atomic():
+                started = time.perf_counter()
+                dataset = Dataset(**dataset_size)
+                # Fresh statistics, as autovacuum would keep them: without them the planner
+                # takes the new rows for a handful and can pick plans no real table would get.
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE core_plaiditem, core_account, core_transaction, core_spendingrollup")
+                self.stdout.write(
+                    f"Generated {options['users']} users x {options['items']} items x {options['transactions']} "
+                    f"transactions in {time.perf_counter() - started:.1f}s."
+                )
+                self.stdout.write(
+                    f"{'scenario':<20}  {'runs':>5}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'throughput':>13}  {'queries':>7}"
+                )
+                for name, iterations, setup in scenarios:
+                    if options['scenarios'] and name not in options['scenarios']:
+                        continue
+                    iterations = options['iterations'] or iterations
+                    operation = setup(dataset, iterations)
+                    if operation is None:
+                        continue
+                    results[name] = self.measure(operation, iterations)
+                    self.report(name, results[name])
+                transaction.set_rollback(True)
+        finally:
+            no_rate_limit.disable()
+            FakePlaidClient.reset()
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump({'dataset': dataset_size, 'scenarios': results}, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"Baseline written to {options['baseline']}.")
+        if baseline is not None:
+            regressions = self.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+        self.stdout.write(self.style.SUCCESS("Benchmark complete."))
+
+    def measure(self, operation, iterations):
+        """Times ``iterations`` runs of ``operation`` after one warm-up run, counting their queries."""
+        operation()
+        latencies, queries = [], 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                run_started = time.perf_counter()
+                operation()
+                latencies.append(time.perf_counter() - run_started)
+            queries += len(captured)
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'iterations': iterations,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'ops_per_second': round(iterations / elapsed, 1),
+            'queries': round(queries / iterations, 1),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<20}  {result['iterations']:>5}  {result['p50_ms']:>7,.1f}ms  {result['p95_ms']:>7,.1f}ms  "
+            f"{result['p99_ms']:>7,.1f}ms  {result['ops_per_second']:>7,.1f} ops/s  {result['queries']:>7,.1f}"
+        )
+
+    def load_baseline(self, path, dataset_size):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read the baseline {path}: {e}")
+        if baseline.get('dataset') != dataset_size:
+            raise CommandError(
+                f"The baseline was recorded with {baseline.get('dataset')}; run with the same "
+                f"--users/--items/--transactions, or record a new one with --save-baseline."
+            )
+        return baseline
+
+    def compare(self, results, baseline, tolerance):
+        """Scenarios whose p95 grew by more than ``tolerance`` or that run more queries than in the baseline."""
+        regressions = []
+        for name, result in results.items():
+            expected = baseline['scenarios'].get(name)
+            if expected is None:
+                continue
+            if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {result['p95_ms']:.1f}ms, baseline {expected['p95_ms']:.1f}ms")
+            # Averages can move by a fraction when a cache entry expires mid-run; a regression adds whole queries.
+            if result['queries'] >= expected['queries'] + 0.5:
+                regressions.append(f"{name}: {result['queries']:g} queries per run, baseline {expected['queries']:g}")
+        return regressions
+
+    # --- Scenarios ---
+
+    def register(self, dataset, iterations):
+        client = Client()
+
+        def operation():
+            name = dataset.next_name()
+            response = client.post(
+                '/api/core/register/', {'username': name, 'email': f'{name}@example.com', 'password': PASSWORD},
+                content_type='application/json',
+            )
+            assert response.status_code == 201, response.content
+        return operation
+
+    def login(self, dataset, iterations):
+        # MyTokenObtainPairView (/api/token/), called without the middleware to time just the login.
+        view = MyTokenObtainPairView.as_view()
+        factory = RequestFactory()
+        users = cycle(dataset.users)
+
+        def operation():
+            request = factory.post(
+                '/api/token/', {'username': next(users).username, 'password': PASSWORD}, content_type='application/json',
+            )
+            response = view(request)
+            assert response.status_code == 200, response.data
+        return operation
+
+    def api_get(self, dataset, path, cached):
+        """GETs ``path`` as each user in turn, with or without the response cache."""
+        clients = [Client(HTTP_AUTHORIZATION=f'Bearer {token}') for token in dataset.tokens]
+        turns = cycle(clients)
+
+        def operation():
+            with override_settings(RESPONSE_CACHE_SECONDS=settings.RESPONSE_CACHE_SECONDS if cached else 0):
+                response = next(turns).get(path)
+            assert response.status_code == 200, response.content
+        return operation
+
+    def transactions(self, dataset, iterations):
+        return self.api_get(dataset, f'/api/core/transactions/?start_date={date.today() - timedelta(days=365)}', cached=False)
+
+    def transactions_cached(self, dataset, iterations):
+        return self.api_get(dataset, f'/api/core/transactions/?start_date={date.today() - timedelta(days=365)}', cached=True)
+
+    def summary(self, dataset, iterations):
+        return self.api_get(dataset, f'/api/core/summary/?start_date={date.today() - timedelta(days=365)}', cached=False)
+
+    def ingestion(self, dataset, iterations):
+        """A first sync of a new item: every transaction fetched from the fake client and ingested."""
+        # Linked up front (one more for the warm-up run), so only the sync is timed.
+        items = [dataset.link_item(dataset.users[0]) for _ in range(iterations + 1)]
+
+        def operation():
+            sync_item(items.pop(), dataset.plaid_client)
+        return operation
+
+    def categorization(self, dataset, iterations):
+        """Predicting and saving the categories of one page of transactions, as categorize_transactions does."""
+        if get_model() is None:
+            self.stdout.write(f"{'categorization':<20}  skipped: no trained model (run train_classifier)")
+            return None
+        rows = list(
+            Transaction.objects.filter(account__plaid_item__user__in=dataset.users)
+            .order_by('pk').values_list('pk', 'name')[:dataset.transactions_per_item]
+        )
+        pks, names = zip(*rows)
+
+        def operation():
+            write_categories(pks, predict_categories(names))
+        return operation
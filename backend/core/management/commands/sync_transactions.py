@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import PlaidItem
+from core.partitions import ensure_future_partitions
+from core.sync import rate_limit_delay, run_due_syncs, sync_item
+from prometheus_client import start_http_server
+import time
+
+
+class Command(BaseCommand):
+    help = 'Syncs transactions from Plaid for every linked item that is due. Use --loop to run as a worker.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for due items.')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds to sleep between polls in --loop mode.')
+        parser.add_argument('--limit', type=int, default=10, help='Maximum number of items to sync per poll.')
+        parser.add_argument('--item', help='Sync a single item (by Plaid item_id) right now, ignoring its schedule.')
+        parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics (Plaid calls) on this port.')
+
+    def handle(self, *args, **options):
+        if options['item']:
+            try:
+                item = PlaidItem.objects.get(item_id=options['item'])
+            except PlaidItem.DoesNotExist:
+                raise CommandError(f"No PlaidItem with item_id {options['item']}.")
+            result = sync_item(item)
+            if result is None:
+                raise CommandError(f"{item} is already being synced.")
+            self.stdout.write(self.style.SUCCESS(f"Synced {item}: {result}."))
+            return
+
+        if options['metrics_port']:
+            start_http_server(options['metrics_port'])
+        self.stdout.write("Starting transaction sync...")
+        while True:
+            # Next months' partitions, if the transactions table is partitioned.
+            ensure_future_partitions()
+            results = run_due_syncs(limit=options['limit'])
+            for item, result, error in results:
+                if error is None:
+                    self.stdout.write(f"Synced {item}: {result}.")
+                elif rate_limit_delay(error) is not None:
+                    self.stdout.write(f"Rate limited, postponed {item}: {error}")
+                else:
+                    self.stderr.write(self.style.ERROR(f"Sync failed for {item}: {error}"))
+            if not options['loop']:
+                break
+            # Only sleep when the queue is drained; otherwise keep working through the backlog.
+            if len(results) < options['limit']:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS("Transaction sync finished."))
@@ -1,15 +1,67 @@
-import pandas as pd
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.svm import LinearSVC
-from sklearn.pipeline import Pipeline
-import joblib
+from django.core.management.base import BaseCommand, CommandError
+from core.classifier import normalize_merchant_name
+from core.models import Transaction
 import os
+import resource
+import time
+import zlib
+
+
+def is_held_out(key, test_fraction):
+    """Deterministically puts about ``test_fraction`` of the rows in the evaluation set, the same ones every epoch."""
+    return zlib.crc32(key.encode()) % 10000 < test_fraction * 10000
+
+
+def csv_chunks(data_path, chunk_size):
+    """Yields ``(keys, names, labels)`` chunks of the CSV without loading the whole file."""
+    import pandas as pd
+    for df in pd.read_csv(data_path, usecols=['name', 'category'], chunksize=chunk_size):
+        df = df.dropna()
+        # The index keeps counting across chunks, so it identifies the row.
+        yield [f"csv:{i}" for i in df.index], df['name'].tolist(), df['category'].tolist()
+
+
+def db_chunks(chunk_size):
+    """
+    Yields ``(keys, names, labels)`` chunks of categorized transactions from a
+    server-side cursor. The label is the top-level category, which is what
+    categorize_transactions writes.
+    """
+    rows = (
+        Transaction.objects.filter(category__isnull=False).order_by('pk')
+        .values_list('pk', 'name', 'category').iterator(chunk_size=chunk_size)
+    )
+    chunk = ([], [], [])
+    for pk, name, category in rows:
+        if not category or not name:
+            continue
+        chunk[0].append(f"db:{pk}")
+        chunk[1].append(name)
+        chunk[2].append(category[0])
+        if len(chunk[0]) >= chunk_size:
+            yield chunk
+            chunk = ([], [], [])
+    if chunk[0]:
+        yield chunk
+
 
 class Command(BaseCommand):
     help = 'Trains the transaction classifier model.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Stream the training data in chunks into a hashing vectorizer + SGD model (partial_fit) '
+                                 'instead of fitting TF-IDF + LinearSVC in memory. Memory use stays flat with dataset size.')
+        parser.add_argument('--source', choices=['csv', 'db', 'both'], default='csv',
+                            help='Incremental mode: train on the sample CSV, the categorized transactions in the database, or both.')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Incremental mode: rows per partial_fit call.')
+        parser.add_argument('--epochs', type=int, default=5, help='Incremental mode: passes over the training data.')
+        parser.add_argument('--n-features', type=int, default=2 ** 18, help='Incremental mode: hashing vectorizer width.')
+        parser.add_argument('--n-jobs', type=int, default=1, help='Incremental mode: CPUs for the one-vs-rest fits (-1 for all).')
+        parser.add_argument('--test-fraction', type=float, default=0.1,
+                            help='Incremental mode: share of rows held out for the evaluation report (0 to disable).')
+
     def handle(self, *args, **options):
         self.stdout.write("Starting transaction classifier training...")
 
@@ -22,16 +74,46 @@ class Command(BaseCommand):
         os.makedirs(model_path, exist_ok=True)
         model_file = os.path.join(model_path, 'transaction_classifier.joblib')
 
+        started = time.perf_counter()
+        if options['incremental']:
+            pipeline = self.train_incremental(data_path, options)
+        else:
+            pipeline = self.train_in_memory(data_path)
+        if pipeline is None:
+            return
+
+        # 4. Save the trained model to a file
+        # Write to a temporary file and swap it in, so running workers that
+        # hot-reload the model (core/classifier.py) never see a half-written file.
+        tmp_file = f"{model_file}.tmp"
+        import joblib
+        joblib.dump(pipeline, tmp_file)
+        os.replace(tmp_file, model_file)
+        self.stdout.write(self.style.SUCCESS(f"Model saved to {model_file}"))
+        # ru_maxrss is in kilobytes on Linux.
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f"Training took {time.perf_counter() - started:.1f}s, peak memory {peak_mb:,.0f} MB.")
+
+    def train_in_memory(self, data_path):
+        # pandas and scikit-learn take seconds to import, so only the code that trains loads them.
+        import pandas as pd
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.pipeline import Pipeline
+        from sklearn.svm import LinearSVC
+
         # 1. Load the data using pandas
         try:
             df = pd.read_csv(data_path)
             self.stdout.write(f"Successfully loaded {len(df)} training examples.")
         except FileNotFoundError:
             self.stderr.write(self.style.ERROR(f"Training data not found at {data_path}"))
-            return
+            return None
 
         # Prepare the data
-        X = df['name']  # The transaction names (features)
+        # Names are normalized the same way core/classifier.py normalizes them
+        # before predicting, so store numbers, dates and card suffixes don't
+        # become features.
+        X = df['name'].map(normalize_merchant_name)  # The transaction names (features)
         y = df['category']  # The categories (labels)
 
         # 2. Create a machine learning pipeline
@@ -46,7 +128,72 @@ class Command(BaseCommand):
         self.stdout.write("Training model...")
         pipeline.fit(X, y)
         self.stdout.write(self.style.SUCCESS("Model training complete."))
+        return pipeline
 
-        # 4. Save the trained model to a file
-        joblib.dump(pipeline, model_file)
-        self.stdout.write(self.style.SUCCESS(f"Model saved to {model_file}"))
\ No newline at end of file
+    def train_incremental(self, data_path, options):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.metrics import accuracy_score, classification_report
+        from sklearn.pipeline import Pipeline
+
+        chunk_size, test_fraction = options['chunk_size'], options['test_fraction']
+
+        def chunks():
+            if options['source'] in ('csv', 'both'):
+                yield from csv_chunks(data_path, chunk_size)
+            if options['source'] in ('db', 'both'):
+                yield from db_chunks(chunk_size)
+
+        if options['source'] in ('csv', 'both') and not os.path.exists(data_path):
+            raise CommandError(f"Training data not found at {data_path}")
+
+        # 1. partial_fit needs every label up front, so make one cheap pass for them.
+        classes = set()
+        for _, _, labels in chunks():
+            classes.update(labels)
+        if len(classes) < 2:
+            raise CommandError(f"Need at least two categories to train on, found {len(classes)}.")
+        classes = sorted(classes)
+        self.stdout.write(f"Found {len(classes)} categories: {', '.join(classes)}")
+
+        # 2. HashingVectorizer is stateless, so chunks can be transformed
+        # independently and the vocabulary never has to fit in memory.
+        # SGDClassifier with hinge loss is a linear SVM trained online.
+        vectorizer = HashingVectorizer(
+            n_features=options['n_features'], stop_words='english', ngram_range=(1, 2), alternate_sign=False,
+        )
+        classifier = SGDClassifier(loss='hinge', alpha=1e-5, n_jobs=options['n_jobs'], random_state=0)
+
+        # 3. Train, one chunk at a time
+        trained = 0
+        for epoch in range(1, options['epochs'] + 1):
+            trained = 0
+            for keys, names, labels in chunks():
+                rows = [(normalize_merchant_name(n), l) for k, n, l in zip(keys, names, labels) if not is_held_out(k, test_fraction)]
+                if not rows:
+                    continue
+                X, y = zip(*rows)
+                classifier.partial_fit(vectorizer.transform(X), y, classes=classes)
+                trained += len(rows)
+            self.stdout.write(f"  epoch {epoch}/{options['epochs']}: trained on {trained:,} rows")
+        if not trained:
+            raise CommandError("Nothing to train on - every row was held out.")
+        self.stdout.write(self.style.SUCCESS("Model training complete."))
+
+        pipeline = Pipeline([('hashing', vectorizer), ('clf', classifier)])
+
+        # 4. Evaluate on the held-out rows
+        if test_fraction > 0:
+            y_true, y_pred = [], []
+            for keys, names, labels in chunks():
+                held_out = [(normalize_merchant_name(n), l) for k, n, l in zip(keys, names, labels) if is_held_out(k, test_fraction)]
+                if held_out:
+                    X, y = zip(*held_out)
+                    y_true.extend(y)
+                    y_pred.extend(pipeline.predict(X))
+            if y_true:
+                self.stdout.write(f"Held-out evaluation on {len(y_true):,} rows (accuracy {accuracy_score(y_true, y_pred):.3f}):")
+                self.stdout.write(classification_report(y_true, y_pred, zero_division=0))
+            else:
+                self.stdout.write("No rows were held out for evaluation (dataset too small).")
+        return pipeline
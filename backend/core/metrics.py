@@ -0,0 +1,257 @@
+# backend/core/metrics.py
+"""
+Request-level performance metrics, exposed in Prometheus format on /metrics.
+
+MetricsMiddleware times every request and records, per endpoint (the URL
+route, so the label set stays small):
+
+- http_request_duration_seconds: latency, by method and status
+- http_request_db_queries / http_request_db_seconds: queries per request and
+  the time spent in them, counted by a wrapper on every database connection
+- serialization_duration_seconds / rows_returned: for views that report them
+  with timed('serialize') and record_rows()
+
+and plaid_request_duration_seconds times every call the Plaid clients make,
+by endpoint, institution and status, wherever it happens. With
+DB_CONNECTION_MODE=pool, the db_pool_* metrics show how busy each process's
+connection pool is and how often requests had to wait for a connection or
+gave up (DB_POOL_TIMEOUT_SECONDS).
+
+With SERVER_TIMING_HEADERS on, the same per-request numbers go out in a
+Server-Timing header (browsers show them in the network panel), and every
+request is logged as one structured line on the ``core.requests`` logger.
+
+Metrics live in the process that recorded them. Under Gunicorn, set
+PROMETHEUS_MULTIPROC_DIR (entrypoint.sh does) so /metrics adds up all
+workers; the sync worker serves its own with ``sync_transactions --metrics-port``.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+logger = logging.getLogger('core.requests')
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time taken to answer a request.', ['method', 'endpoint', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries run per request.', ['endpoint'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, float('inf')),
+)
+REQUEST_DB_SECONDS = Histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request.', ['endpoint'],
+)
+SERIALIZATION_SECONDS = Histogram(
+    'serialization_duration_seconds', 'Time spent serializing response bodies.', ['endpoint'],
+)
+ROWS_RETURNED = Histogram(
+    'rows_returned', 'Rows returned per response.', ['endpoint'],
+    buckets=(0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')),
+)
+PLAID_LATENCY = Histogram(
+    'plaid_request_duration_seconds', 'Time taken by Plaid API calls, including retries.',
+    ['endpoint', 'institution', 'status'],
+)
+# Gauges are summed over the live processes when PROMETHEUS_MULTIPROC_DIR is set.
+DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'Connections open in the pool.', multiprocess_mode='livesum')
+DB_POOL_AVAILABLE = Gauge('db_pool_available', 'Idle connections in the pool.', multiprocess_mode='livesum')
+DB_POOL_WAITING = Gauge('db_pool_requests_waiting', 'Requests waiting for a connection.', multiprocess_mode='livesum')
+DB_POOL_QUEUED = Counter('db_pool_requests_queued', 'Requests that had to wait for a connection.')
+DB_POOL_WAIT_SECONDS = Counter('db_pool_wait_seconds', 'Time requests spent waiting for a connection.')
+DB_POOL_TIMEOUTS = Counter('db_pool_timeouts', 'Requests that got no connection within DB_POOL_TIMEOUT_SECONDS.')
+
+# The RequestMetrics of the request being handled, if any.
+_current = ContextVar('request_metrics', default=None)
+# The institution the Plaid calls being made are for.
+_institution = ContextVar('plaid_institution', default='none')
+
+
+class RequestMetrics:
+    """What one request spent its time on: ``timings`` maps a name to [seconds, count]."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.rows = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, count=1):
+        # Plaid calls made on the fetch threads (core/fetching.py) report here too.
+        with self._lock:
+            timing = self.timings.setdefault(name, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += count
+
+    def seconds(self, name):
+        return self.timings.get(name, (0.0, 0))[0]
+
+    def count(self, name):
+        return self.timings.get(name, (0.0, 0))[1]
+
+
+@contextmanager
+def timed(name):
+    """Adds the time spent in the block to the current request's ``name`` timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current = _current.get()
+        if current is not None:
+            current.add(name, time.perf_counter() - started)
+
+
+def record_rows(rows):
+    """Records how many rows the current request returns."""
+    current = _current.get()
+    if current is not None:
+        current.rows = rows
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper: times queries run on behalf of a request."""
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.add('db', time.perf_counter() - started)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """connection_created handler: adds record_query to every new database connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def plaid_institution(institution_id):
+    """Labels the Plaid calls made in the block with ``institution_id``."""
+    token = _institution.set(institution_id or 'unknown')
+    try:
+        yield
+    finally:
+        _institution.reset(token)
+
+
+@contextmanager
+def observe_plaid_call(endpoint):
+    """Times one Plaid call (``endpoint`` is its path, e.g. /transactions/sync)."""
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        yield
+        status = '200'
+    except Exception as e:
+        status = str(getattr(e, 'status', None) or 'error')
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        PLAID_LATENCY.labels(endpoint, _institution.get(), status).observe(elapsed)
+        current = _current.get()
+        if current is not None:
+            current.add('plaid', elapsed)
+
+
+def record_pool_stats():
+    """Copies the connection pool's statistics (if there is a pool) into the db_pool_* metrics."""
+    pool = getattr(connections['default'], 'pool', None)
+    if pool is None:
+        return
+    # pop_stats() resets the counters it returns, so each wait is counted once.
+    stats = pool.pop_stats()
+    DB_POOL_CONNECTIONS.set(stats.get('pool_size', 0))
+    DB_POOL_AVAILABLE.set(stats.get('pool_available', 0))
+    DB_POOL_WAITING.set(stats.get('requests_waiting', 0))
+    DB_POOL_QUEUED.inc(stats.get('requests_queued', 0))
+    DB_POOL_WAIT_SECONDS.inc(stats.get('requests_wait_ms', 0) / 1000)
+    DB_POOL_TIMEOUTS.inc(stats.get('requests_errors', 0))
+
+
+def render_metrics():
+    """The metrics of this process, or of every worker with PROMETHEUS_MULTIPROC_DIR set, in text format."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """Records the metrics above for every request. Goes first in MIDDLEWARE, so it times the others too."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        current = RequestMetrics()
+        token = _current.set(current)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, current)
+        return response
+
+    async def __acall__(self, request):
+        current = RequestMetrics()
+        token = _current.set(current)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, current)
+        return response
+
+    def finish(self, request, response, current):
+        elapsed = time.perf_counter() - current.started
+        match = request.resolver_match
+        endpoint = '/' + match.route if match is not None else 'unmatched'
+
+        REQUEST_LATENCY.labels(request.method, endpoint, response.status_code).observe(elapsed)
+        REQUEST_DB_QUERIES.labels(endpoint).observe(current.count('db'))
+        REQUEST_DB_SECONDS.labels(endpoint).observe(current.seconds('db'))
+        if 'serialize' in current.timings:
+            SERIALIZATION_SECONDS.labels(endpoint).observe(current.seconds('serialize'))
+        if current.rows is not None:
+            ROWS_RETURNED.labels(endpoint).observe(current.rows)
+        record_pool_stats()
+
+        if settings.SERVER_TIMING_HEADERS:
+            entries = [f'app;dur={elapsed * 1000:.1f}']
+            for name, unit in (('db', 'queries'), ('plaid', 'calls'), ('serialize', None)):
+                if name in current.timings:
+                    entry = f'{name};dur={current.seconds(name) * 1000:.1f}'
+                    entries.append(f'{entry};desc="{current.count(name)} {unit}"' if unit else entry)
+            response['Server-Timing'] = ', '.join(entries)
+
+        logger.info(
+            f"{request.method} {request.path} {response.status_code} {elapsed * 1000:.0f}ms",
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'db_queries': current.count('db'),
+                'db_ms': round(current.seconds('db') * 1000, 1),
+                'plaid_calls': current.count('plaid'),
+                'plaid_ms': round(current.seconds('plaid') * 1000, 1),
+                'rows': current.rows,
+            },
+        )
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plaiditem',
+            name='last_sync_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plaiditem',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plaiditem',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='plaiditem',
+            name='sync_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
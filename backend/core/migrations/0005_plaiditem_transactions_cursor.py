@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_plaiditem_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plaiditem',
+            name='transactions_cursor',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
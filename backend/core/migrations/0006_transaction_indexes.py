@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:48
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run in a transaction, and doesn't block
+    # writes to core_transaction while the indexes build.
+    atomic = False
+
+    dependencies = [
+        ('core', '0005_plaiditem_transactions_cursor'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-date', '-id'], name='core_txn_account_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('category__isnull', True)), fields=['id'], name='core_txn_uncategorized_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='transaction',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['category'], name='core_txn_category_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
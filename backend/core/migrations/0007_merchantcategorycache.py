@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MerchantCategoryCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_name', models.CharField(max_length=500)),
+                ('model_version', models.CharField(max_length=64)),
+                ('category', models.CharField(max_length=255)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('normalized_name', 'model_version'), name='core_merchant_cache_unique')],
+            },
+        ),
+    ]
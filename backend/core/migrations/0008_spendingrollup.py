@@ -0,0 +1,68 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Copies of the DAY_TOTALS and MONTH_TOTALS queries in core/rollups.py as they
+# were when the table was added; a migration mustn't change when they do.
+POPULATE_ROLLUPS = [
+    """
+    INSERT INTO core_spendingrollup (user_id, account_id, category, period, period_start, total, spend, count)
+    SELECT item.user_id, txn.account_id, COALESCE(txn.category->>0, 'Other'), 'day', txn.date, SUM(txn.amount),
+           COALESCE(SUM(txn.amount) FILTER (WHERE txn.amount > 0), 0), COUNT(*)
+    FROM core_transaction txn
+    JOIN core_account account ON account.id = txn.account_id
+    JOIN core_plaiditem item ON item.id = account.plaid_item_id
+    GROUP BY item.user_id, txn.account_id, 3, txn.date
+    """,
+    """
+    INSERT INTO core_spendingrollup (user_id, account_id, category, period, period_start, total, spend, count)
+    SELECT user_id, account_id, category, 'month', date_trunc('month', period_start)::date,
+           SUM(total), SUM(spend), SUM(count)
+    FROM core_spendingrollup
+    WHERE period = 'day'
+    GROUP BY user_id, account_id, category, 5
+    """,
+]
+
+
+def populate_rollups(apps, schema_editor):
+    """
+    Fills the new table from the existing transactions. /summary/ reads only
+    the rollups, and ingestion's deltas assume every existing transaction is
+    already counted in them.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        for sql in POPULATE_ROLLUPS:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_merchantcategorycache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=255)),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('spend', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('count', models.IntegerField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.account')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'period', 'period_start'], name='core_rollup_user_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('account', 'category', 'period', 'period_start'), name='core_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_auth_user_email_lower_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.CharField(max_length=63)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('path', models.CharField(max_length=1000)),
+                ('rows', models.PositiveIntegerField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start_date', 'end_date'], name='core_txn_archive_range_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,8 @@
 # backend/core/models.py
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
 
 # It's good practice to have a separate model for the Plaid Item,
 # which represents the login to a financial institution.
@@ -11,6 +13,19 @@ class PlaidItem(models.Model):
     item_id = models.CharField(max_length=255, unique=True)
     institution_name = models.CharField(max_length=255, null=True, blank=True)
     institution_id = models.CharField(max_length=255, null=True)
+
+    # --- Background sync bookkeeping (see core/sync.py) ---
+    # When the worker last pulled transactions for this item successfully.
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    # When the worker should sync this item next. Null means "as soon as possible".
+    next_sync_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Consecutive failed syncs, used to back off from a failing institution.
+    sync_failures = models.PositiveIntegerField(default=0)
+    last_sync_error = models.TextField(null=True, blank=True)
+    # Opaque cursor from Plaid's /transactions/sync. Null until the first sync,
+    # after which each sync only returns what changed since this point.
+    transactions_cursor = models.TextField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -57,4 +72,111 @@ class Transaction(models.Model):
         return f"{self.date} - {self.name} - {self.amount}"
 
     class Meta:
-        ordering = ['-date'] # Show newest transactions first by default
\ No newline at end of file
+        ordering = ['-date'] # Show newest transactions first by default
+        indexes = [
+            # The hot path: one account's transactions in a date range, newest first,
+            # paged on (date, id) by the transactions API.
+            models.Index(fields=['account', '-date', '-id'], name='core_txn_account_date_id_idx'),
+            # Only the rows categorize_transactions still has to look at, walked in pk order.
+            models.Index(fields=['id'], condition=Q(category__isnull=True), name='core_txn_uncategorized_idx'),
+            # `category` containment filters (category @> '["Travel"]').
+            GinIndex(fields=['category'], opclasses=['jsonb_path_ops'], name='core_txn_category_gin'),
+        ]
+
+
+# Memoized classifier predictions, keyed by normalized merchant name and the
+# version (content hash) of the model that made them. See core/classifier.py.
+class MerchantCategoryCache(models.Model):
+    normalized_name = models.CharField(max_length=500)
+    model_version = models.CharField(max_length=64)
+    category = models.CharField(max_length=255)
+    hits = models.PositiveIntegerField(default=0)
+    # Used to evict the least recently used entries.
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.normalized_name} -> {self.category} ({self.model_version})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['normalized_name', 'model_version'], name='core_merchant_cache_unique'),
+        ]
+
+
+# Per-account, per-category sums of transactions for one day or one month,
+# kept up to date by core/rollups.py so summaries don't scan raw transactions.
+class SpendingRollup(models.Model):
+    DAY = 'day'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(DAY, 'Day'), (MONTH, 'Month')]
+
+    # Denormalized from account.plaid_item.user so summaries need no joins.
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    # The primary (first) category, as the dashboard groups them.
+    category = models.CharField(max_length=255)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    # The day itself, or the first day of the month.
+    period_start = models.DateField()
+    # Sum of all amounts (outflows are positive, as in Plaid).
+    total = models.DecimalField(max_digits=14, decimal_places=2)
+    # Sum of the positive amounts only - what the dashboard calls spend.
+    spend = models.DecimalField(max_digits=14, decimal_places=2)
+    # Not PositiveIntegerField: Postgres checks constraints on the negative
+    # deltas rollups.py upserts, before they are added to the stored count.
+    count = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.account_id} {self.period} {self.period_start} {self.category}: {self.total}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'category', 'period', 'period_start'], name='core_rollup_unique'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'period', 'period_start'], name='core_rollup_user_period_idx'),
+        ]
+
+
+# Progress of `manage.py backfill_transactions` for one item (see core/backfill.py):
+# the next /transactions/get offset in a fixed date window, so an interrupted
+# backfill picks up where it stopped.
+class TransactionBackfill(models.Model):
+    plaid_item = models.OneToOneField(PlaidItem, on_delete=models.CASCADE, related_name='backfill')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    offset = models.PositiveIntegerField(default=0)
+    # total_transactions from Plaid's last page; null until the first one.
+    total = models.PositiveIntegerField(null=True, blank=True)
+    stored = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.plaid_item_id}: {self.offset}/{self.total} from {self.start_date} to {self.end_date}"
+
+
+# A month of transactions that archive_transactions moved out of the database
+# into a compressed file (see core/partitions.py). Its spending rollups are
+# kept, so summaries still cover it.
+class TransactionArchive(models.Model):
+    partition = models.CharField(max_length=63)
+    start_date = models.DateField()
+    # Exclusive: the first day of the next month.
+    end_date = models.DateField()
+    path = models.CharField(max_length=1000)
+    rows = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.partition} ({self.rows} rows) in {self.path}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='core_txn_archive_range_idx'),
+        ]
@@ -0,0 +1,275 @@
+# backend/core/partitions.py
+"""
+Optional monthly partitioning of core_transaction by ``date``.
+
+`manage.py partition_transactions` rebuilds the table as a Postgres table
+partitioned by range on ``date``, one partition per calendar month
+(core_transaction_p2026_01, ...), and keeps partitions created
+TRANSACTION_PARTITION_MONTHS_AHEAD months ahead of today. Queries that filter on a
+date range (the transactions API always does) only read the partitions it
+covers, and old months can be archived to compressed files and dropped with
+`manage.py archive_transactions` instead of deleted row by row.
+
+Postgres requires the partition key in every unique constraint, so on the
+partitioned table the primary key is (id, date) and the Plaid id is unique
+per (plaid_transaction_id, date). ingest_transactions upserts on that pair
+and deletes the old row itself when Plaid moves a transaction to another
+day. Django still treats ``id`` as the primary key, which stays unique as it
+comes from one sequence.
+
+Whether the table is partitioned, and which partitions exist, is looked up
+at most every PARTITION_CACHE_SECONDS per process.
+"""
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Transaction, TransactionArchive
+from .rollups import month_start, next_month
+
+logger = logging.getLogger(__name__)
+
+TABLE = Transaction._meta.db_table
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+PARTITION_CACHE_SECONDS = 60
+
+# relkind 'p' is a partitioned table; the array holds its partitions.
+TABLE_STATE = """
+    SELECT parent.relkind, ARRAY(
+        SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = parent.oid
+    )
+    FROM pg_class parent WHERE parent.oid = %s::regclass
+"""
+# Indexes that don't back a constraint, and the constraints, to recreate on a rebuilt table.
+TABLE_INDEXES = """
+    SELECT indexdef FROM pg_indexes
+    WHERE schemaname = current_schema() AND tablename = %s
+      AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+"""
+TABLE_CONSTRAINTS = """
+    SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+    WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+"""
+
+_state = {'checked': 0.0, 'partitioned': False, 'months': set()}
+_lock = threading.Lock()
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def partition_month(name):
+    """The first day of the month a partition holds, or None if ``name`` isn't one of ours."""
+    match = PARTITION_NAME.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def table_state(refresh=False):
+    """(partitioned, set of partition months), from the per-process cache unless ``refresh``."""
+    with _lock:
+        if refresh or time.monotonic() - _state['checked'] > PARTITION_CACHE_SECONDS:
+            with connection.cursor() as cursor:
+                cursor.execute(TABLE_STATE, [TABLE])
+                relkind, children = cursor.fetchone()
+            _state['partitioned'] = relkind == 'p'
+            _state['months'] = {month for month in map(partition_month, children) if month is not None}
+            _state['checked'] = time.monotonic()
+        return _state['partitioned'], set(_state['months'])
+
+
+def is_partitioned():
+    return table_state()[0]
+
+
+def archived_months():
+    """The first days of the months that are archived (and not restored)."""
+    return set(TransactionArchive.objects.values_list('start_date', flat=True))
+
+
+def create_partition(cursor, month, parent=TABLE):
+    """Creates the partition for ``month`` (a first of the month) if it doesn't exist yet."""
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+
+
+def ensure_partitions(days):
+    """
+    Creates any missing partitions for the months of ``days``. Does nothing if
+    the table isn't partitioned.
+
+    Creating a partition locks the whole table until the transaction commits,
+    so call this before opening the transaction that writes the rows.
+    """
+    partitioned, months = table_state()
+    if not partitioned:
+        return
+    missing = {month_start(day) for day in days} - months
+    if not missing:
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        for month in sorted(missing):
+            create_partition(cursor, month)
+    logger.info(f"Created transaction partitions for {', '.join(f'{month:%Y-%m}' for month in sorted(missing))}.")
+
+    def remember():
+        with _lock:
+            _state['months'] |= missing
+    # Not before commit: if an enclosing transaction rolls back, so do the partitions.
+    transaction.on_commit(remember)
+
+
+def ensure_future_partitions(today=None):
+    """Creates the partitions for this month and the next TRANSACTION_PARTITION_MONTHS_AHEAD months."""
+    this_month = month_start(today or date.today())
+    ensure_partitions(add_months(this_month, offset) for offset in range(settings.TRANSACTION_PARTITION_MONTHS_AHEAD + 1))
+
+
+def rebuild_table(partitioned, months_ahead=0):
+    """
+    Copies every transaction into a new core_transaction, partitioned by month
+    or plain, and replaces the old table with it. Returns the number of rows.
+
+    The old table is locked against reads and writes until this commits.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        # The table can't be dropped with foreign key checks still deferred on it.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(TABLE_INDEXES, [TABLE, TABLE])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(TABLE_CONSTRAINTS, [TABLE])
+        constraints = cursor.fetchall()
+
+        new_table = f'{TABLE}_new'
+        if partitioned:
+            cursor.execute(f"CREATE TABLE {new_table} (LIKE {TABLE}) PARTITION BY RANGE (date)")
+            cursor.execute(f"SELECT DISTINCT date_trunc('month', date)::date FROM {TABLE}")
+            this_month = month_start(date.today())
+            months = {row[0] for row in cursor.fetchall()}
+            months.update(add_months(this_month, offset) for offset in range(months_ahead + 1))
+            for month in sorted(months):
+                # Partitions don't depend on the parent's name, so they survive the rename below.
+                create_partition(cursor, month, parent=new_table)
+        else:
+            cursor.execute(f"CREATE TABLE {new_table} (LIKE {TABLE})")
+        cursor.execute(f"INSERT INTO {new_table} SELECT * FROM {TABLE}")
+        rows = cursor.rowcount
+        # Also drops the old id sequence and, for a partitioned table, its partitions.
+        cursor.execute(f"DROP TABLE {TABLE}")
+        cursor.execute(f"ALTER TABLE {new_table} RENAME TO {TABLE}")
+
+        if partitioned:
+            # Identity columns need Postgres 17 on partitioned tables; a plain sequence does the same.
+            cursor.execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+            cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+        else:
+            cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}", [TABLE]
+        )
+
+        for name, kind, definition in constraints:
+            if kind in ('p', 'u'):
+                # Unique constraints on a partitioned table must include the partition key.
+                columns = [column.strip() for column in definition[definition.index('(') + 1:-1].split(',')]
+                columns = [column for column in columns if column != 'date'] + (['date'] if partitioned else [])
+                definition = f"{definition[:definition.index('(')]}({', '.join(columns)})"
+            cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+        for definition in indexes:
+            cursor.execute(definition)
+        cursor.execute(f"ANALYZE {TABLE}")
+    table_state(refresh=True)
+    return rows
+
+
+def fsync_directory(directory):
+    """Flushes ``directory``'s entries (e.g. a file just renamed into it) to disk."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def archive_partition(month, directory):
+    """
+    Detaches the partition of ``month``, writes its rows to a gzipped CSV file
+    in ``directory`` and drops it. Returns the TransactionArchive, or None if
+    there is no such partition.
+
+    The month's spending rollups are kept, so summaries still include it.
+    """
+    name = partition_name(month)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}-{time.strftime("%Y%m%d%H%M%S")}.csv.gz')
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is None:
+            return None
+        cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        with open(path + '.tmp', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                with cursor.copy(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)") as copy:
+                    for data in copy:
+                        f.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+        cursor.execute(f"SELECT COUNT(*) FROM {name}")
+        rows = cursor.fetchone()[0]
+        os.replace(path + '.tmp', path)
+        # The file and its name must be on disk before the rows are dropped, or
+        # a crash right after the commit would lose both.
+        fsync_directory(directory)
+        cursor.execute(f"DROP TABLE {name}")
+        archive = TransactionArchive.objects.create(
+            partition=name, start_date=month, end_date=next_month(month), path=path, rows=rows,
+        )
+    with _lock:
+        _state['months'].discard(month)
+    return archive
+
+
+def restore_archives(archives):
+    """
+    Loads the rows of ``archives`` (TransactionArchives of one month) back into
+    the table and forgets the archives; their files are left in place. Rows of
+    accounts deleted since are skipped. Returns (restored, skipped).
+    """
+    archives = list(archives)
+    months = {archive.start_date for archive in archives}
+    ensure_partitions(months)
+    restored = skipped = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TEMPORARY TABLE restored_transaction (LIKE {TABLE})")
+        for archive in archives:
+            with gzip.open(archive.path, 'rb') as f:
+                with cursor.copy("COPY restored_transaction FROM STDIN WITH (FORMAT csv, HEADER true)") as copy:
+                    while data := f.read(1 << 20):
+                        copy.write(data)
+        cursor.execute(
+            f"INSERT INTO {TABLE} SELECT restored.* FROM restored_transaction restored "
+            f"WHERE EXISTS (SELECT 1 FROM core_account account WHERE account.id = restored.account_id) "
+            f"ON CONFLICT DO NOTHING"
+        )
+        restored = cursor.rowcount
+        cursor.execute("SELECT COUNT(*) FROM restored_transaction")
+        skipped = cursor.fetchone()[0] - restored
+        cursor.execute("DROP TABLE restored_transaction")
+        TransactionArchive.objects.filter(pk__in=[archive.pk for archive in archives]).delete()
+    return restored, skipped
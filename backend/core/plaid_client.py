@@ -0,0 +1,178 @@
+# backend/core/plaid_client.py
+"""
+The process-wide Plaid API client.
+
+Building a PlaidApi per request meant a new urllib3 pool, and so a new TCP
+connection and TLS handshake, for every call. get_plaid_client() now hands
+out one client per process (rebuilt after a fork, since pooled sockets must
+not be shared with the parent) whose pool keeps up to PLAID_POOL_MAXSIZE
+connections alive per host - enough for every fetch thread in
+core/fetching.py to reuse its own.
+
+Every call gets PLAID_CONNECT_TIMEOUT_SECONDS / PLAID_READ_TIMEOUT_SECONDS
+unless it passes ``_request_timeout`` itself. Rate limits (429), 5xx
+responses and failed connection attempts are retried up to PLAID_MAX_RETRIES
+times with jittered exponential backoff, honouring Retry-After. Timed-out
+reads are not retried, since Plaid may already have acted on the request.
+
+Calls are also spread out by the shared rate limiter in core/rate_limits.py,
+and timed in the Plaid metrics (core/metrics.py). Retries wait for the
+limiter too, so a burst of 429s doesn't send more requests than it allows.
+
+plaid_client_stats() reports how many requests went out, how many new
+connections they needed and how many retries happened in this process.
+"""
+import contextvars
+import os
+import threading
+
+import plaid
+from django.conf import settings
+from urllib3.util.retry import Retry
+
+from . import metrics, rate_limits
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_clients = {}
+_clients_pid = None
+_retries = {}
+_lock = threading.Lock()
+# The access token of the call in progress, so its retries draw from the same buckets.
+_call_access_token = contextvars.ContextVar('plaid_call_access_token', default=None)
+
+
+class CountingRetry(Retry):
+    """
+    urllib3's Retry, counting every retry it allows in plaid_client_stats()
+    and waiting for the rate limiter before each one.
+    """
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        reason = f'status {response.status}' if response is not None else type(error).__name__
+        with _lock:
+            _retries[reason] = _retries.get(reason, 0) + 1
+        return super().increment(method, url, response, error, *args, **kwargs)
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        rate_limits.acquire(_call_access_token.get())
+
+
+class ScheduledApiClient(plaid.ApiClient):
+    """
+    ApiClient that waits for the rate limiter (core/rate_limits.py) before
+    every call (CountingRetry does for its retries) and applies the configured timeouts to calls that don't set
+    their own.
+    """
+    def call_api(self, resource_path, *args, **kwargs):
+        body = kwargs.get('body')
+        access_token = body.get('access_token') if hasattr(body, 'get') else None
+        rate_limits.acquire(access_token)
+        token = _call_access_token.set(access_token)
+        try:
+            with metrics.observe_plaid_call(resource_path):
+                return super().call_api(resource_path, *args, **kwargs)
+        finally:
+            _call_access_token.reset(token)
+
+    def request(self, *args, _request_timeout=None, **kwargs):
+        if _request_timeout is None:
+            _request_timeout = (settings.PLAID_CONNECT_TIMEOUT_SECONDS, settings.PLAID_READ_TIMEOUT_SECONDS)
+        return super().request(*args, _request_timeout=_request_timeout, **kwargs)
+
+
+def plaid_host():
+    if settings.PLAID_HOST:
+        return settings.PLAID_HOST
+    if settings.PLAID_ENV == 'development':
+        return plaid.Environment.Development
+    if settings.PLAID_ENV == 'production':
+        return plaid.Environment.Production
+    return plaid.Environment.Sandbox
+
+
+def build_plaid_client(host=None):
+    """A new PlaidApi with the pooling, timeout and retry settings. Use get_plaid_client() instead."""
+    # plaid_api pulls in every generated request and response model (about 450
+    # modules), so it is only imported once a process actually needs a client.
+    from plaid.api import plaid_api
+
+    configuration = plaid.Configuration(
+        host=host or plaid_host(),
+        api_key={
+            'clientId': settings.PLAID_CLIENT_ID,
+            'secret': settings.PLAID_SANDBOX_SECRET,
+        }
+    )
+    # Connections kept alive per host; more can be opened under load, but only this many are reused.
+    configuration.connection_pool_maxsize = settings.PLAID_POOL_MAXSIZE
+    configuration.retries = CountingRetry(
+        total=settings.PLAID_MAX_RETRIES,
+        connect=settings.PLAID_MAX_RETRIES,
+        read=0,
+        status=settings.PLAID_MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        # Every Plaid endpoint is a POST.
+        allowed_methods=None,
+        backoff_factor=settings.PLAID_RETRY_BACKOFF_SECONDS,
+        backoff_jitter=settings.PLAID_RETRY_BACKOFF_SECONDS,
+        backoff_max=settings.PLAID_RETRY_BACKOFF_MAX_SECONDS,
+        # Hand the last error response back, so plaid raises its usual ApiException.
+        raise_on_status=False,
+    )
+    return plaid_api.PlaidApi(ScheduledApiClient(configuration))
+
+
+def get_plaid_client():
+    """The shared client for this process."""
+    # PLAID_ENV=fake swaps in the in-memory client so the sync engine and the
+    # views can be exercised locally without Plaid credentials.
+    if settings.PLAID_ENV == 'fake':
+        from .fake_plaid import FakePlaidClient
+        return FakePlaidClient()
+
+    global _clients_pid
+    host = plaid_host()
+    with _lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _retries.clear()
+            _clients_pid = os.getpid()
+        if host not in _clients:
+            _clients[host] = build_plaid_client(host)
+        return _clients[host]
+
+
+def reset_plaid_client():
+    """Drops the shared clients and their connections, e.g. after changing the Plaid settings."""
+    with _lock:
+        for client in _clients.values():
+            client.api_client.rest_client.pool_manager.clear()
+        _clients.clear()
+        _retries.clear()
+
+
+def plaid_client_stats(client=None):
+    """
+    Connection reuse for ``client`` (the shared clients by default):
+    ``requests`` sent, new ``connections`` opened for them, ``reused`` =
+    requests that went over an already open connection, and ``retries`` by
+    reason. Retries are counted per process, not per client.
+    """
+    with _lock:
+        clients = [client] if client is not None else list(_clients.values())
+        retries = dict(_retries)
+    requests = connections = 0
+    for api in clients:
+        pools = api.api_client.rest_client.pool_manager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+    return {
+        'requests': requests,
+        'connections': connections,
+        'reused': max(requests - connections, 0),
+        'retries': retries,
+    }
@@ -0,0 +1,174 @@
+# backend/core/rate_limits.py
+"""
+Shared rate limiting for Plaid calls.
+
+Every call to Plaid (core/plaid_client.py and the fake client) first takes a
+token from two buckets: one for our Plaid client id, refilled at
+PLAID_RATE_LIMIT_PER_MINUTE, and one for the item's access token, refilled at
+PLAID_ITEM_RATE_LIMIT_PER_MINUTE. Each holds at most its *_BURST tokens. The
+buckets live in the Django cache, so with REDIS_URL set every Gunicorn worker
+and sync worker draws from the same budget; with the local-memory cache each
+process has its own.
+
+A caller that finds a bucket empty doesn't fail: it reserves the next token
+(the bucket goes negative) and sleeps until that token is due, so bursts are
+queued and spread out instead of bouncing off Plaid's RATE_LIMIT_EXCEEDED.
+Only a caller that would wait longer than PLAID_RATE_LIMIT_MAX_WAIT_SECONDS
+(or the limit set with wait_limit()) gets RateLimited, with the time it
+would have had to wait.
+
+sync_lock() is the other half: it makes sure only one sync per item is in
+flight, so duplicate refreshes don't spend the budget twice.
+"""
+import asyncio
+import contextvars
+import hashlib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# How long a bucket's lock may be held before it's considered abandoned.
+BUCKET_LOCK_SECONDS = 2
+
+_stats = {'calls': 0, 'queued': 0, 'waited_seconds': 0.0, 'rejected': 0}
+_stats_lock = threading.Lock()
+# Set by wait_limit(); None means PLAID_RATE_LIMIT_MAX_WAIT_SECONDS.
+_max_wait = contextvars.ContextVar('plaid_rate_limit_max_wait', default=None)
+
+
+class RateLimited(Exception):
+    """Raised when a Plaid call would have to wait more than PLAID_RATE_LIMIT_MAX_WAIT_SECONDS."""
+    def __init__(self, retry_after):
+        super().__init__(f"Plaid rate limit budget exhausted, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+@contextmanager
+def cache_lock(key, timeout):
+    """Holds ``key`` in the cache for the duration of the block, waiting for it if another process has it."""
+    token = uuid.uuid4().hex
+    while not cache.add(key, token, timeout):
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def reserve(key, per_minute, burst, tokens=1):
+    """
+    Takes ``tokens`` from the bucket ``key`` and returns how many seconds the
+    caller has to wait before they are its to use (0 when it had enough).
+    """
+    if per_minute <= 0:
+        return 0.0
+    rate = per_minute / 60
+    with cache_lock(f'{key}:lock', BUCKET_LOCK_SECONDS):
+        now = time.time()
+        available, updated_at = cache.get(key, (burst, now))
+        # A refund (negative tokens) never fills the bucket past its burst.
+        available = min(burst, min(burst, available + (now - updated_at) * rate) - tokens)
+        # Idle buckets expire once they would be full again anyway.
+        cache.set(key, (available, now), int((burst - available) / rate) + 60)
+    return max(-available / rate, 0.0)
+
+
+def refund(key, per_minute, burst, tokens=1):
+    """Gives back tokens taken by reserve() that won't be used."""
+    if per_minute > 0:
+        reserve(key, per_minute, burst, -tokens)
+
+
+def buckets(access_token=None):
+    """The ``(key, per_minute, burst)`` buckets a call for ``access_token`` draws from."""
+    limits = [(
+        f'plaid-rate:client:{settings.PLAID_ENV}:{settings.PLAID_CLIENT_ID}',
+        settings.PLAID_RATE_LIMIT_PER_MINUTE, settings.PLAID_RATE_LIMIT_BURST,
+    )]
+    if access_token:
+        # Access tokens are secrets; keep them out of the cache keys.
+        item = hashlib.sha256(access_token.encode()).hexdigest()[:24]
+        limits.append((f'plaid-rate:item:{item}', settings.PLAID_ITEM_RATE_LIMIT_PER_MINUTE, settings.PLAID_ITEM_RATE_LIMIT_BURST))
+    return limits
+
+
+def acquire(access_token=None, max_wait=None):
+    """
+    Waits for this process's turn to call Plaid, for the item with
+    ``access_token`` if given. Raises RateLimited instead when the wait would
+    be longer than ``max_wait`` (PLAID_RATE_LIMIT_MAX_WAIT_SECONDS by default).
+    """
+    wait = reserve_call(access_token, max_wait)
+    if wait:
+        time.sleep(wait)
+
+
+async def aacquire(access_token=None, max_wait=None):
+    """acquire() for async code: the cache round trips run in a thread and the wait doesn't block the event loop."""
+    wait = await sync_to_async(reserve_call, thread_sensitive=False)(access_token, max_wait)
+    if wait:
+        await asyncio.sleep(wait)
+
+
+@contextmanager
+def wait_limit(seconds):
+    """
+    Plaid calls made in this block raise RateLimited instead of waiting more
+    than ``seconds`` for their turn, e.g. 0 for calls made while a request waits.
+    """
+    token = _max_wait.set(seconds)
+    try:
+        yield
+    finally:
+        _max_wait.reset(token)
+
+
+def reserve_call(access_token=None, max_wait=None):
+    """Reserves the tokens for one call and returns how long to wait before making it."""
+    if max_wait is None:
+        max_wait = _max_wait.get()
+    if max_wait is None:
+        max_wait = settings.PLAID_RATE_LIMIT_MAX_WAIT_SECONDS
+    limits = buckets(access_token)
+    wait = max(reserve(*limit) for limit in limits)
+    if wait > max_wait:
+        for limit in limits:
+            refund(*limit)
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise RateLimited(wait)
+    with _stats_lock:
+        _stats['calls'] += 1
+        if wait:
+            _stats['queued'] += 1
+            _stats['waited_seconds'] += wait
+    return wait
+
+
+def rate_limit_stats():
+    """Calls let through, how many of them were queued and for how long in total, and calls rejected, in this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+@contextmanager
+def sync_lock(item):
+    """
+    Marks a sync of ``item`` as in flight. Yields True if this caller got the
+    lock, or False if another sync of the same item is already running, in
+    which case the caller should leave the work to it.
+    """
+    key = f'plaid-sync:{item.pk}'
+    token = uuid.uuid4().hex
+    acquired = cache.add(key, token, settings.SYNC_LEASE_SECONDS)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
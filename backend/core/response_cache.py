@@ -0,0 +1,117 @@
+# backend/core/response_cache.py
+"""
+Per-user response caching for the read-only dashboard endpoints.
+
+Every user has a data version in the cache. Anything that changes what those
+endpoints would return - ingestion, removals, categorization, a sync, a newly
+linked item - calls bump_data_version once its transaction commits. A
+response is cached under (user, data version, path, query string, Accept) and
+that key's hash is also sent as its ETag, so:
+
+- a request whose If-None-Match still matches gets a 304 after a single cache
+  read, with no database or serialization work;
+- otherwise a cached body is returned as-is, and only a miss runs the view.
+
+Old versions are never deleted; their entries simply stop being looked up and
+expire after RESPONSE_CACHE_SECONDS. Data versions expire on the same
+schedule, which bounds staleness when the cache is not shared between the
+web and worker processes (local memory, the default without REDIS_URL).
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.response import Response
+
+# Response headers that are part of the cached response.
+CACHED_HEADERS = ('X-Next-Cursor', 'Link', 'X-Last-Synced-At')
+
+
+def version_key(user_id):
+    return f'data-version:{user_id}'
+
+
+def data_version(user_id):
+    """The user's current data version, starting a new one if there is none (or it expired)."""
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # Time-based, not a counter, so an expired version is never reused.
+        version = str(time.time_ns())
+        if not cache.add(version_key(user_id), version, settings.RESPONSE_CACHE_SECONDS):
+            version = cache.get(version_key(user_id), version)
+    return version
+
+
+def bump_data_version(user_ids):
+    """
+    Invalidates the cached responses of ``user_ids`` once the current database
+    transaction commits (immediately outside one). Bumping only after commit
+    means no request can cache pre-commit data under the new version.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+
+    def bump():
+        version = str(time.time_ns())
+        cache.set_many({version_key(user_id): version for user_id in user_ids}, settings.RESPONSE_CACHE_SECONDS)
+
+    transaction.on_commit(bump)
+
+
+def cache_response(view_method):
+    """
+    Caches a GET handler's 200 responses per user and data version, with ETags.
+
+    Requests with side effects (``refresh``) or streamed exports bypass the
+    cache.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        params = request.query_params
+        if not settings.RESPONSE_CACHE_SECONDS or 'refresh' in params or 'export' in params:
+            return view_method(self, request, *args, **kwargs)
+
+        raw_key = '|'.join([
+            str(request.user.pk), data_version(request.user.pk), request.path,
+            params.urlencode(), request.META.get('HTTP_ACCEPT', ''),
+        ])
+        etag = '"' + hashlib.sha256(raw_key.encode()).hexdigest()[:32] + '"'
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        cache_key = f'response:{etag}'
+        cached = cache.get(cache_key)
+        if cached is not None:
+            content, content_type, headers = cached
+            response = HttpResponse(content, content_type=content_type)
+            for name, value in headers.items():
+                response[name] = value
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        response['ETag'] = etag
+        # Browsers may keep it, but must revalidate with If-None-Match every time.
+        response['Cache-Control'] = 'private, no-cache'
+
+        def store(rendered):
+            headers = {name: rendered[name] for name in CACHED_HEADERS if name in rendered}
+            cache.set(cache_key, (rendered.content, rendered['Content-Type'], headers), settings.RESPONSE_CACHE_SECONDS)
+
+        if isinstance(response, Response):
+            # DRF renders after the view returns; store the bytes once it has.
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+    return wrapper
@@ -0,0 +1,275 @@
+# backend/core/rollups.py
+"""
+Daily and monthly spending rollups (SpendingRollup).
+
+Summaries are answered from one row per account, category and day or month
+instead of from raw transactions. Whoever writes transactions records what it
+changed in a RollupDeltas - subtracting each row's old values and adding its
+new ones - and applies it in the same database transaction, one
+``INSERT ... ON CONFLICT DO UPDATE SET total = total + excluded.total``
+for the whole batch. Writers read the old values with SELECT ... FOR UPDATE so
+two of them can never subtract the same old value twice.
+
+refresh_rollups recomputes buckets from the transactions instead; it is the
+repair path behind `manage.py check_rollups --fix` and `rebuild_rollups`.
+Days in months archived by `archive_transactions` have no transactions left to
+recompute from, so their day rollups are kept as they are and left unchecked.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+
+from .models import Account, SpendingRollup
+from .response_cache import bump_data_version
+
+# What transactions without a category are grouped under, as on the dashboard.
+UNCATEGORIZED = 'Other'
+
+# Each account's lock is a pg_advisory_xact_lock(bigint) key: LOCK_NAMESPACE in
+# the top 16 bits and the account id (a bigint, below 2**48) in the rest.
+# Delta writers share the lock (their updates commute); a recompute takes it
+# exclusively so no delta lands between its read and its write.
+LOCK_NAMESPACE = 7301
+LOCK_ACCOUNTS = (
+    "SELECT {function}((%s::bigint << 48) | id) "
+    "FROM (SELECT DISTINCT unnest(%s::bigint[]) AS id ORDER BY id) ids"
+)
+
+COLUMNS = "user_id, account_id, category, period, period_start, total, spend, count"
+
+# One row per (account, category, day), from the raw transactions.
+DAY_TOTALS = """
+    SELECT item.user_id, txn.account_id, COALESCE(txn.category->>0, %s) AS category, 'day' AS period,
+           txn.date AS period_start, SUM(txn.amount) AS total,
+           COALESCE(SUM(txn.amount) FILTER (WHERE txn.amount > 0), 0) AS spend, COUNT(*) AS count
+    FROM core_transaction txn
+    JOIN core_account account ON account.id = txn.account_id
+    JOIN core_plaiditem item ON item.id = account.plaid_item_id
+    WHERE {where}
+    GROUP BY item.user_id, txn.account_id, 3, txn.date
+"""
+
+# One row per (account, category, month), from the day rollups.
+MONTH_TOTALS = """
+    SELECT user_id, account_id, category, 'month' AS period, date_trunc('month', period_start)::date AS period_start,
+           SUM(total) AS total, SUM(spend) AS spend, SUM(count) AS count
+    FROM core_spendingrollup
+    WHERE period = 'day' AND {where}
+    GROUP BY user_id, account_id, category, 5
+"""
+
+# Rows where the stored rollups and freshly computed totals disagree.
+MISMATCHES = """
+    WITH expected AS ({totals}),
+    actual AS (SELECT * FROM core_spendingrollup WHERE period = %s AND {actual})
+    SELECT COALESCE(e.account_id, a.account_id), COALESCE(e.period_start, a.period_start),
+           COALESCE(e.category, a.category), e.total, e.spend, e.count, a.total, a.spend, a.count
+    FROM expected e
+    FULL OUTER JOIN actual a
+      ON a.account_id = e.account_id AND a.period_start = e.period_start AND a.category = e.category
+    WHERE e.count IS DISTINCT FROM a.count OR e.total IS DISTINCT FROM a.total OR e.spend IS DISTINCT FROM a.spend
+    LIMIT %s
+"""
+
+KEYS = "SELECT * FROM unnest(%s::bigint[], %s::date[])"
+
+# True for days outside every archived month (TransactionArchive).
+NOT_ARCHIVED = (
+    "NOT EXISTS (SELECT 1 FROM core_transactionarchive archive "
+    "WHERE {day} >= archive.start_date AND {day} < archive.end_date)"
+)
+
+APPLY_DELTAS = f"""
+    INSERT INTO core_spendingrollup ({COLUMNS})
+    SELECT item.user_id, delta.account_id, delta.category, delta.period, delta.period_start,
+           delta.total, delta.spend, delta.count
+    FROM unnest(%s::bigint[], %s::text[], %s::text[], %s::date[], %s::numeric[], %s::numeric[], %s::int[])
+         AS delta(account_id, category, period, period_start, total, spend, count)
+    JOIN core_account account ON account.id = delta.account_id
+    JOIN core_plaiditem item ON item.id = account.plaid_item_id
+    ORDER BY delta.account_id, delta.category, delta.period, delta.period_start
+    ON CONFLICT (account_id, category, period, period_start) DO UPDATE SET
+        total = core_spendingrollup.total + excluded.total,
+        spend = core_spendingrollup.spend + excluded.spend,
+        count = core_spendingrollup.count + excluded.count
+    RETURNING core_spendingrollup.id, core_spendingrollup.count
+"""
+
+
+def month_start(value):
+    return value.replace(day=1)
+
+
+def category_label(category):
+    """The rollup category of a Transaction.category value - the same as ``COALESCE(category->>0, 'Other')``."""
+    if isinstance(category, list) and category and category[0] is not None:
+        return str(category[0])
+    return UNCATEGORIZED
+
+
+class RollupDeltas:
+    """
+    Accumulates rollup changes for a batch of transaction writes.
+
+    Call ``add`` with a row's new values and ``subtract`` with its old ones,
+    then ``apply`` once.
+    """
+    def __init__(self):
+        self.changes = {}
+
+    def add(self, account_id, category, day, amount, sign=1):
+        if account_id is None:
+            return
+        label = category_label(category)
+        amount = Decimal(amount)
+        spend = amount if amount > 0 else Decimal(0)
+        for key in ((account_id, label, SpendingRollup.DAY, day), (account_id, label, SpendingRollup.MONTH, month_start(day))):
+            total_sum, spend_sum, count = self.changes.get(key, (Decimal(0), Decimal(0), 0))
+            self.changes[key] = (total_sum + sign * amount, spend_sum + sign * spend, count + sign)
+
+    def subtract(self, account_id, category, day, amount):
+        self.add(account_id, category, day, amount, sign=-1)
+
+    def apply(self):
+        changes = {key: value for key, value in self.changes.items() if value[2] or value[0] or value[1]}
+        self.changes = {}
+        if not changes:
+            return
+        keys, values = zip(*sorted(changes.items()))
+        columns = [list(column) for column in zip(*keys)] + [list(column) for column in zip(*values)]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(LOCK_ACCOUNTS.format(function='pg_advisory_xact_lock_shared'), [LOCK_NAMESPACE, columns[0]])
+            cursor.execute(APPLY_DELTAS, columns)
+            # Buckets whose last transaction went away.
+            empty = [pk for pk, count in cursor.fetchall() if count == 0]
+            if empty:
+                cursor.execute("DELETE FROM core_spendingrollup WHERE id = ANY(%s)", [empty])
+
+
+def refresh_rollups(keys):
+    """
+    Recomputes the rollups for the given ``(account_id, date)`` pairs, and the
+    months they fall in, from the transactions.
+    """
+    keys = {(account_id, day) for account_id, day in keys if account_id is not None}
+    if not keys:
+        return
+    account_ids, days = zip(*sorted(keys))
+    months = sorted({(account_id, month_start(day)) for account_id, day in keys})
+    month_account_ids, month_starts = zip(*months)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Refreshes of the same account take turns, so each one recomputes
+        # from data that includes the others' committed changes.
+        cursor.execute(LOCK_ACCOUNTS.format(function='pg_advisory_xact_lock'), [LOCK_NAMESPACE, list(account_ids)])
+        cursor.execute(
+            f"DELETE FROM core_spendingrollup WHERE period = 'day' AND (account_id, period_start) IN ({KEYS}) "
+            f"AND {NOT_ARCHIVED.format(day='period_start')}",
+            [list(account_ids), list(days)],
+        )
+        cursor.execute(
+            f"INSERT INTO core_spendingrollup ({COLUMNS}) "
+            + DAY_TOTALS.format(where=f"(txn.account_id, txn.date) IN ({KEYS}) AND {NOT_ARCHIVED.format(day='txn.date')}"),
+            [UNCATEGORIZED, list(account_ids), list(days)],
+        )
+        cursor.execute(
+            f"DELETE FROM core_spendingrollup WHERE period = 'month' AND (account_id, period_start) IN ({KEYS})",
+            [list(month_account_ids), list(month_starts)],
+        )
+        cursor.execute(
+            f"INSERT INTO core_spendingrollup ({COLUMNS}) "
+            + MONTH_TOTALS.format(where=f"(account_id, date_trunc('month', period_start)::date) IN ({KEYS})"),
+            [list(month_account_ids), list(month_starts)],
+        )
+        bump_data_version(Account.objects.filter(pk__in=account_ids).values_list('plaid_item__user_id', flat=True))
+
+
+def rebuild_rollups(user_ids=None):
+    """
+    Recomputes every rollup from scratch (except the day rollups of archived
+    months), for all users or just ``user_ids``. Returns the number of rows written.
+    """
+    if user_ids is None:
+        delete_where, day_where, params = "TRUE", "TRUE", []
+    else:
+        delete_where, day_where, params = "user_id = ANY(%s)", "item.user_id = ANY(%s)", [list(user_ids)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM core_spendingrollup WHERE {delete_where} "
+            f"AND (period = 'month' OR {NOT_ARCHIVED.format(day='period_start')})",
+            params,
+        )
+        cursor.execute(
+            f"INSERT INTO core_spendingrollup ({COLUMNS}) "
+            + DAY_TOTALS.format(where=f"{day_where} AND {NOT_ARCHIVED.format(day='txn.date')}"),
+            [UNCATEGORIZED] + params,
+        )
+        days = cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO core_spendingrollup ({COLUMNS}) " + MONTH_TOTALS.format(where=delete_where), params
+        )
+        written = days + cursor.rowcount
+        if user_ids is None:
+            user_ids = Account.objects.values_list('plaid_item__user_id', flat=True).distinct()
+        bump_data_version(user_ids)
+        return written
+
+
+def find_inconsistencies(limit=1000):
+    """
+    Compares the day rollups with the raw transactions and the month rollups
+    with the day rollups. Returns up to ``limit`` mismatches as
+    ``(period, account_id, period_start, category, expected, actual)``, where
+    expected and actual are ``(total, spend, count)`` tuples or None.
+    """
+    checks = [
+        (SpendingRollup.DAY, DAY_TOTALS.format(where=NOT_ARCHIVED.format(day='txn.date')), [UNCATEGORIZED],
+         NOT_ARCHIVED.format(day='period_start')),
+        (SpendingRollup.MONTH, MONTH_TOTALS.format(where='TRUE'), [], 'TRUE'),
+    ]
+    mismatches = []
+    with connection.cursor() as cursor:
+        for period, totals, params, actual in checks:
+            cursor.execute(MISMATCHES.format(totals=totals, actual=actual), params + [period, limit - len(mismatches)])
+            for account_id, period_start, category, *values in cursor.fetchall():
+                expected = None if values[2] is None else tuple(values[:3])
+                actual = None if values[5] is None else tuple(values[3:])
+                mismatches.append((period, account_id, period_start, category, expected, actual))
+    return mismatches
+
+
+def summarize_spending(rollups, start_date, end_date):
+    """
+    Sums ``rollups`` (a SpendingRollup queryset, already filtered to one user)
+    per category over ``start_date``..``end_date``, inclusive.
+
+    Whole calendar months inside the range are read from the month rollups and
+    only the partial months at either end from the day rollups, so the cost
+    grows with the number of categories and edge days, not with transactions.
+    """
+    first_full = start_date if start_date.day == 1 else next_month(start_date)
+    after_last_full = month_start(end_date) if end_date != last_day_of_month(end_date) else next_month(end_date)
+    if first_full < after_last_full:
+        in_range = (
+            Q(period=SpendingRollup.MONTH, period_start__gte=first_full, period_start__lt=after_last_full)
+            | Q(period=SpendingRollup.DAY, period_start__gte=start_date, period_start__lt=first_full)
+            | Q(period=SpendingRollup.DAY, period_start__gte=after_last_full, period_start__lte=end_date)
+        )
+    else:
+        in_range = Q(period=SpendingRollup.DAY, period_start__gte=start_date, period_start__lte=end_date)
+    return (
+        rollups.filter(in_range)
+        .values('category')
+        .annotate(spend=Sum('spend'), total=Sum('total'), count=Sum('count'))
+        .order_by('-spend', 'category')
+    )
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def last_day_of_month(value):
+    return date.fromordinal(next_month(value).toordinal() - 1)
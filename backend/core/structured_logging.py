@@ -0,0 +1,31 @@
+# backend/core/structured_logging.py
+"""
+One JSON object per log line (LOG_FORMAT=json, the default), so log
+collectors can filter on fields instead of parsing messages. Whatever a call
+passes in ``extra`` becomes a field of its own.
+
+Imported by the LOGGING setting, before the apps are loaded: keep it free of
+Django imports.
+"""
+import json
+import logging
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,225 @@
+# backend/core/sync.py
+"""
+Background transaction sync.
+
+Plaid is only contacted from here, never from a request handler. Each
+``PlaidItem`` carries its own schedule (``next_sync_at``) and a
+/transactions/sync cursor; the ``sync_transactions`` management command
+claims due items, applies the added/modified/removed deltas since their
+cursor, then reschedules them - or backs off exponentially when the
+institution keeps failing.
+
+Only one sync per item runs at a time (rate_limits.sync_lock), and when our
+Plaid rate limit budget is used up items are simply rescheduled for when it
+has refilled, without counting it as a failure.
+"""
+import json
+import logging
+import random
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from plaid.exceptions import ApiException
+
+from .fetching import fetch_concurrently
+from .ingestion import ingest_transactions, prepare_partitions, remove_transactions
+from .metrics import plaid_institution
+from .models import PlaidItem
+from .plaid_client import get_plaid_client
+from .rate_limits import RateLimited, sync_lock
+from .response_cache import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+
+def request_sync(items):
+    """
+    Asks the worker to sync the given items as soon as possible.
+
+    ``items`` is a PlaidItem queryset. Items that are already due keep their
+    place in the queue. Returns the number of items touched.
+    """
+    now = timezone.now()
+    return items.filter(Q(next_sync_at__isnull=True) | Q(next_sync_at__gt=now)).update(next_sync_at=now)
+
+
+def backoff_delay(failures):
+    """Exponential backoff with jitter, capped at SYNC_BACKOFF_MAX_SECONDS."""
+    delay = min(settings.SYNC_BACKOFF_BASE_SECONDS * (2 ** max(failures - 1, 0)), settings.SYNC_BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_due_items(limit=10):
+    """
+    Claims up to ``limit`` items whose sync is due.
+
+    Claimed items are leased by pushing ``next_sync_at`` forward, so several
+    workers can run side by side without syncing the same item twice. If a
+    worker dies mid-sync the lease simply expires and the item is retried.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        items = list(
+            PlaidItem.objects.select_for_update(skip_locked=True)
+            .filter(Q(next_sync_at__isnull=True) | Q(next_sync_at__lte=now))
+            .order_by(F('next_sync_at').asc(nulls_first=True))[:limit]
+        )
+        PlaidItem.objects.filter(pk__in=[item.pk for item in items]).update(
+            next_sync_at=now + timedelta(seconds=settings.SYNC_LEASE_SECONDS)
+        )
+    return items
+
+
+# Plaid returns this when the item's data changed while we were paging through
+# /transactions/sync; the only safe thing to do is to restart from the old cursor.
+MUTATION_DURING_PAGINATION = 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION'
+MAX_PAGINATION_RESTARTS = 3
+
+
+def plaid_error_code(error):
+    """Returns Plaid's error_code from an ApiException body, or None."""
+    if isinstance(error, ApiException) and error.body:
+        try:
+            return json.loads(error.body).get('error_code')
+        except (TypeError, ValueError, AttributeError):
+            return None
+    return None
+
+
+def fetch_changes(item, plaid_client):
+    """
+    Pages through /transactions/sync from the item's stored cursor.
+
+    Returns ``(upserts, removed_ids, next_cursor)`` where ``upserts`` holds the
+    latest version of every added or modified transaction, keyed by id.
+    """
+    for attempt in range(MAX_PAGINATION_RESTARTS + 1):
+        cursor = item.transactions_cursor or ''
+        upserts = {}
+        removed_ids = set()
+        try:
+            has_more = True
+            while has_more:
+                response = plaid_client.transactions_sync(
+                    {"access_token": item.access_token, "cursor": cursor, "count": settings.SYNC_PAGE_SIZE}
+                )
+                for plaid_transaction in list(response['added']) + list(response['modified']):
+                    upserts[plaid_transaction['transaction_id']] = plaid_transaction
+                    removed_ids.discard(plaid_transaction['transaction_id'])
+                for removed in response['removed']:
+                    upserts.pop(removed['transaction_id'], None)
+                    removed_ids.add(removed['transaction_id'])
+                has_more = response['has_more']
+                cursor = response['next_cursor']
+            return upserts, removed_ids, cursor
+        except ApiException as e:
+            if plaid_error_code(e) != MUTATION_DURING_PAGINATION or attempt == MAX_PAGINATION_RESTARTS:
+                raise
+            logger.info(f"Data for {item} changed during pagination, restarting sync from the stored cursor.", extra={'item_id': item.pk})
+
+
+def apply_changes(item, upserts, removed_ids, next_cursor):
+    """
+    Writes fetched changes and the new cursor in one transaction, then reschedules the item.
+
+    Changes and the cursor are committed together, so an interrupted sync is
+    simply replayed from the old cursor next time. Returns the IngestResult.
+    """
+    # New partitions lock the table until commit, so they get their own short transaction.
+    prepare_partitions(upserts.values())
+    with transaction.atomic():
+        result = ingest_transactions(item, upserts.values())
+        result.removed = remove_transactions(item, removed_ids)
+        now = timezone.now()
+        PlaidItem.objects.filter(pk=item.pk).update(
+            transactions_cursor=next_cursor,
+            last_synced_at=now,
+            next_sync_at=now + timedelta(seconds=settings.SYNC_INTERVAL_SECONDS),
+            sync_failures=0,
+            last_sync_error=None,
+        )
+        # Even with no changes, X-Last-Synced-At moved.
+        bump_data_version([item.user_id])
+    item.transactions_cursor = next_cursor
+    return result
+
+
+def sync_item(item, plaid_client=None):
+    """
+    Applies everything that changed for an item since its last sync, then reschedules it.
+    Returns the IngestResult, or None if the item is already being synced elsewhere.
+
+    Failures are recorded on the item and re-raised so callers can report them.
+    """
+    plaid_client = plaid_client or get_plaid_client()
+    with sync_lock(item) as acquired, plaid_institution(item.institution_id):
+        if not acquired:
+            return None
+        try:
+            return apply_changes(item, *fetch_changes(item, plaid_client))
+        except Exception as e:
+            record_failure(item, e)
+            raise
+
+
+def rate_limit_delay(error):
+    """
+    How long to wait before retrying when ``error`` means we hit a rate limit -
+    ours (RateLimited) or Plaid's (a 429 left over after the client's retries).
+    None for any other error.
+    """
+    if isinstance(error, RateLimited):
+        return timedelta(seconds=error.retry_after)
+    if isinstance(error, ApiException) and error.status == 429:
+        return backoff_delay(1)
+    return None
+
+
+def record_failure(item, error):
+    """
+    Stores the error on the item and schedules a retry with backoff. Rate
+    limits only push the item back; they say nothing about the institution.
+    """
+    message = plaid_error_code(error) or str(error)
+    delay = rate_limit_delay(error)
+    if delay is not None:
+        PlaidItem.objects.filter(pk=item.pk).update(last_sync_error=message, next_sync_at=timezone.now() + delay)
+        return
+    failures = item.sync_failures + 1
+    PlaidItem.objects.filter(pk=item.pk).update(
+        sync_failures=failures,
+        last_sync_error=message,
+        next_sync_at=timezone.now() + backoff_delay(failures),
+    )
+
+
+def run_due_syncs(limit=10, plaid_client=None):
+    """
+    Syncs every due item, up to ``limit``. One failing item never stops the rest.
+
+    Plaid is called for all claimed items concurrently (bounded by the caps in
+    core/fetching.py); the results are then written one item at a time.
+    Returns a list of ``(item, result, error)`` tuples; ``result`` is None when
+    the sync failed.
+    """
+    plaid_client = plaid_client or get_plaid_client()
+    results = []
+    with ExitStack() as locks:
+        # An item already being synced (e.g. by `sync_transactions --item`) is
+        # left to that sync, which also reschedules it.
+        items = [item for item in claim_due_items(limit) if locks.enter_context(sync_lock(item))]
+        fetched = fetch_concurrently(items, lambda item: fetch_changes(item, plaid_client))
+        for fetch_result in fetched:
+            item = fetch_result.item
+            try:
+                if not fetch_result.ok:
+                    raise fetch_result.error
+                results.append((item, apply_changes(item, *fetch_result.value), None))
+            except Exception as e:
+                record_failure(item, e)
+                results.append((item, None, e))
+    return results
@@ -1,3 +1,665 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from plaid import ApiException
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import classifier, fetching, partitions, plaid_client
+from .async_views import AsyncSetAccessTokenView
+from .authentication import PRINCIPAL_FIELDS, CachedJWTAuthentication
+from .fake_plaid import FakePlaidClient, make_api_exception
+from .management.commands.benchmark_imports import LAZY_MODULES, TARGETS, Command as BenchmarkImports
+from .management.commands.benchmark_plaid_client import start_stub_server
+from .management.commands.check_query_plans import check_plan, queries, seed
+from .classifier import write_categories
+from .ingestion import ingest_transactions, prepare_partitions
+from .models import Account, MerchantCategoryCache, PlaidItem, SpendingRollup, Transaction
+from .response_cache import data_version
+from .rollups import find_inconsistencies, refresh_rollups
+from .sync import MUTATION_DURING_PAGINATION, run_due_syncs, sync_item
+from .views import accounts_from_plaid
+from .rate_limits import RateLimited, acquire, refund, reserve, wait_limit
+from .webhooks import WebhookKeyUnavailable, WebhookVerificationError, handle_webhook, verify_webhook
+
+
+def link_item(user, plaid_client, name='item'):
+    """A PlaidItem with its accounts, as SetAccessTokenView leaves it."""
+    item = PlaidItem.objects.create(
+        user=user, access_token=f'access-{user.username}-{name}', item_id=f'{user.username}-{name}',
+        institution_id=f'ins_{name}', institution_name=name,
+    )
+    accounts = plaid_client.accounts_get({'access_token': item.access_token})['accounts']
+    Account.objects.bulk_create(accounts_from_plaid(item, accounts))
+    return item
+
+
+# Tests talk to FakePlaidClient, not the Plaid rate limiter.
+@override_settings(PLAID_RATE_LIMIT_PER_MINUTE=0, PLAID_ITEM_RATE_LIMIT_PER_MINUTE=0)
+class PlaidTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakePlaidClient.reset()
+        self.plaid_client = FakePlaidClient(transactions_per_item=60)
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'Passw0rd-alice')
+        self.item = link_item(self.user, self.plaid_client)
+
+    def tearDown(self):
+        FakePlaidClient.reset()
+
+    def item_transactions(self, item=None):
+        return Transaction.objects.filter(account__plaid_item=item or self.item)
+
+
+class SyncTests(PlaidTestCase):
+    def test_sync_stores_rows_and_cursor(self):
+        result = sync_item(self.item, self.plaid_client)
+
+        self.assertEqual(result.inserted, 60)
+        self.assertEqual(self.item_transactions().count(), 60)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.transactions_cursor, '60')
+        self.assertEqual(self.item.sync_failures, 0)
+        self.assertGreater(self.item.next_sync_at, timezone.now())
+
+    def test_cursor_is_committed_with_the_rows(self):
+        # A failure after the rows were written rolls back the rows and the cursor together.
+        with mock.patch('core.sync.remove_transactions', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                sync_item(self.item, self.plaid_client)
+        self.item.refresh_from_db()
+        self.assertIsNone(self.item.transactions_cursor)
+        self.assertEqual(self.item_transactions().count(), 0)
+
+        # The next sync replays from the old cursor and catches up.
+        sync_item(self.item, self.plaid_client)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.transactions_cursor, '60')
+        self.assertEqual(self.item_transactions().count(), 60)
+
+    def test_incremental_sync_applies_changes_since_cursor(self):
+        sync_item(self.item, self.plaid_client)
+        transaction_id = f'{self.item.access_token}-txn-0'
+        self.plaid_client.modify_transaction(self.item.access_token, transaction_id, name='Renamed')
+        self.plaid_client.remove_transaction(self.item.access_token, f'{self.item.access_token}-txn-1')
+
+        result = sync_item(self.item, self.plaid_client)
+
+        self.assertEqual((result.updated, result.removed), (1, 1))
+        self.assertEqual(self.item_transactions().get(plaid_transaction_id=transaction_id).name, 'Renamed')
+        self.assertEqual(self.item_transactions().count(), 59)
+
+    def test_failure_backs_off(self):
+        self.plaid_client.failures[self.item.access_token] = make_api_exception(400, 'ITEM_LOGIN_REQUIRED')
+        before = timezone.now()
+
+        with self.assertRaises(Exception):
+            sync_item(self.item, self.plaid_client)
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.sync_failures, 1)
+        self.assertEqual(self.item.last_sync_error, 'ITEM_LOGIN_REQUIRED')
+        self.assertGreater(self.item.next_sync_at, before + timedelta(seconds=30))
+        self.assertEqual(self.item_transactions().count(), 0)
+
+    def test_one_failing_item_does_not_stop_the_rest(self):
+        broken = link_item(self.user, self.plaid_client, name='broken')
+        self.plaid_client.failures[broken.access_token] = make_api_exception(500, 'INTERNAL_SERVER_ERROR')
+
+        results = {item.pk: error for item, result, error in run_due_syncs(plaid_client=self.plaid_client)}
+
+        self.assertIsNone(results[self.item.pk])
+        self.assertIsNotNone(results[broken.pk])
+        self.assertEqual(self.item_transactions().count(), 60)
+        broken.refresh_from_db()
+        self.assertEqual(broken.sync_failures, 1)
+        self.assertGreater(broken.next_sync_at, timezone.now())
+
+    @override_settings(SYNC_PAGE_SIZE=20)
+    def test_mutation_during_pagination_restarts_from_stored_cursor(self):
+        sync_item(self.item, self.plaid_client)
+        for index in range(50):
+            self.plaid_client.add_transaction(self.item.access_token, {
+                'transaction_id': f'new-{index}', 'account_id': f'{self.item.access_token}-acc-0',
+                'name': 'Coffee', 'amount': 3.5, 'iso_currency_code': 'USD',
+                'date': timezone.localdate(), 'pending': False, 'category': ['Food and Drink'],
+            })
+        cursors = []
+        transactions_sync = self.plaid_client.transactions_sync
+
+        def flaky_sync(request):
+            cursors.append(request['cursor'])
+            # The second page of the first attempt finds the data changed underneath it.
+            if len(cursors) == 2:
+                raise make_api_exception(400, MUTATION_DURING_PAGINATION)
+            return transactions_sync(request)
+
+        with mock.patch.object(self.plaid_client, 'transactions_sync', side_effect=flaky_sync):
+            result = sync_item(self.item, self.plaid_client)
+
+        self.assertEqual(cursors, ['60', '80', '60', '80', '100'])
+        self.assertEqual(result.inserted, 50)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.transactions_cursor, '110')
+        self.assertEqual(self.item.sync_failures, 0)
+
+
+class PartitionTests(PlaidTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Each test's rollback puts the plain table back (DDL is transactional in
+        # Postgres); afterwards, make this process see it as plain again.
+        cls.addClassCleanup(partitions.table_state, refresh=True)
+
+    def setUp(self):
+        super().setUp()
+        partitions.rebuild_table(partitioned=True)
+
+    def plaid_transaction(self, transaction_id, day):
+        return {
+            'transaction_id': transaction_id, 'account_id': f'{self.item.access_token}-acc-0', 'name': 'Coffee',
+            'amount': 4.25, 'iso_currency_code': 'USD', 'date': day.isoformat(), 'pending': False,
+        }
+
+    def partition_exists(self, month):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [partitions.partition_name(month)])
+            return cursor.fetchone()[0] is not None
+
+    def test_sync_creates_partitions_before_ingesting(self):
+        with mock.patch('core.ingestion.ensure_partitions', wraps=partitions.ensure_partitions) as ensure:
+            sync_item(self.item, self.plaid_client)
+        # Once, from prepare_partitions ahead of the sync's transaction.
+        self.assertEqual(ensure.call_count, 1)
+        self.assertEqual(self.item_transactions().count(), 60)
+        for month in {partitions.month_start(day) for day in self.item_transactions().values_list('date', flat=True)}:
+            self.assertTrue(self.partition_exists(month))
+        self.assertEqual(find_inconsistencies(), [])
+
+    def test_writes_to_archived_months_are_skipped(self):
+        old_day = date(2020, 3, 14)
+        rows = [self.plaid_transaction('old-1', old_day), self.plaid_transaction('old-2', old_day)]
+        prepare_partitions(rows)
+        ingest_transactions(self.item, rows)
+        month = partitions.month_start(old_day)
+        with tempfile.TemporaryDirectory() as directory, mock.patch('core.partitions.os.fsync', wraps=os.fsync) as fsync:
+            archive = partitions.archive_partition(month, directory)
+        self.assertEqual(archive.rows, 2)
+        # The archive file and its directory are both synced before the partition is dropped.
+        self.assertEqual(fsync.call_count, 2)
+        rollups = list(SpendingRollup.objects.filter(period_start__gte=month).values_list('period', 'total', 'spend'))
+
+        changed = [dict(rows[0], amount=9.99), self.plaid_transaction('old-3', old_day)]
+        prepare_partitions(changed)
+        with self.assertLogs('core.ingestion', 'WARNING') as logs:
+            result = ingest_transactions(self.item, changed)
+
+        self.assertEqual((result.inserted, result.updated, result.skipped), (0, 0, 2))
+        self.assertIn('2020-03', logs.output[0])
+        self.assertFalse(self.partition_exists(month))
+        self.assertFalse(Transaction.objects.filter(date__gte=month, date__lt=date(2020, 4, 1)).exists())
+        self.assertEqual(
+            list(SpendingRollup.objects.filter(period_start__gte=month).values_list('period', 'total', 'spend')), rollups,
+        )
+
+
+
+class RollupTests(PlaidTestCase):
+    def test_account_ids_beyond_int_range(self):
+        account = Account.objects.create(
+            pk=2**31 + 7, plaid_item=self.item, plaid_account_id=f'{self.item.access_token}-acc-big', name='Savings',
+        )
+        day = timezone.localdate()
+        ingest_transactions(self.item, [{
+            'transaction_id': 'big-1', 'account_id': account.plaid_account_id, 'name': 'Coffee', 'amount': 4.25,
+            'iso_currency_code': 'USD', 'date': day.isoformat(), 'pending': False,
+        }])
+        refresh_rollups([(account.pk, day)])
+
+        self.assertEqual(SpendingRollup.objects.filter(account=account).count(), 2)
+        self.assertEqual(find_inconsistencies(), [])
+
+
+class ResponseCacheTests(PlaidTestCase):
+    url = '/api/core/transactions/?start_date=2000-01-01'
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_item(self.item, self.plaid_client)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_matching_etag_returns_304_without_running_the_view(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with mock.patch('core.views.FastTransactionSerializer.render') as render, self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        render.assert_not_called()
+
+    def test_repeated_request_is_served_from_the_cache(self):
+        first = self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_sync_invalidates_cached_pages(self):
+        first = self.client.get(self.url)
+        version = data_version(self.user.pk)
+        self.plaid_client.modify_transaction(self.item.access_token, f'{self.item.access_token}-txn-0', name='Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sync_item(self.item, self.plaid_client)
+
+        self.assertNotEqual(data_version(self.user.pk), version)
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertIn(b'Renamed', second.content)
+
+    def test_categorization_invalidates_cached_pages(self):
+        first = self.client.get(self.url)
+        transaction = self.item_transactions().order_by('pk').first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            write_categories([transaction.pk], ['Recategorized'])
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertIn(b'Recategorized', second.content)
+        self.assertNotIn(b'Recategorized', first.content)
+
+
+@override_settings(
+    PLAID_ENV='sandbox', PLAID_RATE_LIMIT_PER_MINUTE=0, PLAID_ITEM_RATE_LIMIT_PER_MINUTE=0,
+    PLAID_MAX_RETRIES=2, PLAID_RETRY_BACKOFF_SECONDS=0, PLAID_RETRY_BACKOFF_MAX_SECONDS=0,
+)
+class PlaidClientTests(SimpleTestCase):
+    def start_server(self, fail_every=0, fail_status=429):
+        server = start_stub_server(0, fail_every, fail_status=fail_status)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def setUp(self):
+        plaid_client.reset_plaid_client()
+        self.addCleanup(plaid_client.reset_plaid_client)
+
+    def test_client_is_shared_and_rebuilt_after_a_fork(self):
+        with override_settings(PLAID_HOST=self.start_server()):
+            client = plaid_client.get_plaid_client()
+            self.assertIs(plaid_client.get_plaid_client(), client)
+            client.categories_get({})
+
+            with mock.patch('core.plaid_client.os.getpid', return_value=plaid_client._clients_pid + 1):
+                child = plaid_client.get_plaid_client()
+
+            self.assertIsNot(child, client)
+            # The child's pool starts empty instead of sharing the parent's sockets.
+            self.assertEqual(plaid_client.plaid_client_stats(child)['requests'], 0)
+
+    def test_retries_rate_limits_and_server_errors(self):
+        for status in (429, 503):
+            with self.subTest(status=status):
+                client = plaid_client.build_plaid_client(self.start_server(fail_every=2, fail_status=status))
+                before = plaid_client.plaid_client_stats(client)['retries'].get(f'status {status}', 0)
+
+                client.categories_get({})
+                client.categories_get({})  # The second request fails once, then succeeds.
+
+                retries = plaid_client.plaid_client_stats(client)['retries'].get(f'status {status}', 0)
+                self.assertEqual(retries - before, 1)
+                self.assertEqual(plaid_client.plaid_client_stats(client)['requests'], 3)
+
+    def test_retries_wait_for_the_rate_limiter(self):
+        client = plaid_client.build_plaid_client(self.start_server(fail_every=1, fail_status=500))
+
+        with mock.patch('core.rate_limits.acquire') as acquire_call, self.assertRaises(ApiException):
+            client.categories_get({'access_token': 'secret'})
+
+        # One turn for the call and one for each of its two retries.
+        self.assertEqual(acquire_call.call_args_list, [mock.call('secret')] * 3)
+
+    def test_gives_up_after_max_retries(self):
+        client = plaid_client.build_plaid_client(self.start_server(fail_every=1, fail_status=500))
+
+        with self.assertRaises(ApiException) as raised:
+            client.categories_get({})
+
+        self.assertEqual(raised.exception.status, 500)
+        self.assertEqual(plaid_client.plaid_client_stats(client)['requests'], 3)
+
+
+def sample_webhooks(item_id):
+    """The recorded payloads replay_webhooks uses, addressed to ``item_id``."""
+    path = os.path.join(settings.BASE_DIR, 'core', 'management', 'commands', 'sample_webhooks.json')
+    with open(path) as f:
+        return [dict(payload, item_id=item_id) for payload in json.load(f)]
+
+
+@override_settings(PLAID_WEBHOOK_VERIFY=True)
+class WebhookTests(PlaidTestCase):
+    key_id = 'test-key'
+
+    def setUp(self):
+        super().setUp()
+        self.private_key = ec.generate_private_key(ec.SECP256R1())
+        jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(self.private_key.public_key()))
+        # verification_key finds it in the cache instead of asking Plaid.
+        cache.set(f'plaid-webhook-key:{self.key_id}', dict(jwk, kid=self.key_id, alg='ES256', expired_at=None))
+        self.item.next_sync_at = timezone.now() + timedelta(hours=1)
+        self.item.save(update_fields=['next_sync_at'])
+
+    def sign(self, body, private_key=None, iat=None, body_hash=None, key_id=None):
+        claims = {
+            'iat': int(time.time()) if iat is None else iat,
+            'request_body_sha256': body_hash or hashlib.sha256(body).hexdigest(),
+        }
+        return jwt.encode(claims, private_key or self.private_key, algorithm='ES256', headers={'kid': key_id or self.key_id})
+
+    def post(self, payload, **sign_options):
+        body = json.dumps(payload).encode()
+        return self.client.post(
+            '/api/core/plaid-webhook/', body, content_type='application/json',
+            HTTP_PLAID_VERIFICATION=self.sign(body, **sign_options),
+        )
+
+    def test_valid_signature_is_accepted(self):
+        body = json.dumps(sample_webhooks(self.item.item_id)[0]).encode()
+        verify_webhook(body, self.sign(body))
+
+    def test_rejects_bad_signature_stale_webhook_and_body_mismatch(self):
+        body = json.dumps(sample_webhooks(self.item.item_id)[0]).encode()
+        cases = {
+            'Invalid signature': self.sign(body, private_key=ec.generate_private_key(ec.SECP256R1())),
+            'too old': self.sign(body, iat=int(time.time()) - 10 * 60),
+            'does not match': self.sign(body, body_hash=hashlib.sha256(b'{}').hexdigest()),
+            'Missing': '',
+        }
+        for message, signed_jwt in cases.items():
+            with self.subTest(message), self.assertRaisesMessage(WebhookVerificationError, message):
+                verify_webhook(body, signed_jwt)
+
+    def test_rejected_webhook_leaves_the_item_alone(self):
+        with self.assertLogs('core.views', 'WARNING'):
+            response = self.post(sample_webhooks(self.item.item_id)[0], iat=int(time.time()) - 10 * 60)
+
+        self.assertEqual(response.status_code, 401)
+        self.item.refresh_from_db()
+        self.assertGreater(self.item.next_sync_at, timezone.now())
+
+    def test_sync_webhook_marks_the_item_due(self):
+        response = self.post(sample_webhooks(self.item.item_id)[0])
+
+        self.assertEqual(response.status_code, 200)
+        self.item.refresh_from_db()
+        self.assertLessEqual(self.item.next_sync_at, timezone.now())
+        self.assertEqual([item.pk for item, result, error in run_due_syncs(plaid_client=self.plaid_client)], [self.item.pk])
+
+    def mock_key_lookup(self, error):
+        plaid = mock.Mock()
+        plaid.webhook_verification_key_get.side_effect = error
+        patcher = mock.patch('core.webhooks.get_plaid_client', return_value=plaid)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return plaid.webhook_verification_key_get
+
+    def test_unknown_key_ids_are_not_looked_up_again(self):
+        lookup = self.mock_key_lookup(make_api_exception(400, 'INVALID_WEBHOOK_VERIFICATION_KEY_ID'))
+        body = json.dumps(sample_webhooks(self.item.item_id)[0]).encode()
+
+        for _ in range(3):
+            with self.assertRaisesMessage(WebhookVerificationError, 'unknown'):
+                verify_webhook(body, self.sign(body, key_id='forged'))
+
+        self.assertEqual(lookup.call_count, 1)
+
+    @override_settings(PLAID_WEBHOOK_KEY_LOOKUPS_PER_MINUTE=2)
+    def test_new_key_id_lookups_are_capped(self):
+        lookup = self.mock_key_lookup(make_api_exception(400, 'INVALID_WEBHOOK_VERIFICATION_KEY_ID'))
+        payload = sample_webhooks(self.item.item_id)[0]
+
+        with self.assertLogs('core.views', 'WARNING'):
+            statuses = [self.post(payload, key_id=f'forged-{n}').status_code for n in range(4)]
+
+        self.assertEqual(statuses, [401, 401, 503, 503])
+        self.assertEqual(lookup.call_count, 2)
+        self.assertIn('Retry-After', self.post(payload, key_id='forged-5'))
+
+    def test_plaid_failure_answers_503_and_backs_off(self):
+        lookup = self.mock_key_lookup(make_api_exception(500, 'INTERNAL_SERVER_ERROR'))
+        body = json.dumps(sample_webhooks(self.item.item_id)[0]).encode()
+
+        for _ in range(2):
+            with self.assertRaises(WebhookKeyUnavailable):
+                verify_webhook(body, self.sign(body, key_id='new-key'))
+
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_handle_webhook_outcomes(self):
+        sync_updates, default_update, item_error, login_repaired = sample_webhooks(self.item.item_id)
+
+        self.assertEqual(handle_webhook(default_update), 'sync requested')
+        self.assertEqual(handle_webhook(item_error), 'error recorded')
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.last_sync_error, 'ITEM_LOGIN_REQUIRED')
+        self.assertEqual(handle_webhook(login_repaired), 'sync requested')
+        self.item.refresh_from_db()
+        self.assertIsNone(self.item.last_sync_error)
+        self.assertEqual(handle_webhook(dict(sync_updates, item_id='unknown')), 'ignored, unknown item')
+
+
+class LazyImportTests(SimpleTestCase):
+    """The libraries benchmark_imports expects to load lazily stay out of a fresh worker."""
+
+    def test_worker_startup_skips_lazy_modules(self):
+        code = TARGETS['worker'] + '; import core.views'
+        total, modules = BenchmarkImports().import_times(code)
+
+        self.assertIn('core.views', modules)
+        self.assertEqual(sorted(module for module in modules if f'{module}.'.startswith(LAZY_MODULES)), [])
+
+
+class AuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bob', 'bob@example.com', 'Passw0rd-bob', first_name='Bob')
+
+    def test_user_comes_from_the_principal_cache(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            CachedJWTAuthentication().get_user(token)
+        with self.assertNumQueries(0):
+            user = CachedJWTAuthentication().get_user(token)
+            self.assertEqual(
+                {field: getattr(user, field) for field in PRINCIPAL_FIELDS},
+                {field: getattr(self.user, field) for field in PRINCIPAL_FIELDS},
+            )
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+
+    def test_password_change_revokes_tokens(self):
+        token = AccessToken.for_user(self.user)
+        self.user.set_password('Passw0rd-new')
+        self.user.save()
+
+        with self.assertRaisesMessage(AuthenticationFailed, 'password has been changed'):
+            CachedJWTAuthentication().get_user(token)
+
+
+class StubModel:
+    def predict(self, names):
+        return ['Travel' for _ in names]
+
+
+@override_settings(CLASSIFIER_CACHE_MAX_ENTRIES=3, CLASSIFIER_CACHE_EVICT_EVERY=5)
+class ClassifierCacheTests(TestCase):
+    def setUp(self):
+        classifier._added_since_eviction = 0
+
+    def predict(self, *names):
+        with self.captureOnCommitCallbacks(execute=True):
+            return classifier.predict_categories(list(names), model=StubModel(), version='test')
+
+    def test_cache_is_written_after_the_transaction_commits(self):
+        self.predict('ALPHA')
+        with self.captureOnCommitCallbacks() as callbacks:
+            categories = classifier.predict_categories(['ALPHA', 'BRAVO', 'ALPHA'], model=StubModel(), version='test')
+            self.assertEqual(categories, ['Travel', 'Travel', 'Travel'])
+            self.assertEqual(MerchantCategoryCache.objects.get(normalized_name='ALPHA').hits, 0)
+            self.assertFalse(MerchantCategoryCache.objects.filter(normalized_name='BRAVO').exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(MerchantCategoryCache.objects.get(normalized_name='ALPHA').hits, 1)
+        self.assertTrue(MerchantCategoryCache.objects.filter(normalized_name='BRAVO').exists())
+
+    def test_categorize_command_fails_fast_without_a_model(self):
+        target = 'core.management.commands.categorize_transactions.get_model'
+        for failure in ({'return_value': None}, {'side_effect': EOFError('truncated')}):
+            with self.subTest(**failure), mock.patch(target, **failure):
+                with self.assertRaises(CommandError):
+                    call_command('categorize_transactions', stdout=io.StringIO())
+
+    def test_eviction_runs_only_after_enough_new_entries(self):
+        with mock.patch('core.classifier.evict_cache', wraps=classifier.evict_cache) as evict:
+            self.predict('ALPHA', 'BRAVO')
+            self.predict('CHARLIE', 'DELTA')
+            self.assertEqual(evict.call_count, 0)
+            self.assertEqual(MerchantCategoryCache.objects.count(), 4)
+
+            self.predict('ECHO', 'ALPHA')
+
+        self.assertEqual(evict.call_count, 1)
+        self.assertEqual(MerchantCategoryCache.objects.count(), 3)
+        self.assertEqual(classifier._added_since_eviction, 0)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('carol', 'carol@example.com', 'Passw0rd-carol')
+        self.authorization = f'Bearer {AccessToken.for_user(user)}'
+
+    async def post(self, body):
+        request = AsyncRequestFactory().post(
+            '/api/core/set-access-token/', body, content_type='application/json', headers={'Authorization': self.authorization},
+        )
+        return await AsyncSetAccessTokenView.as_view()(request)
+
+    async def test_body_must_be_a_json_object(self):
+        for body in ('[]', '"x"', '1', 'null', '{'):
+            with self.subTest(body):
+                self.assertEqual((await self.post(body)).status_code, 400)
+
+    async def test_missing_fields_are_rejected(self):
+        self.assertEqual((await self.post('{}')).status_code, 400)
+
+
+@override_settings(PLAID_RATE_LIMIT_PER_MINUTE=60, PLAID_RATE_LIMIT_BURST=1, PLAID_ITEM_RATE_LIMIT_PER_MINUTE=0)
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_refunds_never_overfill_the_bucket(self):
+        refund('bucket', 60, 2, tokens=5)
+
+        self.assertEqual(reserve('bucket', 60, 2, tokens=2), 0)
+        self.assertAlmostEqual(reserve('bucket', 60, 2), 1, places=1)
+
+    def test_wait_limit_raises_instead_of_sleeping(self):
+        acquire()
+        with wait_limit(0), mock.patch('core.rate_limits.time.sleep') as sleep:
+            with self.assertRaises(RateLimited):
+                acquire()
+        sleep.assert_not_called()
+
+
+@override_settings(PLAID_MAX_CONCURRENCY=2, PLAID_MAX_CONCURRENCY_PER_USER=1)
+class FetchingTests(SimpleTestCase):
+    def setUp(self):
+        fetching._executor = None
+        self.addCleanup(setattr, fetching, '_executor', None)
+
+    def test_busy_user_does_not_block_the_pool(self):
+        items = [SimpleNamespace(pk=n, user_id=user_id, institution_id=None) for n, user_id in enumerate([1, 1, 1, 2])]
+        started = {}
+        begin = time.monotonic()
+
+        def fetch(item):
+            started[item.pk] = time.monotonic() - begin
+            time.sleep(0.2)
+            return item.pk
+
+        results = fetching.fetch_concurrently(items, fetch, timeout=5)
+
+        self.assertEqual([result.value for result in results], [0, 1, 2, 3])
+        # The other user's item starts right away instead of queueing behind the busy user's.
+        self.assertLess(started[3], 0.1)
+        self.assertGreater(started[2], 0.35)
+
+    def test_calls_waiting_for_a_slot_time_out(self):
+        items = [SimpleNamespace(pk=n, user_id=1, institution_id=None) for n in range(3)]
+
+        results = fetching.fetch_concurrently(items, lambda item: time.sleep(0.3), timeout=0.1)
+
+        self.assertTrue(all(isinstance(result.error, fetching.FetchTimeout) for result in results))
+        # Every slot is given back once the calls that did run have finished.
+        time.sleep(0.4)
+        self.assertTrue(fetching.user_slot(1).acquire(blocking=False))
+
+
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_not_served_without_a_token_in_production(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN=None, DEBUG=True)
+    def test_served_without_a_token_in_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='scrape-token', DEBUG=False)
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds', response.content)
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are checked against PostgreSQL')
+class QueryPlanTests(TestCase):
+    """check_query_plans on a tenth of its default seed: the hot queries keep their indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = seed(user_count=200, row_count=100_000)
+
+    def test_hot_queries_use_their_indexes(self):
+        for label, queryset, index_name in queries(self.user):
+            with self.subTest(label):
+                ok, used, plan = check_plan(queryset, index_name)
+                self.assertTrue(ok, f"{label} uses {sorted(used) or 'no index'}, expected {index_name}")
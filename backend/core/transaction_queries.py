@@ -0,0 +1,115 @@
+# backend/core/transaction_queries.py
+"""
+Filtering and keyset pagination for the transactions API.
+
+Pages are ordered newest first on ``(date, id)`` and a cursor is simply the
+``(date, id)`` of the last row of the previous page, so fetching page N costs
+the same as fetching page 1 - there is no OFFSET to skip over.
+"""
+import base64
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Q
+
+TRUE_VALUES = ('1', 'true', 'yes')
+FALSE_VALUES = ('0', 'false', 'no')
+
+
+class InvalidQuery(ValueError):
+    """A query parameter could not be understood. The message is safe to show to the client."""
+
+
+def parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise InvalidQuery(f"{name} must be in YYYY-MM-DD format.")
+
+
+def parse_amount(value, name):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise InvalidQuery(f"{name} must be a number.")
+
+
+def parse_account_ids(params):
+    """The ``account`` parameter (repeatable or comma separated) as a list of ids."""
+    try:
+        return [int(v) for value in params.getlist('account') for v in value.split(',') if v]
+    except ValueError:
+        raise InvalidQuery("account must be an account id.")
+
+
+def filter_transactions(queryset, params):
+    """
+    Applies the optional transaction filters from the query string.
+
+    Supported: account (id, repeatable or comma separated), min_amount,
+    max_amount, category (matches any element of the category list) and
+    pending (true/false). The date range is handled by the caller.
+    """
+    account_ids = parse_account_ids(params)
+    if account_ids:
+        queryset = queryset.filter(account_id__in=account_ids)
+    if params.get('min_amount'):
+        queryset = queryset.filter(amount__gte=parse_amount(params['min_amount'], 'min_amount'))
+    if params.get('max_amount'):
+        queryset = queryset.filter(amount__lte=parse_amount(params['max_amount'], 'max_amount'))
+    if params.get('category'):
+        # JSON containment (@>) so it works on Plaid's category lists, e.g. ["Food and Drink", "Coffee"].
+        queryset = queryset.filter(category__contains=[params['category']])
+    if params.get('pending'):
+        pending = params['pending'].lower()
+        if pending not in TRUE_VALUES + FALSE_VALUES:
+            raise InvalidQuery("pending must be true or false.")
+        queryset = queryset.filter(pending=pending in TRUE_VALUES)
+    return queryset
+
+
+def encode_cursor(transaction_date, transaction_id):
+    raw = f"{transaction_date.isoformat()}|{transaction_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_str, id_str = raw.split('|')
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(id_str)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidQuery("cursor is not valid.")
+
+
+def page_size(params):
+    """The requested page size, clamped to TRANSACTIONS_MAX_PAGE_SIZE."""
+    try:
+        limit = int(params.get('limit', settings.TRANSACTIONS_PAGE_SIZE))
+    except ValueError:
+        raise InvalidQuery("limit must be a positive integer.")
+    if limit < 1:
+        raise InvalidQuery("limit must be a positive integer.")
+    return min(limit, settings.TRANSACTIONS_MAX_PAGE_SIZE)
+
+
+def keyset_page(queryset, params, cursor_key=None):
+    """
+    Returns ``(rows, next_cursor)`` for one page of ``queryset``, newest first.
+
+    ``next_cursor`` is None on the last page. ``cursor_key`` returns a row's
+    ``(date, id)``; the default reads them off a model instance.
+    """
+    limit = page_size(params)
+    queryset = queryset.order_by('-date', '-id')
+    if params.get('cursor'):
+        cursor_date, cursor_id = decode_cursor(params['cursor'])
+        queryset = queryset.filter(Q(date__lt=cursor_date) | Q(date=cursor_date, id__lt=cursor_id))
+    # Fetch one extra row to learn whether there is a next page without a COUNT(*).
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    cursor_date, cursor_id = cursor_key(rows[-1]) if cursor_key else (rows[-1].date, rows[-1].id)
+    return rows, encode_cursor(cursor_date, cursor_id)
@@ -1,15 +1,25 @@
+from django.conf import settings
 from django.urls import path
-from .views import UserCreateView, ProtectedDataView, CreateLinkTokenView, SetAccessTokenView, TransactionsView
+from .views import UserCreateView, ProtectedDataView, CreateLinkTokenView, SetAccessTokenView, TransactionsView, SpendingSummaryView, PlaidWebhookView
 from django.http import JsonResponse
 
 def health_check(request):
     return JsonResponse({"status": "ok", "message": "Core API is running!"})
 
+if settings.SERVER_MODE == 'asgi':
+    # Under an ASGI server the Plaid-bound endpoints don't hold a worker while Plaid answers.
+    from .async_views import AsyncCreateLinkTokenView, AsyncSetAccessTokenView
+    link_token_view, access_token_view = AsyncCreateLinkTokenView, AsyncSetAccessTokenView
+else:
+    link_token_view, access_token_view = CreateLinkTokenView, SetAccessTokenView
+
 urlpatterns = [
     path('', health_check, name='health-check'),
     path('register/', UserCreateView.as_view(), name='user_register'),
     path('protected-data/', ProtectedDataView.as_view(), name='protected_data'),
-    path('create-link-token/', CreateLinkTokenView.as_view(), name='create_link_token'),
-    path('set-access-token/', SetAccessTokenView.as_view(), name='set_access_token'),
+    path('create-link-token/', link_token_view.as_view(), name='create_link_token'),
+    path('set-access-token/', access_token_view.as_view(), name='set_access_token'),
     path('transactions/', TransactionsView.as_view(), name='get_transactions'),
+    path('summary/', SpendingSummaryView.as_view(), name='spending_summary'),
+    path('plaid-webhook/', PlaidWebhookView.as_view(), name='plaid_webhook'),
 ]
\ No newline at end of file
@@ -1,41 +1,36 @@
 from django.shortcuts import render
 from django.contrib.auth.models import User
 from rest_framework import generics, permissions, status
-from .serializers import UserSerializer, TransactionSerializer
+from .serializers import UserSerializer, TransactionSerializer, FastTransactionSerializer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.conf import settings
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
 from plaid.exceptions import ApiException
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+import csv
+import hmac
 import json
-from .models import PlaidItem, Account, Transaction
+import logging
+import math
+from decimal import Decimal
+from .models import PlaidItem, Account, Transaction, SpendingRollup
 from datetime import datetime, timedelta
-import plaid
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import MyTokenObtainPairSerializer
-from plaid.api import plaid_api
-
-# Helper function to initialize the Plaid client
-def get_plaid_client():
-    host = plaid.Environment.Sandbox
-    if settings.PLAID_ENV == 'development':
-        host = plaid.Environment.Development
-    elif settings.PLAID_ENV == 'production':
-        host = plaid.Environment.Production
-    
-    configuration = plaid.Configuration(
-        host=host,
-        api_key={
-            'clientId': settings.PLAID_CLIENT_ID,
-            'secret': settings.PLAID_SANDBOX_SECRET,
-        }
-    )
-    api_client = plaid.ApiClient(configuration)
-    return plaid_api.PlaidApi(api_client)
+from .plaid_client import get_plaid_client
+from .sync import request_sync
+from .fetching import fetch_concurrently, FetchTimeout
+from .rate_limits import RateLimited
+from .webhooks import WebhookKeyUnavailable, WebhookVerificationError, handle_webhook, parse_webhook, verify_webhook
+from .transaction_queries import InvalidQuery, filter_transactions, keyset_page, parse_account_ids, parse_date
+from .rollups import summarize_spending
+from .response_cache import bump_data_version, cache_response
+from .metrics import plaid_institution, record_rows, render_metrics, timed
+from django.db.models import Count, Min, Q
 
+logger = logging.getLogger(__name__)
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
@@ -55,20 +50,56 @@ class ProtectedDataView(APIView):
         }
         return Response(content)
 
+def link_token_options():
+    """Optional /link/token/create fields from the settings."""
+    # How far back Plaid pulls history for the item; backfill_transactions reads the same window.
+    options = {'transactions': {'days_requested': settings.TRANSACTIONS_HISTORY_DAYS}}
+    if settings.PLAID_WEBHOOK_URL:
+        # Plaid then tells us when the new item has transactions to sync (PlaidWebhookView).
+        options['webhook'] = settings.PLAID_WEBHOOK_URL
+    return options
+
+
+def accounts_from_plaid(plaid_item, accounts):
+    """Unsaved Account rows for the accounts in an /accounts/get response."""
+    return [
+        Account(
+            plaid_item=plaid_item,
+            plaid_account_id=account_data['account_id'],
+            name=account_data['name'],
+            mask=account_data['mask'],
+            account_type=account_data['type'],
+            account_subtype=account_data['subtype'],
+            current_balance=account_data['balances']['current'],
+            available_balance=account_data['balances']['available'],
+            currency_code=account_data['balances']['iso_currency_code']
+        )
+        for account_data in accounts
+    ]
+
+
+def rate_limited_response(error):
+    """Our share of the Plaid rate limit is used up for longer than a request should wait (core/rate_limits.py)."""
+    response = JsonResponse({'error': 'Too many requests to Plaid right now, please try again shortly.'}, status=503)
+    response['Retry-After'] = str(math.ceil(error.retry_after))
+    return response
+
 class CreateLinkTokenView(APIView):
     permission_classes = [IsAuthenticated]
     def post(self, request):
         try:
             plaid_client = get_plaid_client() # Initialize client here
-            plaid_request = LinkTokenCreateRequest(
-                user=LinkTokenCreateRequestUser(client_user_id=str(request.user.id)),
-                client_name=settings.APP_NAME,
-                products=settings.PLAID_PRODUCTS,
-                country_codes=settings.PLAID_COUNTRY_CODES,
-                language='en',
-            )
-            response = plaid_client.link_token_create(plaid_request)
+            response = plaid_client.link_token_create({
+                'user': {'client_user_id': str(request.user.id)},
+                'client_name': settings.APP_NAME,
+                'products': settings.PLAID_PRODUCTS,
+                'country_codes': settings.PLAID_COUNTRY_CODES,
+                'language': 'en',
+                **link_token_options(),
+            })
             return Response(response.to_dict())
+        except RateLimited as e:
+            return rate_limited_response(e)
         except ApiException as e:
             error_response = json.loads(e.body)
             return JsonResponse({'error': error_response}, status=e.status)
@@ -88,7 +119,8 @@ class SetAccessTokenView(APIView):
             return Response({'error': f'You have already linked an account from {institution_name}.'}, status=409)
         try:
             plaid_client = get_plaid_client() # Initialize client here
-            exchange_response = plaid_client.item_public_token_exchange({'public_token': public_token})
+            with plaid_institution(institution_id):
+                exchange_response = plaid_client.item_public_token_exchange({'public_token': public_token})
             access_token = exchange_response['access_token']
             item_id = exchange_response['item_id']
             plaid_item = PlaidItem.objects.create(
@@ -98,71 +130,236 @@ class SetAccessTokenView(APIView):
                 institution_name=institution_name,
                 institution_id=institution_id
             )
-            try:
-                accounts_response = plaid_client.accounts_get({'access_token': access_token})
-                for account_data in accounts_response['accounts']:
-                    Account.objects.create(
-                        plaid_item=plaid_item,
-                        plaid_account_id=account_data['account_id'],
-                        name=account_data['name'],
-                        mask=account_data['mask'],
-                        account_type=account_data['type'],
-                        account_subtype=account_data['subtype'],
-                        current_balance=account_data['balances']['current'],
-                        available_balance=account_data['balances']['available'],
-                        currency_code=account_data['balances']['iso_currency_code']
-                    )
-                return Response({'message': f"Access token for {institution_name} saved and accounts created successfully."}, status=201)
-            except ApiException as e:
+            # New items have no next_sync_at, so the sync worker picks them up on its next poll.
+            bump_data_version([request.user.pk])
+
+            # Goes through the shared fetch pool so a slow institution is cut off at
+            # PLAID_ITEM_TIMEOUT_SECONDS instead of holding the worker until Gunicorn's timeout.
+            [fetched] = fetch_concurrently(
+                [plaid_item], lambda item: plaid_client.accounts_get({'access_token': item.access_token})
+            )
+            if not fetched.ok:
+                if not isinstance(fetched.error, (ApiException, FetchTimeout, RateLimited)):
+                    raise fetched.error
+                logger.warning(f"Could not fetch accounts for {plaid_item}: {fetched.error}", extra={'item_id': plaid_item.pk})
                 return JsonResponse({'error': 'Could not fetch accounts, but item was linked.'}, status=207)
+            Account.objects.bulk_create(accounts_from_plaid(plaid_item, fetched.value['accounts']))
+            return Response({'message': f"Access token for {institution_name} saved and accounts created successfully."}, status=201)
+        except RateLimited as e:
+            return rate_limited_response(e)
         except ApiException as e:
             error_response = json.loads(e.body)
             return JsonResponse({'error': error_response}, status=e.status)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
+class PlaidWebhookView(APIView):
+    """
+    Receives Plaid webhooks (see core/webhooks.py). Plaid doesn't send a JWT,
+    so the request is authenticated by its Plaid-Verification signature instead.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        body = request.body
+        if settings.PLAID_WEBHOOK_VERIFY:
+            try:
+                verify_webhook(body, request.headers.get('Plaid-Verification'))
+            except WebhookVerificationError as e:
+                logger.warning(f"Rejected Plaid webhook: {e}")
+                return Response({'error': 'Webhook verification failed.'}, status=401)
+            except WebhookKeyUnavailable as e:
+                # Couldn't fetch the signing key; a non-2xx makes Plaid retry later.
+                logger.error(f"Could not verify Plaid webhook: {e}")
+                return Response({'error': 'Webhook could not be verified right now.'}, status=503)
+            except RateLimited as e:
+                logger.warning(f"Could not verify Plaid webhook: {e}")
+                return rate_limited_response(e)
+        payload = parse_webhook(body)
+        if payload is None:
+            return Response({'error': 'Body must be a JSON object.'}, status=400)
+        outcome = handle_webhook(payload)
+        logger.info(
+            f"Plaid webhook {payload.get('webhook_type')} {payload.get('webhook_code')} for {payload.get('item_id')}: {outcome}",
+            extra={'webhook_type': payload.get('webhook_type'), 'webhook_code': payload.get('webhook_code'),
+                   'plaid_item_id': payload.get('item_id'), 'outcome': outcome},
+        )
+        return Response({'status': 'ok'})
+
+# Rows fetched per round trip when streaming an export.
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """A file-like object whose write() just hands the value back, for streaming csv.writer output."""
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(queryset, serializer):
+    encoder = JSONEncoder(ensure_ascii=False)
+    for values in serializer.values(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield encoder.encode(serializer.to_representation(values)) + '\n'
+
+
+def stream_csv(queryset, serializer):
+    writer = csv.writer(Echo())
+    field_names = serializer.field_names
+    yield writer.writerow(field_names)
+    for values in serializer.values(queryset).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = serializer.to_representation(values)
+        yield writer.writerow(
+            '; '.join(row[name]) if name == 'category' and row[name] else row[name]
+            for name in field_names
+        )
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', stream_ndjson),
+    'csv': ('text/csv', stream_csv),
+}
+
+
 class TransactionsView(APIView):
+    """
+    Returns the user's stored transactions for a date range, newest first.
+
+    This view never talks to Plaid: transactions are pulled in the background
+    by `manage.py sync_transactions`. Pass `?refresh=1` to ask the worker to
+    sync this user's items right away; the response is then 202 and carries
+    whatever is already stored. `X-Last-Synced-At` tells the client how fresh
+    the data is (the oldest successful sync across the user's items).
+
+    Query parameters:
+    - start_date / end_date (YYYY-MM-DD, default: the last 30 days)
+    - account, min_amount, max_amount, category, pending: filters
+    - fields: comma separated list of fields to return
+    - limit / cursor: the body is one page (a JSON array). When there are more
+      rows, `X-Next-Cursor` (and a `Link: rel="next"` header) hold the cursor
+      for the next page.
+    - export=ndjson|csv: stream every matching row instead of one page; memory
+      use stays flat however long the history is.
+
+    Pages are cached per user and answer If-None-Match with 304 until the
+    user's data changes (see core/response_cache.py).
+    """
     permission_classes = [IsAuthenticated]
+    @cache_response
     def get(self, request):
         plaid_items = PlaidItem.objects.filter(user=request.user)
         if not plaid_items.exists():
             return Response({'error': 'No bank accounts linked.'}, status=404)
+        params = request.query_params
         try:
-            plaid_client = get_plaid_client() # Initialize client here
-            end_date_str = request.query_params.get('end_date', datetime.now().date().isoformat())
-            start_date_str = request.query_params.get('start_date', (datetime.now().date() - timedelta(days=30)).isoformat())
-            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-            print(f"Fetching transactions from {start_date} to {end_date}")
-            for item in plaid_items:
-                access_token = item.access_token
-                plaid_request = {"access_token": access_token, "start_date": start_date, "end_date": end_date}
-                response = plaid_client.transactions_get(plaid_request)
-                for plaid_transaction in response['transactions']:
-                    try:
-                        account = Account.objects.get(plaid_account_id=plaid_transaction['account_id'])
-                        Transaction.objects.update_or_create(
-                            plaid_transaction_id=plaid_transaction['transaction_id'],
-                            defaults={
-                                'account': account,
-                                'name': plaid_transaction['name'],
-                                'amount': plaid_transaction['amount'],
-                                'iso_currency_code': plaid_transaction['iso_currency_code'],
-                                'date': plaid_transaction['date'],
-                                'pending': plaid_transaction['pending'],
-                            }
-                        )
-                    except Account.DoesNotExist:
-                        print(f"Skipping transaction because account {plaid_transaction['account_id']} not found.")
-            user_accounts = Account.objects.filter(plaid_item__in=plaid_items)
-            all_transactions = Transaction.objects.filter(
-                account__in=user_accounts, date__gte=start_date, date__lte=end_date
-            ).order_by('-date')
-            serializer = TransactionSerializer(all_transactions, many=True)
-            return Response(serializer.data)
-        except ApiException as e:
-            error_response = json.loads(e.body)
-            return JsonResponse({'error': error_response}, status=e.status)
-        except Exception as e:
-            print(f"An unexpected error occurred in TransactionsView: {e}")
-            return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+            end_date = parse_date(params.get('end_date', datetime.now().date().isoformat()), 'end_date')
+            start_date = parse_date(params.get('start_date', (datetime.now().date() - timedelta(days=30)).isoformat()), 'start_date')
+            fields = [f for f in params['fields'].split(',') if f] if params.get('fields') else None
+            serializer = TransactionSerializer(fields=fields)
+            if fields and set(fields) - set(serializer.fields):
+                raise InvalidQuery(f"Unknown fields: {', '.join(sorted(set(fields) - set(serializer.fields)))}.")
+            export = params.get('export')
+            if export and export not in EXPORT_FORMATS:
+                raise InvalidQuery(f"export must be one of: {', '.join(EXPORT_FORMATS)}.")
+            transactions = filter_transactions(
+                Transaction.objects.filter(
+                    account__plaid_item__user=request.user, date__gte=start_date, date__lte=end_date
+                ),
+                params,
+            )
+            # Plain JSON and the exports skip DRF's per-field serializer
+            # machinery; the browsable API still goes through TransactionSerializer.
+            fast = FastTransactionSerializer(fields=fields)
+            use_fast = request.accepted_renderer.format == 'json'
+            if use_fast and not export:
+                page, next_cursor = keyset_page(
+                    fast.values(transactions, extra=('date', 'id')), params, cursor_key=lambda row: row[-2:]
+                )
+            elif not export:
+                page, next_cursor = keyset_page(transactions, params)
+        except InvalidQuery as e:
+            return Response({'error': str(e)}, status=400)
+
+        if export:
+            content_type, stream = EXPORT_FORMATS[export]
+            response = StreamingHttpResponse(stream(transactions.order_by('-date', '-id'), fast), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="transactions-{start_date}-{end_date}.{export}"'
+            return response
+
+        refresh = params.get('refresh', '').lower() in ('1', 'true', 'yes')
+        if refresh:
+            request_sync(plaid_items)
+        status_code = 202 if refresh else 200
+        with timed('serialize'):
+            if use_fast:
+                response = HttpResponse(fast.render(page), content_type='application/json', status=status_code)
+            else:
+                response = Response(TransactionSerializer(page, many=True, fields=fields).data, status=status_code)
+        record_rows(len(page))
+        if next_cursor:
+            next_params = params.copy()
+            next_params['cursor'] = next_cursor
+            next_params.pop('refresh', None)
+            response['X-Next-Cursor'] = next_cursor
+            response['Link'] = f'<{request.build_absolute_uri(request.path)}?{next_params.urlencode()}>; rel="next"'
+        sync_state = plaid_items.aggregate(
+            oldest_sync=Min('last_synced_at'),
+            never_synced=Count('pk', filter=Q(last_synced_at__isnull=True)),
+        )
+        # An item that has never been synced means the data is incomplete, so report no timestamp.
+        last_synced_at = None if sync_state['never_synced'] else sync_state['oldest_sync']
+        response['X-Last-Synced-At'] = last_synced_at.isoformat() if last_synced_at else ''
+        return response
+
+
+class SpendingSummaryView(APIView):
+    """
+    Spend per category over a date range, answered from the spending rollups
+    (see core/rollups.py) rather than by scanning transactions.
+
+    Query parameters:
+    - start_date / end_date (YYYY-MM-DD, default: the last 30 days)
+    - account: only these accounts (id, repeatable or comma separated)
+
+    `spend` sums outflows only (positive amounts, as on the dashboard chart);
+    `total` is the net of all amounts. Cached like TransactionsView.
+    """
+    permission_classes = [IsAuthenticated]
+    @cache_response
+    def get(self, request):
+        params = request.query_params
+        try:
+            end_date = parse_date(params.get('end_date', datetime.now().date().isoformat()), 'end_date')
+            start_date = parse_date(params.get('start_date', (datetime.now().date() - timedelta(days=30)).isoformat()), 'start_date')
+            if start_date > end_date:
+                raise InvalidQuery("start_date must not be after end_date.")
+            rollups = SpendingRollup.objects.filter(user=request.user)
+            account_ids = parse_account_ids(params)
+            if account_ids:
+                rollups = rollups.filter(account_id__in=account_ids)
+        except InvalidQuery as e:
+            return Response({'error': str(e)}, status=400)
+
+        categories = list(summarize_spending(rollups, start_date, end_date))
+        return Response({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'total_spend': str(sum((row['spend'] for row in categories), Decimal('0.00'))),
+            'categories': [
+                {'category': row['category'], 'spend': str(row['spend']), 'total': str(row['total']), 'count': row['count']}
+                for row in categories
+            ],
+        })
+
+
+def metrics_view(request):
+    """
+    Prometheus metrics (see core/metrics.py), behind METRICS_TOKEN. Without a
+    token they are only served with DEBUG on; otherwise /metrics is a 404.
+    """
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            raise Http404
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return JsonResponse({'error': 'Invalid metrics token.'}, status=401)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
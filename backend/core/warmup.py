@@ -0,0 +1,45 @@
+# backend/core/warmup.py
+"""
+Loads what the first requests would otherwise pay for.
+
+The plaid SDK's API module (about 450 generated model modules) and the
+URLconf with every view are loaded lazily, so processes that never need them
+start fast. A web worker needs both, though. With GUNICORN_PRELOAD=True,
+gunicorn.conf.py calls warm_up() in the master after loading the app and
+before forking, so every worker starts with them loaded and shares those
+memory pages copy-on-write instead of loading its own copy.
+
+The transaction classifier is left out: web workers never categorize (the
+sync worker does), so loading scikit-learn there would only cost memory.
+
+Nothing here keeps a connection open across the fork: the Plaid client's
+pool connects on first use and is rebuilt per process anyway (see
+core/plaid_client.py), and database connections are closed at the end.
+"""
+import logging
+import time
+
+from django.db import connections
+from django.urls import get_resolver
+
+from .plaid_client import get_plaid_client
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Imports the views and builds the Plaid client. Returns seconds per step."""
+    timings = {}
+    for name, step in (
+        ('urls', lambda: get_resolver().url_patterns),
+        ('plaid', get_plaid_client),
+    ):
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    connections.close_all()
+    logger.info(
+        "Warmed up: " + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items()),
+        extra={f'{name}_ms': round(seconds * 1000, 1) for name, seconds in timings.items()},
+    )
+    return timings
@@ -0,0 +1,166 @@
+# backend/core/webhooks.py
+"""
+Plaid webhooks.
+
+Plaid tells us when an item has new transactions or runs into trouble, so
+items only need to be synced when something actually changed. A webhook is
+verified (verify_webhook), then handle_webhook marks the item due so the sync
+worker picks it up on its next poll and pulls the changes from its cursor.
+Neither step calls Plaid, except to fetch a signing key the first time it is
+seen.
+
+Verification follows https://plaid.com/docs/api/webhooks/webhook-verification/:
+the Plaid-Verification header is an ES256 JWT, signed with a key fetched
+from /webhook_verification_key/get, whose ``request_body_sha256`` claim must
+match the body. Set PLAID_WEBHOOK_VERIFY=false to post recorded payloads to
+a local server (it is off by default with PLAID_ENV=fake).
+
+The key id comes from an unauthenticated header, so key fetches are kept
+from costing the sync budget: a key id Plaid doesn't know is remembered as
+unknown for KEY_MISS_CACHE_SECONDS, fetches of new key ids are capped at
+PLAID_WEBHOOK_KEY_LOOKUPS_PER_MINUTE, and a fetch never waits for the shared
+rate limiter (core/rate_limits.py) - it gets RateLimited instead.
+"""
+import hashlib
+import hmac
+import json
+import time
+
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from plaid.exceptions import ApiException
+
+from . import rate_limits
+from .models import PlaidItem
+from .plaid_client import get_plaid_client
+from .rate_limits import RateLimited
+from .sync import request_sync
+
+# Webhooks older than this are rejected, so a captured one can't be replayed later.
+MAX_WEBHOOK_AGE_SECONDS = 5 * 60
+# Signing keys are re-fetched this often, to notice when Plaid expires one.
+KEY_CACHE_SECONDS = 60 * 60
+# Key ids Plaid doesn't know aren't asked about again for this long.
+KEY_MISS_CACHE_SECONDS = 5 * 60
+# After Plaid failed to answer for a key, webhooks signed with it get a 503 for this long without asking again.
+KEY_RETRY_SECONDS = 30
+UNKNOWN_KEY = 'unknown'
+UNAVAILABLE_KEY = 'unavailable'
+KEY_LOOKUP_BUCKET = 'plaid-webhook-key-lookups'
+
+# TRANSACTIONS webhook codes that mean there is something new to sync.
+SYNC_CODES = {
+    'SYNC_UPDATES_AVAILABLE', 'INITIAL_UPDATE', 'HISTORICAL_UPDATE', 'DEFAULT_UPDATE', 'TRANSACTIONS_REMOVED',
+}
+# ITEM webhook codes that mean the item can't be synced until the user fixes it in Link.
+ITEM_ERROR_CODES = {'ERROR', 'PENDING_EXPIRATION', 'USER_PERMISSION_REVOKED'}
+
+
+class WebhookVerificationError(Exception):
+    """The webhook did not come from Plaid, or not for this body."""
+
+
+class WebhookKeyUnavailable(Exception):
+    """Plaid couldn't be asked for the signing key right now; the webhook should be retried."""
+
+
+def verification_key(key_id):
+    """
+    Plaid's public key ``key_id`` as a JWK dict, or None if it has expired or
+    Plaid doesn't know it. Raises WebhookKeyUnavailable if Plaid failed to
+    answer, and RateLimited if too many new key ids were looked up lately.
+    """
+    cache_key = f'plaid-webhook-key:{key_id}'
+    key = cache.get(cache_key)
+    if key == UNKNOWN_KEY:
+        return None
+    if key == UNAVAILABLE_KEY:
+        raise WebhookKeyUnavailable(f"Plaid recently failed to return key {key_id}.")
+    if key is None:
+        per_minute = settings.PLAID_WEBHOOK_KEY_LOOKUPS_PER_MINUTE
+        wait = rate_limits.reserve(KEY_LOOKUP_BUCKET, per_minute, per_minute)
+        if wait:
+            rate_limits.refund(KEY_LOOKUP_BUCKET, per_minute, per_minute)
+            raise RateLimited(wait)
+        try:
+            with rate_limits.wait_limit(0):
+                response = get_plaid_client().webhook_verification_key_get({'key_id': key_id})
+        except ApiException as e:
+            if e.status is not None and 400 <= e.status < 500 and e.status != 429:
+                cache.set(cache_key, UNKNOWN_KEY, KEY_MISS_CACHE_SECONDS)
+                return None
+            cache.set(cache_key, UNAVAILABLE_KEY, KEY_RETRY_SECONDS)
+            raise WebhookKeyUnavailable(f"Plaid failed to return key {key_id}: {e.status} {e.reason}")
+        key = response['key'].to_dict()
+        cache.set(cache_key, key, KEY_CACHE_SECONDS)
+    return None if key.get('expired_at') else key
+
+
+def verify_webhook(body, signed_jwt):
+    """
+    Checks that ``body`` (the raw request bytes) was sent by Plaid, given the
+    Plaid-Verification header. Raises WebhookVerificationError if not, and
+    WebhookKeyUnavailable or RateLimited if it can't tell right now.
+    """
+    if not signed_jwt:
+        raise WebhookVerificationError("Missing Plaid-Verification header.")
+    try:
+        header = jwt.get_unverified_header(signed_jwt)
+    except jwt.InvalidTokenError as e:
+        raise WebhookVerificationError(f"Malformed Plaid-Verification header: {e}")
+    if header.get('alg') != 'ES256' or not header.get('kid'):
+        raise WebhookVerificationError("Plaid-Verification header is not an ES256 JWT with a key id.")
+
+    key = verification_key(header['kid'])
+    if key is None:
+        raise WebhookVerificationError(f"Signing key {header['kid']} is unknown or has expired.")
+    try:
+        claims = jwt.decode(
+            signed_jwt, jwt.PyJWK(key, 'ES256').key, algorithms=['ES256'], options={'require': ['iat']},
+        )
+    except jwt.InvalidTokenError as e:
+        raise WebhookVerificationError(f"Invalid signature: {e}")
+    if claims['iat'] < time.time() - MAX_WEBHOOK_AGE_SECONDS:
+        raise WebhookVerificationError("Webhook is too old.")
+    body_hash = hashlib.sha256(body).hexdigest()
+    if not hmac.compare_digest(body_hash, str(claims.get('request_body_sha256', ''))):
+        raise WebhookVerificationError("Body does not match the signed hash.")
+
+
+def handle_webhook(payload):
+    """
+    Acts on a verified webhook payload (a dict). Returns a short description
+    of what was done, for logs and replays.
+    """
+    webhook_type = payload.get('webhook_type')
+    webhook_code = payload.get('webhook_code')
+    items = PlaidItem.objects.filter(item_id=payload.get('item_id'))
+    if not payload.get('item_id') or not items.exists():
+        return "ignored, unknown item"
+
+    if webhook_type == 'TRANSACTIONS' and webhook_code in SYNC_CODES:
+        # Already-due items keep their place; request_sync leaves them alone.
+        request_sync(items)
+        return "sync requested"
+
+    if webhook_type == 'ITEM' and webhook_code in ITEM_ERROR_CODES:
+        error = payload.get('error') or {}
+        items.update(last_sync_error=error.get('error_code') or webhook_code)
+        return "error recorded"
+
+    if webhook_type == 'ITEM' and webhook_code == 'LOGIN_REPAIRED':
+        items.update(last_sync_error=None, sync_failures=0, next_sync_at=timezone.now())
+        return "sync requested"
+
+    return "ignored"
+
+
+def parse_webhook(body):
+    """The JSON payload of a webhook body, or None if it isn't a JSON object."""
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        return None
+    return payload if isinstance(payload, dict) else None
@@ -12,8 +12,19 @@ python manage.py migrate
 echo "Collecting static files..."
 python manage.py collectstatic --no-input
 
-# Start Gunicorn server
+# Gunicorn workers write their metrics here so /metrics can add them all up.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Start the server
 # We bind to 0.0.0.0 to allow traffic from outside the container.
 # The port is 8000, which we EXPOSE in the Dockerfile.
+# GUNICORN_PRELOAD=True makes gunicorn.conf.py load the app once before forking the workers.
+# SERVER_MODE=asgi serves the async Plaid views from Uvicorn instead of Gunicorn.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting Uvicorn server..."
+    exec uvicorn fininsight_ai_backend.asgi:application --host 0.0.0.0 --port 8000 --log-level debug --timeout-keep-alive 120
+fi
 echo "Starting Gunicorn server with debug logging..."
 gunicorn fininsight_ai_backend.wsgi:application --bind 0.0.0.0:8000 --log-level debug --log-file - --timeout 120
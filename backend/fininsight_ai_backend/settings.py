@@ -2,10 +2,6 @@ from pathlib import Path
 from datetime import timedelta
 import os
 from dotenv import load_dotenv
-import plaid
-from plaid.api import plaid_api
-from plaid.model.country_code import CountryCode
-from plaid.model.products import Products
 import dj_database_url
 
 APP_NAME = "FinInsight AI"
@@ -20,10 +16,13 @@ DEBUG = os.getenv('DEBUG', 'False') == 'True'
 ALLOWED_HOSTS = ["*"]
 
 INSTALLED_APPS = ['django.contrib.admin', 'django.contrib.auth', 'django.contrib.contenttypes', 'django.contrib.sessions', 'django.contrib.messages', 'django.contrib.staticfiles', 'corsheaders', 'core', 'rest_framework', 'rest_framework_simplejwt']
-MIDDLEWARE = ['corsheaders.middleware.CorsMiddleware', 'django.middleware.security.SecurityMiddleware', 'whitenoise.middleware.WhiteNoiseMiddleware', 'django.contrib.sessions.middleware.SessionMiddleware', 'django.middleware.common.CommonMiddleware', 'django.middleware.csrf.CsrfViewMiddleware', 'django.contrib.auth.middleware.AuthenticationMiddleware', 'django.contrib.messages.middleware.MessageMiddleware', 'django.middleware.clickjacking.XFrameOptionsMiddleware']
+MIDDLEWARE = ['core.metrics.MetricsMiddleware', 'corsheaders.middleware.CorsMiddleware', 'django.middleware.security.SecurityMiddleware', 'whitenoise.middleware.WhiteNoiseMiddleware', 'django.contrib.sessions.middleware.SessionMiddleware', 'django.middleware.common.CommonMiddleware', 'django.middleware.csrf.CsrfViewMiddleware', 'django.contrib.auth.middleware.AuthenticationMiddleware', 'django.contrib.messages.middleware.MessageMiddleware', 'django.middleware.clickjacking.XFrameOptionsMiddleware']
 ROOT_URLCONF = 'fininsight_ai_backend.urls'
 TEMPLATES = [{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIRS': [], 'APP_DIRS': True, 'OPTIONS': {'context_processors': ['django.template.context_processors.request', 'django.contrib.auth.context_processors.auth', 'django.contrib.messages.context_processors.messages']}}]
 WSGI_APPLICATION = 'fininsight_ai_backend.wsgi.application'
+ASGI_APPLICATION = 'fininsight_ai_backend.asgi.application'
+# 'wsgi' (Gunicorn, sync views) or 'asgi' (Uvicorn, async views for the Plaid-bound endpoints); see entrypoint.sh.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
 # In settings.py
 
 # Replace your existing DATABASES dictionary with this one.
@@ -35,8 +34,26 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Connections are checked before they are reused, so a restarted database doesn't fail the next request.
+        'CONN_HEALTH_CHECKS': True,
     }
 }
+# How connections are managed:
+# - 'persistent': each worker thread keeps its connection for DB_CONN_MAX_AGE seconds (Gunicorn sync workers)
+# - 'pool': each process shares a psycopg pool of DB_POOL_MIN_SIZE to DB_POOL_MAX_SIZE connections; a request
+#   waits up to DB_POOL_TIMEOUT_SECONDS for one. Meant for ASGI, where every request has its own thread.
+# - 'none': a new connection per request, as before
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', 'pool' if SERVER_MODE == 'asgi' else 'persistent')
+if DB_CONNECTION_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', 60))
+elif DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT_SECONDS', 10)),
+        },
+    }
 AUTH_PASSWORD_VALIDATORS = [{'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'}, {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'}, {'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator'}, {'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator'}]
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -47,8 +64,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STORAGES = {"staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"}}
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-REST_FRAMEWORK = {'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',)}
-SIMPLE_JWT = {'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), 'REFRESH_TOKEN_LIFETIME': timedelta(days=1), 'ALGORITHM': 'HS256', 'SIGNING_KEY': SECRET_KEY, 'AUTH_HEADER_TYPES': ('Bearer',), 'USER_ID_FIELD': 'id', 'USER_ID_CLAIM': 'user_id'}
+REST_FRAMEWORK = {'DEFAULT_AUTHENTICATION_CLASSES': ('core.authentication.CachedJWTAuthentication',)}
+SIMPLE_JWT = {'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), 'REFRESH_TOKEN_LIFETIME': timedelta(days=1), 'ALGORITHM': 'HS256', 'SIGNING_KEY': SECRET_KEY, 'AUTH_HEADER_TYPES': ('Bearer',), 'USER_ID_FIELD': 'id', 'USER_ID_CLAIM': 'user_id', 'CHECK_REVOKE_TOKEN': True}
+# How long an authenticated user's principal is cached (see core/authentication.py): shared, and in each process.
+AUTH_PRINCIPAL_CACHE_SECONDS = int(os.getenv('AUTH_PRINCIPAL_CACHE_SECONDS', 300))
+AUTH_PRINCIPAL_LOCAL_SECONDS = float(os.getenv('AUTH_PRINCIPAL_LOCAL_SECONDS', 5))
 
 CORS_ALLOWED_ORIGINS = [os.getenv('FRONTEND_ORIGIN_URL', 'http://localhost:3000')]
 CORS_ALLOW_HEADERS = ['Authorization', 'Content-Type']
@@ -56,7 +76,109 @@ CORS_ALLOW_HEADERS = ['Authorization', 'Content-Type']
 PLAID_CLIENT_ID = os.getenv('PLAID_CLIENT_ID')
 PLAID_SANDBOX_SECRET = os.getenv('PLAID_SANDBOX_SECRET')
 PLAID_ENV = os.getenv('PLAID_ENV', 'sandbox')
-PLAID_PRODUCTS = [Products('transactions')]
-PLAID_COUNTRY_CODES = [CountryCode('US')]
+# Plain strings, as the API takes them; the plaid SDK is only imported once a client is needed.
+PLAID_PRODUCTS = ['transactions']
+PLAID_COUNTRY_CODES = ['US']
 
 # Configure Plaid client
+
+# Plaid webhooks (see core/webhooks.py). The public URL of /api/core/plaid-webhook/,
+# sent with new link tokens; leave unset to rely on periodic syncs only.
+PLAID_WEBHOOK_URL = os.getenv('PLAID_WEBHOOK_URL')
+PLAID_WEBHOOK_VERIFY = os.getenv('PLAID_WEBHOOK_VERIFY', str(PLAID_ENV != 'fake')).lower() == 'true'
+# Signing-key fetches for key ids not seen before, across all processes sharing the cache.
+PLAID_WEBHOOK_KEY_LOOKUPS_PER_MINUTE = float(os.getenv('PLAID_WEBHOOK_KEY_LOOKUPS_PER_MINUTE', 10))
+
+# Background transaction sync (see core/sync.py and `manage.py sync_transactions`)
+# With webhooks, Plaid says when there is something to sync, so the periodic
+# sync is only a daily safety net.
+SYNC_INTERVAL_SECONDS = int(os.getenv('SYNC_INTERVAL_SECONDS', 24 * 60 * 60 if PLAID_WEBHOOK_URL else 60 * 60))
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+SYNC_BACKOFF_BASE_SECONDS = int(os.getenv('SYNC_BACKOFF_BASE_SECONDS', 60))
+SYNC_BACKOFF_MAX_SECONDS = int(os.getenv('SYNC_BACKOFF_MAX_SECONDS', 6 * 60 * 60))
+SYNC_LEASE_SECONDS = int(os.getenv('SYNC_LEASE_SECONDS', 10 * 60))
+
+# How much history new items link with (Plaid's days_requested, at most 730),
+# and what `manage.py backfill_transactions` pages through (see core/backfill.py).
+TRANSACTIONS_HISTORY_DAYS = int(os.getenv('TRANSACTIONS_HISTORY_DAYS', 730))
+BACKFILL_PAGE_SIZE = int(os.getenv('BACKFILL_PAGE_SIZE', 500))
+
+# Concurrent Plaid fetches (see core/fetching.py)
+PLAID_MAX_CONCURRENCY = int(os.getenv('PLAID_MAX_CONCURRENCY', 8))
+PLAID_MAX_CONCURRENCY_PER_USER = int(os.getenv('PLAID_MAX_CONCURRENCY_PER_USER', 2))
+PLAID_ITEM_TIMEOUT_SECONDS = float(os.getenv('PLAID_ITEM_TIMEOUT_SECONDS', 30))
+
+# Shared Plaid client (see core/plaid_client.py)
+PLAID_HOST = os.getenv('PLAID_HOST')  # overrides the PLAID_ENV host, e.g. for a local stub server
+PLAID_POOL_MAXSIZE = int(os.getenv('PLAID_POOL_MAXSIZE', PLAID_MAX_CONCURRENCY))
+PLAID_CONNECT_TIMEOUT_SECONDS = float(os.getenv('PLAID_CONNECT_TIMEOUT_SECONDS', 5))
+PLAID_READ_TIMEOUT_SECONDS = float(os.getenv('PLAID_READ_TIMEOUT_SECONDS', 30))
+PLAID_MAX_RETRIES = int(os.getenv('PLAID_MAX_RETRIES', 3))
+PLAID_RETRY_BACKOFF_SECONDS = float(os.getenv('PLAID_RETRY_BACKOFF_SECONDS', 0.5))
+PLAID_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv('PLAID_RETRY_BACKOFF_MAX_SECONDS', 10))
+# Concurrent Plaid connections per ASGI worker (see core/async_plaid.py)
+PLAID_ASYNC_MAX_CONNECTIONS = int(os.getenv('PLAID_ASYNC_MAX_CONNECTIONS', 200))
+
+# Shared Plaid rate limiter (see core/rate_limits.py); a rate of 0 turns that bucket off
+PLAID_RATE_LIMIT_PER_MINUTE = float(os.getenv('PLAID_RATE_LIMIT_PER_MINUTE', 1000))
+PLAID_RATE_LIMIT_BURST = float(os.getenv('PLAID_RATE_LIMIT_BURST', 50))
+PLAID_ITEM_RATE_LIMIT_PER_MINUTE = float(os.getenv('PLAID_ITEM_RATE_LIMIT_PER_MINUTE', 50))
+PLAID_ITEM_RATE_LIMIT_BURST = float(os.getenv('PLAID_ITEM_RATE_LIMIT_BURST', 20))
+PLAID_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv('PLAID_RATE_LIMIT_MAX_WAIT_SECONDS', 10))
+
+# Transactions API pagination (see core/transaction_queries.py)
+TRANSACTIONS_PAGE_SIZE = int(os.getenv('TRANSACTIONS_PAGE_SIZE', 500))
+TRANSACTIONS_MAX_PAGE_SIZE = int(os.getenv('TRANSACTIONS_MAX_PAGE_SIZE', 1000))
+
+# Monthly transaction partitions and archives (see core/partitions.py). Only
+# used once `manage.py partition_transactions` has partitioned the table.
+TRANSACTION_PARTITION_MONTHS_AHEAD = int(os.getenv('TRANSACTION_PARTITION_MONTHS_AHEAD', 3))
+TRANSACTION_ARCHIVE_AFTER_MONTHS = int(os.getenv('TRANSACTION_ARCHIVE_AFTER_MONTHS', 24))
+TRANSACTION_ARCHIVE_DIR = os.getenv('TRANSACTION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
+# Transaction classifier (see core/classifier.py)
+CLASSIFY_ON_INGEST = os.getenv('CLASSIFY_ON_INGEST', 'True') == 'True'
+CLASSIFIER_RELOAD_CHECK_SECONDS = float(os.getenv('CLASSIFIER_RELOAD_CHECK_SECONDS', 5))
+CLASSIFIER_CACHE_MAX_ENTRIES = int(os.getenv('CLASSIFIER_CACHE_MAX_ENTRIES', 100000))
+# New memo cache entries a process adds before it checks the size again.
+CLASSIFIER_CACHE_EVICT_EVERY = int(os.getenv('CLASSIFIER_CACHE_EVICT_EVERY', 1000))
+
+# Per-user response cache (see core/response_cache.py)
+# Local memory unless REDIS_URL is set. The worker bumps users' data versions
+# in the cache, so production needs the shared Redis backend; with local
+# memory, other processes' changes show up within RESPONSE_CACHE_SECONDS.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# How long cached responses (and data versions) live. 0 disables response caching.
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', 300))
+
+# Request metrics and logging (see core/metrics.py)
+# Adds a Server-Timing header (total, database, Plaid and serialization time) to every response.
+SERVER_TIMING_HEADERS = os.getenv('SERVER_TIMING_HEADERS', str(DEBUG)) == 'True'
+# /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; without a token it is only served with DEBUG on.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# 'json' (one object per line) or 'text'.
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.structured_logging.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'root': {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'INFO')},
+}
@@ -1,15 +1,15 @@
 from django.contrib import admin
 from django.urls import path, include
+from core.views import metrics_view
 
 # Import the default views directly from the library
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
+from rest_framework_simplejwt.views import TokenRefreshView
+from core.views import MyTokenObtainPairView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/core/', include('core.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
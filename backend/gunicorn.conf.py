@@ -0,0 +1,22 @@
+# backend/gunicorn.conf.py
+# Gunicorn reads this file from the working directory on startup.
+import os
+
+# GUNICORN_PRELOAD=True loads and warms up the app once in the master before
+# forking (see core/warmup.py), so workers start ready and share that memory.
+# A HUP then no longer reloads the code; restart Gunicorn to deploy instead.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'False') == 'True'
+
+
+def when_ready(server):
+    # Runs in the master, after the app was preloaded and before any worker is forked.
+    if server.cfg.preload_app:
+        from core.warmup import warm_up
+        warm_up()
+
+
+def child_exit(server, worker):
+    # Drop an exited worker's gauges from /metrics (see core/metrics.py).
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -48,7 +48,7 @@ function DashboardPage({ onLogout }) {
     fetchProtectedData();
   }, []);
 
-  const fetchTransactions = useCallback(async () => {
+  const fetchTransactions = useCallback(async (refresh = false) => {
     setTransactionsState((prevState) => ({
       ...prevState,
       isLoading: true,
@@ -56,10 +56,18 @@ function DashboardPage({ onLogout }) {
       message: 'Fetching recent transactions...',
     }));
     try {
-      const url = `/core/transactions/?start_date=${dateRange.start}&end_date=${dateRange.end}`;
-      const response = await axiosInstance.get(url);
+      // refresh=1 asks the backend worker to pull new data from the bank; the response is what is stored now.
+      const url = `/core/transactions/?start_date=${dateRange.start}&end_date=${dateRange.end}${refresh ? '&refresh=1' : ''}`;
+      let response = await axiosInstance.get(url);
+      let transactions = response.data;
+      // The backend returns one page at a time; follow X-Next-Cursor until the range is complete.
+      while (response.headers['x-next-cursor']) {
+        const nextUrl = `/core/transactions/?start_date=${dateRange.start}&end_date=${dateRange.end}&cursor=${response.headers['x-next-cursor']}`;
+        response = await axiosInstance.get(nextUrl);
+        transactions = transactions.concat(response.data);
+      }
       setTransactionsState({
-        transactions: response.data, // Assuming backend returns the array directly now
+        transactions: transactions,
         isLoading: false,
         error: null,
         message: 'Transactions loaded successfully.',
@@ -79,32 +87,35 @@ function DashboardPage({ onLogout }) {
   }, [fetchTransactions]);
 
   useEffect(() => {
-    if (transactionsState.transactions.length > 0) {
-      const categories = {};
-      transactionsState.transactions.forEach(t => {
-        if (t.amount > 0) {
-          const primaryCategory = t.category ? t.category[0] : 'Other';
-          const amount = parseFloat(t.amount);
-          categories[primaryCategory] = (categories[primaryCategory] || 0) + amount;
+    if (transactionsState.transactions.length === 0) {
+      setChartData(null);
+      return;
+    }
+    // Spend per category comes precomputed from the backend's rollups instead of
+    // being summed over every transaction here.
+    const fetchSummary = async () => {
+      try {
+        const response = await axiosInstance.get(`/core/summary/?start_date=${dateRange.start}&end_date=${dateRange.end}`);
+        const categories = response.data.categories.filter(c => parseFloat(c.spend) > 0);
+        if (categories.length > 0) {
+          setChartData({
+            labels: categories.map(c => c.category),
+            datasets: [{
+              label: 'Spending by Category',
+              data: categories.map(c => parseFloat(c.spend)),
+              backgroundColor: ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40'],
+            }]
+          });
+        } else {
+          setChartData(null);
         }
-      });
-
-      if (Object.keys(categories).length > 0) {
-        setChartData({
-          labels: Object.keys(categories),
-          datasets: [{
-            label: 'Spending by Category',
-            data: Object.values(categories),
-            backgroundColor: ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40'],
-          }]
-        });
-      } else {
+      } catch (error) {
+        console.error('Error fetching spending summary:', error);
         setChartData(null);
       }
-    } else {
-      setChartData(null);
-    }
-  }, [transactionsState.transactions]);
+    };
+    fetchSummary();
+  }, [transactionsState.transactions, dateRange]);
   
   const handlePlaidLinkSuccess = async (metadata, public_token) => {
     setTransactionsState((prevState) => ({
@@ -168,7 +179,7 @@ function DashboardPage({ onLogout }) {
           <label htmlFor="end-date" style={{ marginRight: '5px' }}>End Date:</label>
           <input type="date" id="end-date" name="end" value={dateRange.end} onChange={handleDateChange} />
         </div>
-        <button onClick={fetchTransactions} disabled={transactionsState.isLoading}>
+        <button onClick={() => fetchTransactions(true)} disabled={transactionsState.isLoading}>
           {transactionsState.isLoading ? 'Loading...' : 'Refresh Transactions'}
         </button>
       </div>